@@ -0,0 +1,50 @@
+import datetime
+
+from telegram import Bot, Update
+
+# getUpdates returns at most this many updates per call
+BATCH_SIZE = 100
+
+
+async def backlog_batches(bot: Bot):
+    """
+    Yield the updates Telegram queued while the bot was down, in batches
+
+    Asking for the next offset confirms the previous batch, and the next
+    batch is only asked for once the caller is done with this one: a bot
+    stopped halfway gets the rest, the unfinished batch included, again.
+    After the last batch everything is confirmed, so regular polling (or the
+    webhook) starts with fresh updates only. Needs the webhook removed.
+    """
+    offset = None
+    while True:
+        batch = await bot.get_updates(
+            offset=offset,
+            limit=BATCH_SIZE,
+            timeout=0,
+            allowed_updates=Update.ALL_TYPES,
+        )
+        if not batch:
+            return
+        yield batch
+        offset = batch[-1].update_id + 1
+
+
+def is_stale(update: Update, max_age: float, now: datetime.datetime) -> bool:
+    """
+    A message older than max_age seconds
+
+    Button presses are never stale: the message they're attached to may be
+    old, the press itself isn't.
+    """
+    if update.callback_query is not None or update.effective_message is None:
+        return False
+    age = now - update.effective_message.date
+    return age.total_seconds() > max_age
+
+
+def split_backlog(updates: list, max_age: float) -> tuple:
+    """(updates to process, number dropped as stale)"""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    fresh = [update for update in updates if not is_stale(update, max_age, now)]
+    return fresh, len(updates) - len(fresh)
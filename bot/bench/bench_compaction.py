@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Benchmark: loading bot_gen content as loose files vs compacted shards
+
+Generates a synthetic corpus (default 50k thoughts over ~4 years), then
+times what the site build has to do to read it: walk + parse every loose
+file, versus reading the monthly shards written by compact.py. Then checks
+that a run dying between writing a shard and unlinking its loose files can
+simply be run again: no entry shows up twice.
+
+    python bench/bench_compaction.py [--entries 50000]
+"""
+
+import argparse
+import datetime
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from compact import (
+    MONTH_DIR,
+    SHARDS_DIR,
+    compact_collection,
+    read_shard,
+    shard_path,
+)
+
+
+def make_corpus(collection_dir: Path, n: int) -> int:
+    start = datetime.datetime(2021, 1, 1)
+    for i in range(n):
+        t = (start + datetime.timedelta(minutes=40 * i)).isoformat()[:19] + "Z"
+        month_dir = collection_dir / t[:7]
+        month_dir.mkdir(exist_ok=True)
+        with open(month_dir / f"{t}.json", "w") as f:
+            json.dump(
+                {
+                    "author": f"author {i % 6}",
+                    "css_class": "pp",
+                    "datetime": t,
+                    "content": f"thought number {i} " * 4,
+                },
+                f,
+                indent=4,
+            )
+    return n
+
+
+def load_loose(collection_dir: Path) -> int:
+    count = 0
+    for month_dir in collection_dir.iterdir():
+        if not MONTH_DIR.match(month_dir.name):
+            continue
+        for path in month_dir.glob("*.json"):
+            with open(path) as f:
+                json.load(f)
+            count += 1
+    return count
+
+
+def load_shards(collection_dir: Path) -> int:
+    return sum(
+        len(read_shard(path)) for path in (collection_dir / SHARDS_DIR).glob("*.jsonl")
+    ) + load_loose(collection_dir)
+
+
+def check_rerun(collection_dir: Path, entries: int):
+    """Compact again as if the last run died before unlinking a month's files"""
+    month = "2021-03"
+    before = read_shard(shard_path(collection_dir, month))
+    # the crash: the shard is written, the loose files are still there
+    (collection_dir / month).mkdir()
+    for entry in before:
+        stem = entry["id"].split("/", 1)[1]
+        with open(collection_dir / month / f"{stem}.json", "w") as f:
+            json.dump(entry["data"], f, indent=4)
+    compact_collection(collection_dir, "9999-99")
+    after = read_shard(shard_path(collection_dir, month))
+    assert after == before, f"{len(after) - len(before)} entries duplicated"
+    assert load_shards(collection_dir) == entries
+    print(f"rerun after a crash: {month} still has {len(after)} entries, no copies")
+
+
+def timed(name: str, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    print(f"{name:<24} {(time.perf_counter() - start) * 1e3:9.1f} ms  ({result})")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=50000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        collection_dir = Path(tmp) / "thoughts"
+        collection_dir.mkdir()
+        timed("generate corpus", make_corpus, collection_dir, args.entries)
+        print()
+
+        timed("load loose files", load_loose, collection_dir)
+        months = timed(
+            "compact", lambda: len(compact_collection(collection_dir, "9999-99"))
+        )
+        print(f"{'':<24} {months} shards")
+        timed("load shards", load_shards, collection_dir)
+        print()
+        check_rerun(collection_dir, args.entries)
+
+
+if __name__ == "__main__":
+    main()
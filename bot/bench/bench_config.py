@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: per-update config lookup cost
+
+Compares the old "open and parse config.json on every update" approach with
+ConfigStore.load(), which only stats the file and reuses the parsed dict.
+
+    python bench/bench_config.py [--chats 50] [--iterations 20000]
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config_store import ConfigStore
+
+
+def make_config(n_chats: int) -> dict:
+    return {
+        str(-1000000000 - i): {
+            "chat_name": f"chat {i}",
+            "type": "private" if i % 2 else "group",
+            "css_class": "pp",
+            "thoughts_author": f"author {i}",
+        }
+        for i in range(n_chats)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "config.json"
+        config = make_config(args.chats)
+        with open(path, "w") as f:
+            json.dump(config, f, indent=4)
+        chat_id = next(iter(config))
+
+        def old_lookup():
+            with open(path) as f:
+                return chat_id in json.load(f)
+
+        store = ConfigStore(path)
+
+        def new_lookup():
+            return chat_id in store.load()
+
+        for name, fn in (
+            ("load_config()", old_lookup),
+            ("ConfigStore.load()", new_lookup),
+        ):
+            seconds = min(timeit.repeat(fn, number=args.iterations, repeat=5))
+            print(f"{name:<20} {seconds / args.iterations * 1e6:8.2f} us/lookup")
+        print(f"ConfigStore reloads: {store.reloads}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Checks and benchmark for /edit and /delete (entry_index.py + the operations
+in bot_gen_writer.py)
+
+Writes a synthetic archive of thoughts like the workflow would, arriving in
+bursts within the same second, records each in an EntryIndex under fake
+Telegram messages and compacts the older months. Then:
+
+  1. checks every entry got its own file, named as the index predicted
+  2. times building the index from src/bot_gen/ and resolving messages
+  3. edits and deletes loose and compacted entries (a photo thought too),
+     repeats them like a second outbox delivery, edits one by hand first,
+     and checks what ended up on disk; the index only takes an edit or
+     delete once it is confirmed delivered
+  4. checks GitDataBackend builds the same changes as the workflow
+
+Everything runs offline in a temporary directory.
+
+    python bench/bench_entry_index.py [--entries 2000] [--burst 5]
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bot_gen_writer import (
+    DELETE_ACTION,
+    EDIT_ACTION,
+    apply_operation,
+    entry_text,
+    git_blob_sha,
+    operation_paths,
+    write_entry,
+)
+from compact import SHARDS_DIR, compact_collection, read_manifest, read_shard
+from entry_index import EntryIndex
+from github_client import GitHubClient
+from storage import CONTENT_ROOT, GitDataBackend
+
+CHAT = 2000
+
+
+def make_archive(root: Path, index: EntryIndex, entries: int, burst: int) -> dict:
+    """Write thoughts, `burst` per second, returns {message_id: target}"""
+    start = datetime.datetime(2025, 1, 1)
+    targets = {}
+    for n in range(entries):
+        when = start + datetime.timedelta(hours=6 * (n // burst))
+        payload = {
+            "author": "bench",
+            "css_class": "default",
+            "datetime": when.isoformat()[:19],
+            "content": f"thought number {n}",
+            "dispatch_id": uuid.uuid4().hex,
+        }
+        if n == 0:
+            # a photo thought, its variants live next to it
+            stem = f"{payload['datetime']}Z-photo"
+            payload["image"] = {
+                key: f"thoughts/{payload['datetime'][:7]}/{stem}{suffix}"
+                for key, suffix in (
+                    ("webp", ".webp"),
+                    ("avif", ".avif"),
+                    ("thumb", "-thumb.webp"),
+                )
+            }
+            for path in payload["image"].values():
+                (root / path).parent.mkdir(parents=True, exist_ok=True)
+                (root / path).write_bytes(b"image")
+        dispatch_id = payload.pop("dispatch_id")
+        target = index.record("add_thought", payload, dispatch_id, [(CHAT, n)])
+        path = write_entry("add_thought", {**payload, "dispatch_id": dispatch_id}, root)
+        assert f"{path.relative_to(root)}" == f"{target}.json", (path, target)
+        targets[n] = target
+    return targets
+
+
+def changed_files(root: Path) -> dict:
+    """{path relative to root: text} of every file"""
+    return {
+        str(path.relative_to(root)): path.read_bytes().decode(errors="replace")
+        for path in root.rglob("*")
+        if path.is_file()
+    }
+
+
+async def git_data_changes(root: Path, ops: list) -> dict:
+    """What GitDataBackend would commit for `ops` against the files in root"""
+    backend = GitDataBackend(GitHubClient("token", "bench/site"))
+
+    async def read_file(path: str, ref: str):
+        path = root / path.removeprefix(f"{CONTENT_ROOT}/")
+        return path.read_text() if path.exists() else None
+
+    backend._read_file = read_file
+    return await backend._operation_changes(ops, "head", {})
+
+
+def check_operations(root: Path, index: EntryIndex, targets: dict, rng):
+    months = sorted({target.split("/")[1] for target in targets.values()})
+    current = months[-1]
+    loose = [n for n, t in targets.items() if t.split("/")[1] == current]
+    compacted = [n for n, t in targets.items() if t.split("/")[1] != current and n]
+    ops = []
+
+    def deliver(n, op: dict, fields: dict = None):
+        entry = index.find(CHAT, n)
+        op_id = uuid.uuid4().hex
+        ops.append(op)
+        index.hold(op_id, entry, fields)
+        # nothing changes in the index until the dispatch went through
+        held = index.find(CHAT, n)
+        assert held["operations"] == [op_id] and held["sha"] == entry["sha"]
+        assert not held["deleted"]
+        assert index.confirm(op_id)["sha"] == entry["sha"]
+        assert not index.find(CHAT, n)["operations"]
+
+    def edit(n, text):
+        entry = index.find(CHAT, n)
+        fields = {"content": text}
+        deliver(n, {"action": EDIT_ACTION, **index.edit(entry, fields)}, fields)
+
+    def delete(n):
+        entry = index.find(CHAT, n)
+        deliver(n, {"action": DELETE_ACTION, **index.delete(entry)})
+
+    edit_loose, edit_twice, delete_loose = rng.sample(loose, 3)
+    edit_compacted, delete_compacted, by_hand = rng.sample(compacted, 3)
+    edit(edit_loose, "edited")
+    edit(edit_twice, "first edit")
+    edit(edit_twice, "second edit")
+    delete(delete_loose)
+    edit(edit_compacted, "edited, compacted")
+    delete(delete_compacted)
+    delete(0)  # the photo thought
+
+    # changed by hand after the bot saw it: the edit must leave it alone
+    month = targets[by_hand].split("/")[1]
+    shard = root / "thoughts" / SHARDS_DIR / f"{month}.jsonl"
+    lines = shard.read_text().replace(f'thought number {by_hand}"', 'fixed by hand"')
+    shard.write_text(lines)
+    edit(by_hand, "edited by the bot")
+
+    before = changed_files(root)
+    expected_tree = asyncio.run(git_data_changes(root, ops))
+    start = time.perf_counter()
+    for op in ops:
+        apply_operation(op, root)
+    elapsed = time.perf_counter() - start
+    after = changed_files(root)
+    workflow = {
+        path: after.get(path)
+        for path in before.keys() | after.keys()
+        if before.get(path) != after.get(path)
+    }
+    print(
+        f"{len(ops)} operations applied in {elapsed * 1e3:.1f} ms, "
+        f"{len(workflow)} files changed"
+    )
+    assert workflow == expected_tree, sorted(workflow.keys() ^ expected_tree.keys())
+    print("GitDataBackend builds the same changes")
+
+    def content(n):
+        target = targets[n]
+        path = root / f"{target}.json"
+        if path.exists():
+            return json.loads(path.read_text())["content"]
+        entry_id = target.split("/", 1)[1]
+        shard = root / "thoughts" / SHARDS_DIR / f"{entry_id[:7]}.jsonl"
+        found = [e["data"] for e in read_shard(shard) if e["id"] == entry_id]
+        return found[0]["content"] if found else None
+
+    assert content(edit_loose) == "edited"
+    assert content(edit_twice) == "second edit"
+    assert content(edit_compacted) == "edited, compacted"
+    assert content(delete_loose) is None and content(delete_compacted) is None
+    assert content(0) is None
+    assert not list(root.rglob("*photo*")), "photo variants left behind"
+    assert content(by_hand) == "fixed by hand"
+    for n in (edit_loose, edit_twice, edit_compacted):
+        entry = index.find(CHAT, n)
+        path = root / f"{entry['target']}.json"
+        text = (
+            path.read_text()
+            if path.exists()
+            else entry_text(
+                next(
+                    e["data"]
+                    for e in read_shard(root / operation_paths(entry["target"])[1])
+                    if e["id"] == entry["target"].split("/", 1)[1]
+                )
+            )
+        )
+        assert git_blob_sha(text) == entry["sha"], "index out of step with the repo"
+    manifest = read_manifest(root / "thoughts")
+    for month, record in manifest.items():
+        shard = root / "thoughts" / SHARDS_DIR / f"{month}.jsonl"
+        assert record["count"] == len(read_shard(shard)), f"manifest of {month}"
+
+    # a second delivery of the same operations changes nothing
+    for op in ops:
+        assert not apply_operation(op, root), f"{op['action']} applied twice"
+    assert changed_files(root) == after
+    print("edits, deletes, repeats and the hand-edited entry check out")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=2000)
+    parser.add_argument("--burst", type=int, default=5, help="entries per second")
+    args = parser.parse_args()
+    rng = random.Random(1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp, "bot_gen")
+        index = EntryIndex(Path(tmp, "entries.sqlite3"), root)
+        start = time.perf_counter()
+        targets = make_archive(root, index, args.entries, args.burst)
+        files = list(root.glob("thoughts/*/*.json"))
+        print(
+            f"{args.entries} thoughts, {args.burst} per second, written and "
+            f"recorded in {time.perf_counter() - start:.1f}s: {len(files)} files, "
+            "each named as predicted"
+        )
+        assert len(files) == args.entries
+
+        months = sorted({t.split("/")[1] for t in targets.values()})
+        compact_collection(root / "thoughts", months[-1])
+        print(f"compacted {len(months) - 1} of {len(months)} months")
+
+        # a fresh index from the archive: every entry, by dispatch_id
+        start = time.perf_counter()
+        scanned = EntryIndex(Path(tmp, "scanned.sqlite3"), root)
+        print(
+            f"index built from src/bot_gen/ in {time.perf_counter() - start:.2f}s: "
+            f"{len(scanned)} entries"
+        )
+        assert len(scanned) == args.entries
+        recorded = {
+            row["dispatch_id"]: (row["target"], row["sha"])
+            for row in index.db.execute("SELECT * FROM entries")
+        }
+        built = {
+            row["dispatch_id"]: (row["target"], row["sha"])
+            for row in scanned.db.execute("SELECT * FROM entries")
+        }
+        assert recorded == built, "recorded targets/hashes differ from the archive"
+        print("recorded targets and hashes match the archive")
+        scanned.close()
+
+        lookups = [rng.randrange(args.entries) for _ in range(10000)]
+        start = time.perf_counter()
+        for message_id in lookups:
+            assert index.find(CHAT, message_id) is not None
+        per_lookup = (time.perf_counter() - start) / len(lookups)
+        print(f"message -> entry: {per_lookup * 1e6:.1f} us per lookup")
+
+        check_operations(root, index, targets, rng)
+        index.close()
+    print("all checks passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""
+Checks for GitDataBackend (storage.py) against a local stand-in GitHub API
+
+The stand-in keeps a repository in memory and answers the calls the backend
+makes: the branch ref, commits, trees (with base_tree), blobs, the contents
+API, and a ref update that is refused with 422 unless it fast-forwards.
+Then:
+
+  1. a batch of thoughts and links (same-second ones, a photo with its
+     media) lands in one commit, file for file what bot_gen_writer.py
+     writes for the same entries
+  2. when someone else pushes between the backend's commit and its ref
+     update, the 422 is retried on the new head and nothing is lost
+  3. a repeated delivery of the batch commits nothing: while the files are
+     loose, after one was edited, and after the month was compacted; a new
+     entry named like a compacted one gets the next free name
+  4. an edit and a delete in the same batch as the entries they change
+     apply to what the batch adds
+
+and prints how many API calls a save takes. Everything runs offline.
+
+    python bench/bench_git_data.py [--entries 20]
+"""
+
+import argparse
+import asyncio
+import base64
+import datetime
+import hashlib
+import json
+import logging
+import sys
+import tempfile
+import uuid
+from collections import Counter
+from pathlib import Path
+
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bot_gen_writer import (
+    DELETE_ACTION,
+    EDIT_ACTION,
+    git_blob_sha,
+    render_entry,
+    write_entry,
+)
+from compact import SHARDS_DIR, compact_collection
+from github_client import GitHubClient
+from storage import CONTENT_ROOT, GitDataBackend
+
+REPO = "bench/site"
+BRANCH = "main"
+
+
+def blob_sha(data: bytes) -> str:
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def object_sha(value) -> str:
+    return hashlib.sha1(json.dumps(value, sort_keys=True).encode()).hexdigest()
+
+
+class FakeGitHub:
+    """An in-memory repository; trees are flat {path: blob sha} dicts"""
+
+    def __init__(self):
+        self.blobs = {}
+        self.trees = {}
+        self.commits = {}
+        self.calls = Counter()
+        # commit someone else's file right before the next ref update
+        self.foreign_push = None
+        self.head = self.commit({}, [], "Initial commit")
+
+    def commit(self, files: dict, parents: list, message: str) -> str:
+        tree_sha = object_sha(files)
+        self.trees[tree_sha] = files
+        commit = {"tree": tree_sha, "parents": parents, "message": message}
+        sha = object_sha(commit)
+        self.commits[sha] = commit
+        return sha
+
+    def add_blob(self, data: bytes) -> str:
+        sha = blob_sha(data)
+        self.blobs[sha] = data
+        return sha
+
+    def files(self, ref: str = None) -> dict:
+        """{path: bytes} at ref (the branch head by default)"""
+        tree = self.trees[self.commits[ref or self.head]["tree"]]
+        return {path: self.blobs[sha] for path, sha in tree.items()}
+
+    def push(self, files: dict, message: str):
+        """Commit {path: bytes or None to delete} on top of the head"""
+        tree = dict(self.trees[self.commits[self.head]["tree"]])
+        for path, data in files.items():
+            if data is None:
+                tree.pop(path, None)
+            else:
+                tree[path] = self.add_blob(data)
+        self.head = self.commit(tree, [self.head], message)
+
+    @web.middleware
+    async def count(self, request, handler):
+        route = request.match_info.route.resource.canonical
+        self.calls[f"{request.method} {route.split('/', 4)[-1]}"] += 1
+        return await handler(request)
+
+    async def get_ref(self, request):
+        return web.json_response({"object": {"sha": self.head, "type": "commit"}})
+
+    async def get_commit(self, request):
+        commit = self.commits.get(request.match_info["sha"])
+        if commit is None:
+            return web.json_response({"message": "Not Found"}, status=404)
+        return web.json_response(
+            {"sha": request.match_info["sha"], "tree": {"sha": commit["tree"]}}
+        )
+
+    async def get_contents(self, request):
+        path = request.match_info["path"]
+        tree = self.trees[self.commits[request.query["ref"]]["tree"]]
+        if path in tree:
+            content = base64.b64encode(self.blobs[tree[path]]).decode()
+            return web.json_response(
+                {
+                    "type": "file",
+                    "name": path.rsplit("/", 1)[-1],
+                    "sha": tree[path],
+                    "encoding": "base64",
+                    "content": content,
+                }
+            )
+        children = {}
+        for name, sha in tree.items():
+            if name.startswith(f"{path}/"):
+                child, *rest = name.removeprefix(f"{path}/").split("/", 1)
+                children[child] = {
+                    "type": "dir" if rest else "file",
+                    "name": child,
+                    "sha": sha,
+                }
+        if not children:
+            return web.json_response({"message": "Not Found"}, status=404)
+        return web.json_response(list(children.values()))
+
+    async def post_blob(self, request):
+        body = await request.json()
+        assert body["encoding"] == "base64"
+        sha = self.add_blob(base64.b64decode(body["content"]))
+        return web.json_response({"sha": sha}, status=201)
+
+    async def post_tree(self, request):
+        body = await request.json()
+        tree = dict(self.trees[body["base_tree"]])
+        for item in body["tree"]:
+            assert item["mode"] == "100644" and item["type"] == "blob", item
+            if "content" in item:
+                tree[item["path"]] = self.add_blob(item["content"].encode())
+            elif item["sha"] is None:
+                if item["path"] not in tree:
+                    return web.json_response(
+                        {"message": f"{item['path']} not in base tree"}, status=422
+                    )
+                del tree[item["path"]]
+            else:
+                assert item["sha"] in self.blobs, f"unknown blob {item['sha']}"
+                tree[item["path"]] = item["sha"]
+        sha = object_sha(tree)
+        self.trees[sha] = tree
+        return web.json_response({"sha": sha}, status=201)
+
+    async def post_commit(self, request):
+        body = await request.json()
+        sha = self.commit(self.trees[body["tree"]], body["parents"], body["message"])
+        self.commits[sha]["author"] = body["author"]
+        return web.json_response({"sha": sha}, status=201)
+
+    async def patch_ref(self, request):
+        body = await request.json()
+        if self.foreign_push is not None:
+            self.push(self.foreign_push, "Someone else's commit")
+            self.foreign_push = None
+        if not body["force"] and self.commits[body["sha"]]["parents"] != [self.head]:
+            return web.json_response(
+                {"message": "Update is not a fast forward"}, status=422
+            )
+        self.head = body["sha"]
+        return web.json_response({"object": {"sha": self.head}})
+
+
+async def start_fake(fake: FakeGitHub):
+    app = web.Application(middlewares=[fake.count])
+    repo = "/repos/{owner}/{repo}"
+    app.router.add_get(f"{repo}/git/ref/heads/{{branch}}", fake.get_ref)
+    app.router.add_get(f"{repo}/git/commits/{{sha}}", fake.get_commit)
+    app.router.add_get(f"{repo}/contents/{{path:.*}}", fake.get_contents)
+    app.router.add_post(f"{repo}/git/blobs", fake.post_blob)
+    app.router.add_post(f"{repo}/git/trees", fake.post_tree)
+    app.router.add_post(f"{repo}/git/commits", fake.post_commit)
+    app.router.add_patch(f"{repo}/git/refs/heads/{{branch}}", fake.patch_ref)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def make_entries(count: int, media_root: Path) -> list:
+    """Thoughts and links in bursts of the same second, a photo thought first"""
+    start = datetime.datetime(2025, 3, 7, 19, 27, 46)
+    entries = []
+    for n in range(count):
+        when = (start + datetime.timedelta(seconds=n // 3)).isoformat()
+        if n % 4 == 3:
+            entry = {
+                "action": "add_press",
+                "url": f"https://example.com/{n}",
+                "datetime": when,
+                "title": f"Link {n}",
+                "description": None,
+                "image": None,
+            }
+        else:
+            entry = {
+                "action": "add_thought",
+                "author": "bench",
+                "css_class": "default",
+                "datetime": when,
+                "content": f"thought number {n}",
+            }
+        entry["dispatch_id"] = uuid.uuid4().hex
+        entries.append(entry)
+
+    photo = entries[0]
+    photo["image"] = {"webp": f"thoughts/2025-03/{photo['dispatch_id']}.webp"}
+    photo["media"] = [photo["image"]["webp"]]
+    (media_root / "thoughts/2025-03").mkdir(parents=True)
+    (media_root / photo["media"][0]).write_bytes(b"RIFF\0\0\0\0WEBPVP8 photo")
+    # two entries of the same second without a dispatch_id, like old clients
+    for n in (1, 2):
+        del entries[n]["dispatch_id"]
+        entries[n]["datetime"] = entries[0]["datetime"]
+    return entries
+
+
+def workflow_files(entries: list, root: Path) -> dict:
+    """{path: bytes} of the entries written by bot_gen_writer.py"""
+    for entry in entries:
+        payload = {k: v for k, v in entry.items() if k not in ("action", "media")}
+        write_entry(entry["action"], payload, root)
+    return {
+        f"{CONTENT_ROOT}/{path.relative_to(root)}": path.read_bytes()
+        for path in root.rglob("*.json")
+    }
+
+
+async def check_commit(backend, fake: FakeGitHub, entries: list, tmp: Path):
+    fake.calls.clear()
+    assert await backend.save(entries)
+    commit = fake.commits[fake.head]
+    assert commit["message"] == f"Bot: Add {len(entries)} new entries", commit
+    assert commit["author"]["name"] == "thoughts_bot"
+    files = fake.files()
+    media = entries[0]["media"][0]
+    assert files.pop(f"{CONTENT_ROOT}/{media}") == (tmp / "media" / media).read_bytes()
+    assert files == workflow_files(entries, tmp / "workflow"), "files differ"
+    calls = sum(fake.calls.values())
+    print(f"{len(entries)} entries in one commit like the workflow's, {calls} calls")
+
+
+async def check_retry(backend, fake: FakeGitHub):
+    entry = {
+        "action": "add_thought",
+        "author": "bench",
+        "css_class": "default",
+        "datetime": "2025-04-01T08:00:00",
+        "content": "written while someone pushed",
+        "dispatch_id": uuid.uuid4().hex,
+    }
+    fake.foreign_push = {"README.md": b"someone else's change\n"}
+    fake.calls.clear()
+    before = fake.head
+    assert await backend.save([entry])
+    assert fake.calls["PATCH git/refs/heads/{branch}"] == 2, fake.calls
+    files = fake.files()
+    assert files["README.md"] == b"someone else's change\n", "foreign push lost"
+    assert any(b"written while someone pushed" in data for data in files.values())
+    # linear history: ours on top of theirs on top of the old head
+    theirs = fake.commits[fake.head]["parents"][0]
+    assert fake.commits[theirs]["parents"] == [before]
+    print("ref update refused once (422): retried on the new head, both kept")
+
+
+async def check_repeats(backend, fake: FakeGitHub, entries: list, tmp: Path):
+    head = fake.head
+    assert await backend.save(entries) and fake.head == head, "loose repeat"
+
+    # an /edit since: the file no longer has the blob the repeat renders
+    edited = next(
+        path
+        for path, data in fake.files().items()
+        if path.endswith(".json")
+        and json.loads(data).get("dispatch_id") == entries[4]["dispatch_id"]
+    )
+    text = fake.files()[edited].replace(b"thought number", b"edited thought")
+    assert text != fake.files()[edited]
+    fake.push({edited: text}, "Edit")
+    head = fake.head
+    assert await backend.save(entries) and fake.head == head, "edited repeat"
+
+    # compact.py moved the month into its shard
+    checkout = tmp / "checkout"
+    for path, data in fake.files().items():
+        (checkout / path).parent.mkdir(parents=True, exist_ok=True)
+        (checkout / path).write_bytes(data)
+    content = checkout / CONTENT_ROOT
+    for collection in ("thoughts", "selected_press"):
+        compact_collection(content / collection, "2025-04")
+    compacted = {
+        str(path.relative_to(checkout)): path.read_bytes()
+        for path in content.rglob("*")
+        if path.is_file()
+    }
+    removed = {path: None for path in fake.files() if path not in compacted}
+    fake.push({**compacted, **removed}, "Compact")
+    assert not any("/2025-03/" in path for path in fake.files() if ".json" in path)
+    head = fake.head
+    assert await backend.save(entries) and fake.head == head, "compacted repeat"
+
+    # a new entry with the stem of a compacted one doesn't take its name
+    twin = dict(entries[5])
+    twin["dispatch_id"] = twin["dispatch_id"][:8] + uuid.uuid4().hex[8:]
+    twin["content"] = "same second, same id prefix"
+    assert await backend.save([twin]) and fake.head != head
+    shard = fake.files()[f"{CONTENT_ROOT}/thoughts/{SHARDS_DIR}/2025-03.jsonl"]
+    taken = {json.loads(line)["id"] for line in shard.splitlines()}
+    month = f"{CONTENT_ROOT}/thoughts/2025-03/"
+    added = [p for p in fake.files() if p.startswith(month) and p.endswith(".json")]
+    assert len(added) == 1 and added[0].endswith("-1.json"), added
+    assert f"2025-03/{Path(added[0]).stem[:-2]}" in taken
+    print("repeats skipped while loose, after an edit and after compaction")
+
+
+async def check_same_batch(backend, fake: FakeGitHub):
+    batch = []
+    for name, op in (("kept", EDIT_ACTION), ("gone", DELETE_ACTION)):
+        payload = {
+            "author": "bench",
+            "css_class": "default",
+            "datetime": "2025-04-02T09:00:00",
+            "content": f"{name} thought",
+            "dispatch_id": uuid.uuid4().hex,
+        }
+        folder, stem, text = render_entry("add_thought", payload)
+        batch.append({"action": "add_thought", **payload})
+        batch.append({"action": op, "target": f"{folder}/{stem}"})
+        batch[-1]["sha"] = git_blob_sha(text)
+        if op == EDIT_ACTION:
+            batch[-1]["fields"] = {"content": "edited in the same batch"}
+    head = fake.head
+    assert await backend.save(batch) and fake.head != head
+    month = [
+        json.loads(data)
+        for path, data in fake.files().items()
+        if path.startswith(f"{CONTENT_ROOT}/thoughts/2025-04/")
+    ]
+    written = [e["content"] for e in month if e["datetime"].startswith("2025-04-02")]
+    assert written == ["edited in the same batch"], written
+    print("edit and delete of entries added in the same batch: applied")
+
+
+async def main_async(args):
+    logging.basicConfig(level=logging.CRITICAL)
+    fake = FakeGitHub()
+    runner, url = await start_fake(fake)
+    client = GitHubClient("token", REPO, api_url=url)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            entries = make_entries(args.entries, tmp / "media")
+            backend = GitDataBackend(client, BRANCH, media_root=tmp / "media")
+            await check_commit(backend, fake, entries, tmp)
+            await check_retry(backend, fake)
+            await check_repeats(backend, fake, entries, tmp)
+            await check_same_batch(backend, fake)
+    finally:
+        await client.close()
+        await runner.cleanup()
+    print("all checks passed")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=20)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,535 @@
+#!/usr/bin/env python3
+"""
+Load generator and latency benchmark for ThoughtsBotHandler
+
+Builds the real Application with a fake Telegram transport (every Bot API
+call is answered locally) and a local stand-in for the GitHub API and for
+the pages behind shared links, then replays Update streams through
+`Application.process_update`:
+
+- private chats going through the whole thought conversation
+- group messages with several links each
+- the admin approving all resulting links in a burst
+
+With --backlog, getUpdates first returns that many group messages queued
+"while the bot was down" (links repeating, some messages days old) to
+measure the startup catch-up, checking it runs once the application is
+started and confirms no update to Telegram before it was handled.
+
+Or replays recorded updates (one Update JSON per line) with --replay.
+Reports throughput and p50/p95/p99 latency per update kind; --json writes
+the same numbers to a file so runs can be compared between commits.
+Everything runs offline in a temporary directory.
+
+    python bench/bench_handlers.py [--users 50] [--groups 20] [--messages 10]
+                                   [--concurrency 16] [--digest-window 5]
+                                   [--backlog 1000]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+from telegram.request import BaseRequest
+
+BOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BOT_DIR))
+
+from quota import LIMITS
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+ADMIN_ID = 1000
+FIRST_PRIVATE_CHAT = 2000
+FIRST_GROUP_CHAT = -3000
+LINKS_PER_MESSAGE = 3
+# every this many backlog messages one is older than the catch-up max age
+STALE_EVERY = 5
+CATCHUP_MAX_AGE = 24 * 3600  # the bot's default
+
+
+class FakeTelegramRequest(BaseRequest):
+    """Answers every Bot API call locally, counting calls per method"""
+
+    def __init__(self, backlog: list = ()):
+        self.calls = Counter()
+        self.message_id = 0
+        self.digests = []  # keyboards of link digests sent to the admin
+        self.backlog = list(backlog)  # served by getUpdates
+        self.processed = set()  # backlog update ids handled so far
+        # fresh backlog updates confirmed (offset past them) before handled
+        self.confirmed_early = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        endpoint = url.rsplit("/", 1)[1]
+        self.calls[endpoint] += 1
+        params = request_data.parameters if request_data else {}
+
+        if endpoint == "getMe":
+            result = BOT_USER
+        elif endpoint == "getUpdates":
+            offset = int(params.get("offset") or 0)
+            limit = int(params.get("limit", 100))
+            self.confirmed_early += sum(
+                1
+                for u in self.backlog
+                if u["update_id"] < offset
+                and u["update_id"] not in self.processed
+                and u["message"]["date"] > time.time() - CATCHUP_MAX_AGE
+            )
+            result = [u for u in self.backlog if u["update_id"] >= offset][:limit]
+        elif endpoint in ("sendMessage", "editMessageText"):
+            self.message_id += 1
+            markup = params.get("reply_markup")
+            if endpoint == "sendMessage" and "digest_approve" in json.dumps(markup):
+                self.digests.append(markup)
+            chat_id = int(params.get("chat_id", ADMIN_ID))
+            result = {
+                "message_id": params.get("message_id", self.message_id),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group"},
+                "from": BOT_USER,
+                "text": params.get("text", ""),
+            }
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+async def start_stand_in(github_latency: float):
+    """Local GitHub API + link target pages, returns (runner, base url, stats)"""
+    stats = Counter()
+
+    async def dispatches(request):
+        await request.read()
+        stats["dispatches"] += 1
+        await asyncio.sleep(github_latency)
+        return web.Response(status=204)
+
+    async def article(request):
+        stats["pages"] += 1
+        n = request.match_info["n"]
+        return web.Response(
+            content_type="text/html",
+            text=(
+                f"<html><head><title>Article {n}</title>"
+                f'<meta name="description" content="Synthetic article {n}">'
+                f"</head><body>{'lorem ipsum ' * 500}</body></html>"
+            ),
+        )
+
+    app = web.Application()
+    app.router.add_post("/repos/{owner}/{repo}/dispatches", dispatches)
+    app.router.add_get("/article/{n}", article)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}", stats
+
+
+def prepare_workdir(
+    tmp: Path, api_url: str, users: int, groups: int, digest_window: float
+) -> Path:
+    """Lay out bot/ + src/bot_gen/ like a checkout and write the json configs"""
+    workdir = tmp / "bot"
+    workdir.mkdir()
+    for collection in ("thoughts", "selected_press"):
+        (tmp / "src" / "bot_gen" / collection).mkdir(parents=True)
+
+    credentials = {
+        "bot_token": "123456:BENCH",
+        "admin_chat_id": str(ADMIN_ID),
+        "github_repo": "bench/repo",
+        "github_token": "bench",
+        "github_api_url": api_url,
+        "dispatch_window_seconds": 0.05,
+        "admin_digest_window_seconds": digest_window,
+        # no link-rot sweeps while timing handlers
+        "link_check_interval_days": 0,
+        # the fake transport has no flood limits, measure the handlers
+        # (bench_quota.py covers the pacing)
+        "rate_limits": {key: [1e6, 1e6] for key in LIMITS},
+    }
+    config = {}
+    for i in range(users):
+        config[str(FIRST_PRIVATE_CHAT + i)] = {
+            "chat_name": f"user{i}",
+            "type": "private",
+            "css_class": "pp",
+            "thoughts_author": f"user{i}",
+        }
+    for i in range(groups):
+        config[str(FIRST_GROUP_CHAT - i)] = {"chat_name": f"group{i}", "type": "group"}
+
+    with open(workdir / "credentials.json", "w") as f:
+        json.dump(credentials, f)
+    with open(workdir / "config.json", "w") as f:
+        json.dump(config, f)
+    return workdir
+
+
+def url_entities(text: str) -> list:
+    """url entities like Telegram's clients add them (UTF-16 offsets)"""
+    return [
+        {
+            "type": "url",
+            "offset": len(text[: m.start()].encode("utf-16-le")) // 2,
+            "length": len(m.group().encode("utf-16-le")) // 2,
+        }
+        for m in re.finditer(r"https?://\S+", text)
+    ]
+
+
+class UpdateFactory:
+    def __init__(self):
+        self.update_id = 0
+        self.message_id = 0
+
+    def _next(self) -> int:
+        self.update_id += 1
+        return self.update_id
+
+    def message(
+        self, chat_id: int, user_id: int, text: str, date: float = None
+    ) -> dict:
+        self.message_id += 1
+        return {
+            "update_id": self._next(),
+            "message": {
+                "message_id": self.message_id,
+                "date": int(date or time.time()),
+                "chat": {
+                    "id": chat_id,
+                    "type": "private" if chat_id > 0 else "group",
+                    "title": None if chat_id > 0 else f"group {chat_id}",
+                },
+                "from": {"id": user_id, "is_bot": False, "first_name": f"u{user_id}"},
+                "text": text,
+                "entities": url_entities(text),
+            },
+        }
+
+    def callback(
+        self, chat_id: int, user_id: int, data: str, reply_markup: dict = None
+    ) -> dict:
+        self.message_id += 1
+        return {
+            "update_id": self._next(),
+            "callback_query": {
+                "id": str(self.update_id),
+                "from": {"id": user_id, "is_bot": False, "first_name": f"u{user_id}"},
+                "chat_instance": str(chat_id),
+                "data": data,
+                "message": {
+                    "message_id": self.message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"},
+                    "from": BOT_USER,
+                    "text": "...",
+                    "reply_markup": reply_markup,
+                },
+            },
+        }
+
+
+def thought_stream(factory: UpdateFactory, users: int):
+    """Every user sends a thought, keeps their name and submits"""
+    for i in range(users):
+        chat = FIRST_PRIVATE_CHAT + i
+        yield "thought_text", factory.message(chat, chat, f"thought number {i}")
+        yield "thought_keep_name", factory.callback(chat, chat, "ok")
+        yield "thought_submit", factory.callback(chat, chat, "confirm")
+
+
+def group_stream(factory: UpdateFactory, base_url: str, groups: int, messages: int):
+    """Chatty groups where every message carries a few links"""
+    n = 0
+    for m in range(messages):
+        for g in range(groups):
+            links = []
+            for _ in range(LINKS_PER_MESSAGE):
+                links.append(f"{base_url}/article/{n}?utm_source=bench")
+                n += 1
+            text = "have a look " + " and ".join(links) + " " + "chatter " * 40
+            yield "group_links", factory.message(FIRST_GROUP_CHAT - g, 5000 + m, text)
+
+
+def backlog_updates(
+    factory: UpdateFactory, base_url: str, groups: int, count: int
+) -> list:
+    """Group messages sharing links from a pool half their number, a few stale"""
+    pool = max(1, count // 2)
+    updates = []
+    for i in range(count):
+        links = [
+            f"{base_url}/article/backlog{(i * LINKS_PER_MESSAGE + k) % pool}"
+            for k in range(LINKS_PER_MESSAGE)
+        ]
+        date = time.time() - (3 * 24 * 3600 if i % STALE_EVERY == 0 else 600)
+        text = "while you were away " + " and ".join(links)
+        updates.append(
+            factory.message(FIRST_GROUP_CHAT - i % groups, 5000, text, date=date)
+        )
+    return updates
+
+
+def approval_stream(factory: UpdateFactory, link_ids):
+    for link_id in link_ids:
+        yield "approve_link", factory.callback(
+            ADMIN_ID, ADMIN_ID, f"approve_link:{link_id}"
+        )
+
+
+def digest_stream(factory: UpdateFactory, keyboards):
+    for keyboard in keyboards:
+        yield "approve_digest", factory.callback(
+            ADMIN_ID, ADMIN_ID, "digest_approve", reply_markup=keyboard
+        )
+
+
+def replay_stream(path: Path):
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            kind = next(k for k in data if k != "update_id")
+            yield kind, data
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(p / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+async def replay(
+    application: Application, stream, latencies: dict, concurrent: bool
+) -> float:
+    """
+    Feed a stream of updates, returns the wall time it took
+
+    Sequential mode awaits each update before sending the next one. Concurrent
+    mode hands them all to the application's update processor at once, like
+    the update fetcher does, so latency includes the time spent queued.
+    """
+
+    async def handle(kind, update, t):
+        await application.process_update(update)
+        latencies[kind].append(time.perf_counter() - t)
+
+    async def timed(kind, update):
+        # parked updates return early, so time until the handling itself ends
+        coroutine = handle(kind, update, time.perf_counter())
+        if concurrent:
+            await application.update_processor.process_update(update, coroutine)
+        else:
+            await coroutine
+
+    start = time.perf_counter()
+    updates = [(kind, Update.de_json(data, application.bot)) for kind, data in stream]
+    if concurrent:
+        await asyncio.gather(*(timed(kind, update) for kind, update in updates))
+    else:
+        for kind, update in updates:
+            await timed(kind, update)
+    return time.perf_counter() - start
+
+
+def report(latencies: dict, phase_seconds: dict) -> dict:
+    results = {}
+    print(
+        f"{'update kind':<20} {'count':>6} {'upd/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+    )
+    for kind, values in latencies.items():
+        total = sum(values)
+        results[kind] = {
+            "count": len(values),
+            "throughput": len(values) / total if total else 0,
+            "p50_ms": percentile(values, 50) * 1e3,
+            "p95_ms": percentile(values, 95) * 1e3,
+            "p99_ms": percentile(values, 99) * 1e3,
+            "mean_ms": statistics.fmean(values) * 1e3,
+        }
+        r = results[kind]
+        print(
+            f"{kind:<20} {r['count']:>6} {r['throughput']:>9.1f} "
+            f"{r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f}"
+        )
+    for phase, seconds in phase_seconds.items():
+        print(f"phase {phase}: {seconds:.2f}s")
+    return results
+
+
+async def run(args):
+    runner, base_url, stand_in_stats = await start_stand_in(args.github_latency / 1e3)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(
+            prepare_workdir(
+                Path(tmp), base_url, args.users, args.groups, args.digest_window
+            )
+        )
+        import bot  # reads credentials.json from the working directory
+
+        fake = FakeTelegramRequest()
+        factory = UpdateFactory()
+        updates_request = FakeTelegramRequest(
+            backlog_updates(factory, base_url, max(1, args.groups), args.backlog)
+        )
+        handler = bot.ThoughtsBotHandler(
+            Application.builder()
+            .token(bot.TOKEN)
+            .request(fake)
+            .get_updates_request(updates_request),
+            concurrent_updates=args.concurrency,
+        )
+        application = handler.application
+        errors = Counter()
+
+        async def count_errors(update, context):
+            errors[type(context.error).__name__] += 1
+
+        application.add_error_handler(count_errors)
+
+        not_running = Counter()
+
+        async def handled(update, context):
+            # last group, after the bot's handlers
+            if not application.running:
+                not_running["updates"] += 1
+            updates_request.processed.add(update.update_id)
+
+        application.add_handler(TypeHandler(Update, handled), group=100)
+
+        latencies = defaultdict(list)
+        phases = {}
+        concurrent = args.concurrency > 1
+        async with application:
+            # like ThoughtsBotHandler.serve(), without receiving updates
+            await handler.post_init(application)
+            await application.start()
+            try:
+                start = time.perf_counter()
+                await handler.catch_up()
+                if args.backlog:
+                    phases["catch-up"] = time.perf_counter() - start
+                    early = updates_request.confirmed_early
+                    assert not early, f"{early} updates confirmed before handled"
+                    assert not not_running, "backlog processed before start()"
+                if args.replay:
+                    phases["replay"] = await replay(
+                        application, replay_stream(args.replay), latencies, concurrent
+                    )
+                else:
+                    phases["thoughts"] = await replay(
+                        application,
+                        thought_stream(factory, args.users),
+                        latencies,
+                        concurrent,
+                    )
+                    phases["groups"] = await replay(
+                        application,
+                        group_stream(factory, base_url, args.groups, args.messages),
+                        latencies,
+                        concurrent,
+                    )
+                    if handler.digest is not None:
+                        await handler.digest.flush()
+                        approvals = digest_stream(factory, fake.digests)
+                    else:
+                        link_ids = list(handler.pending_links.links)
+                        approvals = approval_stream(factory, link_ids)
+                    phases["approvals"] = await replay(
+                        application, approvals, latencies, concurrent
+                    )
+            finally:
+                await application.stop()
+                # lets the outbox deliver what's queued
+                await handler.post_stop(application)
+                await handler.post_shutdown(application)
+
+        results = report(latencies, phases)
+        print(f"telegram calls: {dict(fake.calls)}")
+        print(f"stand-in: {dict(stand_in_stats)}")
+        if errors:
+            print(f"handler errors: {dict(errors)}")
+        os.chdir(BOT_DIR)
+
+    await runner.cleanup()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {
+                    "args": {k: str(v) for k, v in vars(args).items()},
+                    "results": results,
+                    "phases": phases,
+                    "telegram_calls": dict(fake.calls),
+                    "errors": dict(errors),
+                },
+                f,
+                indent=4,
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50, help="private chats")
+    parser.add_argument("--groups", type=int, default=20, help="group chats")
+    parser.add_argument("--messages", type=int, default=10, help="messages per group")
+    parser.add_argument(
+        "--github-latency", type=float, default=50, help="stand-in GitHub latency (ms)"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="updates processed at once (per-chat order kept), 1 = one by one",
+    )
+    parser.add_argument(
+        "--digest-window",
+        type=float,
+        default=0,
+        help="admin digest window (s), 0 = one admin message per link",
+    )
+    parser.add_argument(
+        "--backlog",
+        type=int,
+        default=0,
+        help="group messages waiting in getUpdates at startup",
+    )
+    parser.add_argument(
+        "--replay", type=Path, help="recorded updates, one json per line"
+    )
+    parser.add_argument("--json", type=Path, help="also write results to this file")
+    args = parser.parse_args()
+    if args.replay:
+        args.replay = args.replay.resolve()
+    if args.json:
+        args.json = args.json.resolve()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
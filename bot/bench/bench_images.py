@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Benchmark: photo pipeline (download + WebP/AVIF variants)
+
+Serves a few large synthetic JPEGs (phone-camera size, ~20 MB at the top
+end) from a local server and pushes them through ImagePipeline.process with
+1, 2, ... up to cpu_count worker processes, reporting photos/s and the peak
+memory of the bot process and of the workers.
+
+    python bench/bench_images.py [--photos 16] [--megapixels 48]
+"""
+
+import argparse
+import asyncio
+import os
+import multiprocessing
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from aiohttp import web
+from PIL import Image, ImageFilter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from images import ImagePipeline
+
+
+def make_jpeg(megapixels: float, seed: int, path: str) -> int:
+    """Blurred noise over a gradient, about the size of a real photo"""
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = width * 3 // 4
+    noise = Image.effect_noise((width, height), 48 + seed).filter(
+        ImageFilter.BoxBlur(1)
+    )
+    gradient = Image.linear_gradient("L").resize((width, height))
+    image = Image.merge(
+        "RGB", (noise, gradient, noise.transpose(Image.FLIP_LEFT_RIGHT))
+    )
+    image.save(path, "JPEG", quality=92)
+    return os.path.getsize(path)
+
+
+async def start_server(photos: list):
+    # sendfile, so serving doesn't buffer whole photos in this process either
+    async def photo(request):
+        return web.FileResponse(photos[int(request.match_info["n"])])
+
+    app = web.Application()
+    app.router.add_get("/photo/{n}.jpg", photo)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process (since exec, unlike ru_maxrss)"""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return 0
+
+
+async def run(args):
+    print(f"generating {args.distinct} {args.megapixels:g} MP jpegs...")
+    # in another process, so the full-size bitmaps don't count for this one
+    spawn = multiprocessing.get_context("spawn")
+    source_dir = tempfile.TemporaryDirectory()
+    photos = [f"{source_dir.name}/{n}.jpg" for n in range(args.distinct)]
+    with ProcessPoolExecutor(1, mp_context=spawn) as pool:
+        sizes = pool.map(
+            make_jpeg, [args.megapixels] * args.distinct, range(args.distinct), photos
+        )
+        print(f"sizes (MB): {', '.join(f'{size / 1e6:.1f}' for size in sizes)}")
+    runner, base_url = await start_server(photos)
+    print(f"bot process peak rss before: {peak_rss_mb():.0f} MB")
+    worker_peak = 0
+
+    workers = 1
+    while workers <= args.max_workers:
+        with tempfile.TemporaryDirectory() as tmp:
+            pipeline = ImagePipeline(Path(tmp), workers)
+            await pipeline.start()
+            # warm the pool up, spawning workers isn't what we measure
+            await pipeline.process(f"{base_url}/photo/0.jpg", "warmup", "w")
+            start = time.perf_counter()
+            results = await asyncio.gather(
+                *(
+                    pipeline.process(
+                        f"{base_url}/photo/{n % args.distinct}.jpg", "bench", str(n)
+                    )
+                    for n in range(args.photos)
+                )
+            )
+            elapsed = time.perf_counter() - start
+            peaks = [pipeline.pool.submit(peak_rss_mb) for _ in range(workers * 4)]
+            worker_peak = max([worker_peak] + [p.result() for p in peaks])
+            await pipeline.close()
+            output = sum(f.stat().st_size for f in Path(tmp, "bench").iterdir())
+        info = results[0][0]
+        print(
+            f"{workers:>2} workers: {args.photos / elapsed:6.2f} photos/s  "
+            f"({info['width']}x{info['height']}, "
+            f"{output / args.photos / 1e3:.0f} KB of variants per photo)"
+        )
+        workers *= 2
+
+    print(f"bot process peak rss after: {peak_rss_mb():.0f} MB")
+    print(f"worker peak rss: {worker_peak:.0f} MB")
+    await runner.cleanup()
+    source_dir.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--photos", type=int, default=16)
+    parser.add_argument("--distinct", type=int, default=3, help="different jpegs")
+    parser.add_argument("--megapixels", type=float, default=48)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count())
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
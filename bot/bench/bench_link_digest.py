@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Checks for the admin link digest (link_digest.py) when sending fails
+
+A stand-in `send()` fails for a while, then works again. Then:
+
+  1. links of a failed digest are kept and go out with the next window,
+     ahead of the links that came in meanwhile, none lost or repeated
+  2. while sending fails, a full digest doesn't trigger extra attempts:
+     one attempt per window however many links arrive
+  3. a digest that can't be sent when closing hands its links back (the
+     bot drops them from PendingLinks, so the next message sharing one
+     announces it again) and doesn't try again
+
+Everything runs offline.
+
+    python bench/bench_link_digest.py [--links 120]
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from link_digest import LinkDigest
+from pending_links import PendingLinks
+
+WINDOW = 0.05  # seconds
+MAX_LINKS = 10
+
+
+class Admin:
+    """Stand-in for send_link_digest, failing while `down`"""
+
+    def __init__(self, down: bool):
+        self.down = down
+        self.attempts = 0
+        self.received = []
+
+    async def send(self, items: list):
+        self.attempts += 1
+        assert len(items) <= MAX_LINKS, f"digest of {len(items)} links"
+        if self.down:
+            raise ConnectionError("Telegram is down")
+        self.received.extend(item["id"] for item in items)
+
+
+def link(n: int) -> dict:
+    return {"id": f"link-{n}", "url": f"https://example.com/{n}"}
+
+
+async def check_retry(links: int):
+    admin = Admin(down=True)
+    digest = LinkDigest(admin.send, WINDOW, MAX_LINKS)
+    # many full digests' worth arrive over a few windows while sending fails
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    for n in range(links):
+        await digest.add(link(n))
+        if n % 10 == 9:
+            await asyncio.sleep(WINDOW / 4)
+    windows = (loop.time() - start) / WINDOW
+    attempts = admin.attempts
+    # the first full digest, then one attempt per window
+    assert attempts <= windows + 2, f"{attempts} attempts in {windows:.1f} windows"
+    admin.down = False
+    while len(digest):
+        await asyncio.sleep(WINDOW)
+    expected = [link(n)["id"] for n in range(links)]
+    assert admin.received == expected, "links lost, repeated or out of order"
+    print(
+        f"{links} links over {windows:.1f} windows while sending failed: "
+        f"{attempts} attempts; all delivered in order once it worked again"
+    )
+
+
+async def check_close(tmp: Path):
+    pending = PendingLinks(tmp / "pending.sqlite3")
+    admin = Admin(down=True)
+    digest = LinkDigest(admin.send, WINDOW, MAX_LINKS)
+    urls = [f"https://example.com/{n}" for n in range(5)]
+    for n, url in enumerate(urls):
+        link_id = pending.add(url, chat_id="1", message_id=n)
+        await digest.add({"id": link_id, "url": url})
+    unannounced = await digest.close()
+    assert [item["url"] for item in unannounced] == urls and not len(digest)
+    await asyncio.sleep(WINDOW * 2)
+    assert admin.attempts == 1, "closed digest kept retrying"
+    # what ThoughtsBotHandler.forget_unannounced() does with them
+    for item in unannounced:
+        pending.pop(item["id"])
+    assert all(pending.find(url) is None for url in urls)
+    pending.close()
+    print(f"closing with sending down: {len(urls)} links handed back")
+
+
+async def main_async(args):
+    logging.basicConfig(level=logging.CRITICAL)
+    await check_retry(args.links)
+    with tempfile.TemporaryDirectory() as tmp:
+        await check_close(Path(tmp))
+    print("all checks passed")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--links", type=int, default=120)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Benchmark: link-rot sweep against a local stand-in for the web
+
+Serves a fake archive of selected_press links from 127.0.0.1..127.0.0.N
+(one "host" per address, so per-host limits apply) with pages that are
+fine, slow, redirected, gone, flaky, refuse HEAD or move behind a trailing
+slash, plus one host that refuses connections. Then:
+
+  1. starts a sweep, kills it halfway and lets a new checker resume it
+  2. runs a second sweep, which should be mostly conditional 304s and only
+     report what changed (the flaky links are dead now)
+
+and checks the results, the concurrency limits (no per-host semaphore left
+over afterwards) and that no link was checked twice in a sweep. Everything runs offline.
+
+    python bench/bench_link_rot.py [--links 600] [--hosts 6] [--slow 0.2]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from link_rot import GLOBAL_LIMIT, PER_HOST_LIMIT, LinkRotChecker
+
+KINDS = ["ok", "ok", "ok", "slow", "redirect", "slash", "dead", "nohead", "flaky"]
+EXPECTED = {
+    "ok": "ok",
+    "slow": "ok",
+    "redirect": "redirected",
+    "slash": "ok",
+    "dead": "dead",
+    "nohead": "ok",
+    "flaky": "error",
+    "refused": "error",
+}
+
+
+class StandIn:
+    """The fake web: counts requests and how many run at once"""
+
+    def __init__(self, slow: float):
+        self.slow = slow
+        self.requests = Counter()  # (method, path) -> count
+        self.not_modified = set()
+        self.in_flight = Counter()
+        self.max_host = Counter()
+        self.total_in_flight = 0
+        self.max_total = 0
+
+    @web.middleware
+    async def track(self, request, handler):
+        host = request.host.split(":")[0]
+        self.requests[(request.method, request.path)] += 1
+        self.in_flight[host] += 1
+        self.total_in_flight += 1
+        self.max_host[host] = max(self.max_host[host], self.in_flight[host])
+        self.max_total = max(self.max_total, self.total_in_flight)
+        try:
+            # a little latency everywhere, like a real network
+            await asyncio.sleep(0.01)
+            return await handler(request)
+        finally:
+            self.in_flight[host] -= 1
+            self.total_in_flight -= 1
+
+    def page(self, request, etag: str):
+        if request.headers.get("If-None-Match") == etag:
+            self.not_modified.add(request.path.rstrip("/"))
+            return web.Response(status=304)
+        headers = {"ETag": etag, "Last-Modified": "Mon, 03 Mar 2025 10:00:00 GMT"}
+        status = 206 if "Range" in request.headers else 200
+        return web.Response(status=status, text="<html>hi</html>", headers=headers)
+
+    async def handle(self, request):
+        kind, n = request.match_info["kind"], request.match_info["n"]
+        if kind == "slow":
+            await asyncio.sleep(self.slow)
+        if kind in ("ok", "slow"):
+            return self.page(request, f'"{kind}-{n}"')
+        if kind == "redirect":
+            raise web.HTTPMovedPermanently(f"/moved/{n}")
+        if kind == "slash" and not request.path.endswith("/"):
+            raise web.HTTPMovedPermanently(f"/slash/{n}/")
+        if kind == "dead":
+            raise web.HTTPNotFound()
+        if kind == "nohead":
+            if request.method == "HEAD":
+                raise web.HTTPMethodNotAllowed("HEAD", ["GET"])
+            return self.page(request, f'"nohead-{n}"')
+        if kind == "flaky":
+            raise web.HTTPServiceUnavailable()
+        return self.page(request, f'"{kind}-{n}"')
+
+    async def serve(self, hosts: int):
+        app = web.Application(middlewares=[self.track])
+        app.router.add_route("*", "/{kind}/{n}", self.handle)
+        app.router.add_route("*", "/{kind}/{n}/", self.handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        first = web.TCPSite(runner, "127.0.0.1", 0)
+        await first.start()
+        port = first._server.sockets[0].getsockname()[1]
+        for host in range(2, hosts + 1):
+            await web.TCPSite(runner, f"127.0.0.{host}", port).start()
+        return runner, port
+
+
+def make_archive(press_dir: Path, links: int, hosts: int, port: int) -> dict:
+    """Write press entries linking to the stand-in, returns url -> kind"""
+    expected = {}
+    for i in range(links):
+        kind = KINDS[i % len(KINDS)]
+        # one host of slow pages, the rest spread over the others
+        host = 2 if kind == "slow" else 1 + i % hosts
+        expected[f"http://127.0.0.{host}:{port}/{kind}/{i}"] = kind
+    for i in range(links // 50):
+        # nothing listens on port 9
+        expected[f"http://127.0.0.1:9/refused/{i}"] = "refused"
+
+    shard = press_dir / "_shards" / "2025-01.jsonl"
+    shard.parent.mkdir(parents=True)
+    with open(shard, "w") as f:
+        for n, url in enumerate(expected):
+            data = {"url": url, "datetime": f"2025-01-01T00:00:{n % 60:02d}Z"}
+            f.write(json.dumps({"id": f"2025-01/{n}", "data": data}) + "\n")
+    return expected
+
+
+async def run(args):
+    stand_in = StandIn(args.slow)
+    runner, port = await stand_in.serve(args.hosts)
+    reports = []
+
+    async def on_report(summary):
+        reports.append(summary)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        press_dir, db = Path(tmp, "selected_press"), Path(tmp, "checks.sqlite3")
+        expected = make_archive(press_dir, args.links, args.hosts, port)
+        print(f"{len(expected)} links on {args.hosts} hosts (+1 refusing)")
+
+        # 1. sweep, killed halfway, resumed by a fresh checker
+        checker = LinkRotChecker(db, press_dir, interval=0, on_report=on_report)
+        start = time.perf_counter()
+        task = asyncio.create_task(checker.sweep())
+        while checker.db.execute("SELECT COUNT(*) FROM link_checks").fetchone()[0] < (
+            len(expected) // 2
+        ):
+            await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await checker.close()
+        # the server finishes what the kill cut off before anything new starts
+        while stand_in.total_in_flight:
+            await asyncio.sleep(0.01)
+        checker = LinkRotChecker(db, press_dir, interval=0, on_report=on_report)
+        summary = await checker.sweep()
+        first_sweep = time.perf_counter() - start
+        print(
+            f"sweep 1: {first_sweep:.2f}s, interrupted, resume checked "
+            f"{summary['checked']} links; reported {len(summary['dead'])} dead, "
+            f"{len(summary['redirected'])} redirected"
+        )
+        states = dict(checker.db.execute("SELECT url, state FROM link_checks"))
+        wrong = [u for u, kind in expected.items() if states[u] != EXPECTED[kind]]
+        assert not wrong, f"unexpected states: {wrong[:5]}"
+        # only requests cut off by the kill may have been sent twice
+        repeated = [
+            path
+            for (method, path), count in stand_in.requests.items()
+            if method == "HEAD" and count > 1
+        ]
+        assert len(repeated) <= GLOBAL_LIMIT, f"{len(repeated)} links checked twice"
+
+        # 2. a second sweep: conditional requests, only news gets reported
+        stand_in.not_modified.clear()
+        start = time.perf_counter()
+        summary = await checker.sweep()
+        # every page that sent an ETag: ok, slow, slash and nohead ones
+        conditional = {
+            urlsplit(url).path
+            for url, kind in expected.items()
+            if kind in ("ok", "slow", "slash", "nohead")
+        }
+        print(
+            f"sweep 2: {time.perf_counter() - start:.2f}s, {summary['checked']} "
+            f"checked, {len(stand_in.not_modified)} answered 304 (of {len(conditional)} with "
+            f"an ETag); reported {len(summary['dead'])} newly dead, "
+            f"{summary['known']} already reported"
+        )
+        newly_dead = {row["url"] for row in summary["dead"]}
+        assert newly_dead == {
+            u for u, kind in expected.items() if kind in ("flaky", "refused")
+        }
+        missing = conditional - stand_in.not_modified
+        assert not missing, f"not revalidated: {sorted(missing)[:5]}"
+        assert len(reports) == 2
+        assert not len(checker.host_limits), "per-host semaphores left over"
+        await checker.close()
+
+    sequential = sum(
+        args.slow if kind == "slow" else 0.01 for kind in expected.values()
+    )
+    print(
+        f"max in flight: {stand_in.max_total} overall (limit {GLOBAL_LIMIT}), "
+        f"{max(stand_in.max_host.values())} per host (limit {PER_HOST_LIMIT})"
+    )
+    print(f"one request at a time would spend >= {sequential:.1f}s per sweep")
+    assert stand_in.max_total <= GLOBAL_LIMIT
+    assert max(stand_in.max_host.values()) <= PER_HOST_LIMIT
+    await runner.cleanup()
+    print("all checks passed")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--links", type=int, default=600)
+    parser.add_argument("--hosts", type=int, default=6)
+    parser.add_argument("--slow", type=float, default=0.2, help="seconds")
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Checks for link metadata fetching (metadata.py) against a local stand-in
+
+Serves pages with long bodies, one in a legacy charset, a slow page, error
+statuses, a page that fails once and then works, and a PDF. Then:
+
+  1. a fresh fetch gets title, description and og:image, a second one comes
+     from the cache (memory, or SQLite for a new fetcher) without touching
+     the server
+  2. timeouts, 4xx/5xx and non-HTML answers give empty metadata and are not
+     cached, so the page is asked again next time
+  3. titles come out right whatever charset the page declares
+  4. per-host limits hold, and no per-host semaphore is left over
+
+and prints how long cached and uncached fetches take. Everything runs
+offline.
+
+    python bench/bench_metadata.py [--fetches 200]
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import metadata
+from metadata import PER_HOST_LIMIT, MetadataFetcher
+
+EMPTY = {"title": None, "description": None, "image": None}
+HEAD = """<html><head>
+<title>  Page {n}  </title>
+<meta property="og:description" content="About page {n}">
+<meta property="og:image" content="/images/{n}.png">
+</head><body>{body}</body></html>"""
+
+
+class StandIn:
+    """The fake web: counts requests per path and how many run at once"""
+
+    def __init__(self):
+        self.requests = Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.flaky_failed = False
+
+    @web.middleware
+    async def track(self, request, handler):
+        self.requests[request.path] += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.005)
+            return await handler(request)
+        finally:
+            self.in_flight -= 1
+
+    async def page(self, request):
+        n = request.match_info["n"]
+        # a long body the fetcher shouldn't download
+        body = HEAD.format(n=n, body="x" * 2_000_000)
+        return web.Response(text=body, content_type="text/html")
+
+    async def latin1(self, request):
+        body = "<html><head><title>Caf\xe9 d\xe9j\xe0 vu</title></head></html>"
+        return web.Response(
+            body=body.encode("iso-8859-1"),
+            headers={"Content-Type": "text/html; charset=iso-8859-1"},
+        )
+
+    async def slow(self, request):
+        await asyncio.sleep(2)
+        return web.Response(
+            text=HEAD.format(n="slow", body=""), content_type="text/html"
+        )
+
+    async def status(self, request):
+        code = int(request.match_info["code"])
+        return web.Response(
+            status=code, text=HEAD.format(n=code, body=""), content_type="text/html"
+        )
+
+    async def flaky(self, request):
+        if not self.flaky_failed:
+            self.flaky_failed = True
+            return web.Response(status=503, text="try later")
+        return web.Response(
+            text=HEAD.format(n="flaky", body=""), content_type="text/html"
+        )
+
+    async def pdf(self, request):
+        return web.Response(body=b"%PDF-1.4", content_type="application/pdf")
+
+
+async def start_stand_in(stand_in: StandIn):
+    app = web.Application(middlewares=[stand_in.track])
+    app.router.add_get("/page/{n}", stand_in.page)
+    app.router.add_get("/latin1", stand_in.latin1)
+    app.router.add_get("/slow", stand_in.slow)
+    app.router.add_get("/status/{code}", stand_in.status)
+    app.router.add_get("/flaky", stand_in.flaky)
+    app.router.add_get("/doc.pdf", stand_in.pdf)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def timed_fetch(fetcher: MetadataFetcher, url: str) -> tuple:
+    start = time.perf_counter()
+    meta = await fetcher.fetch(url)
+    return meta, time.perf_counter() - start
+
+
+async def check_cache(tmp: Path, url: str, stand_in: StandIn, fetches: int):
+    fetcher = MetadataFetcher(tmp / "cache.sqlite3")
+    await fetcher.start()
+    urls = [f"{url}/page/{n}" for n in range(fetches)]
+    uncached = await asyncio.gather(*(timed_fetch(fetcher, u) for u in urls))
+    for n, (meta, _) in enumerate(uncached):
+        assert meta == {
+            "title": f"Page {n}",
+            "description": f"About page {n}",
+            "image": f"{url}/images/{n}.png",
+        }, meta
+    assert stand_in.max_in_flight <= PER_HOST_LIMIT, stand_in.max_in_flight
+    assert not len(fetcher.host_limits), "per-host semaphores left over"
+    hits = sum(stand_in.requests.values())
+    cached = [await timed_fetch(fetcher, u) for u in urls]
+    assert [meta for meta, _ in cached] == [meta for meta, _ in uncached]
+    assert sum(stand_in.requests.values()) == hits, "cached fetch hit the server"
+    await fetcher.close()
+
+    # a new fetcher (a restart) reads the SQLite cache
+    fetcher = MetadataFetcher(tmp / "cache.sqlite3")
+    from_db = [await timed_fetch(fetcher, u) for u in urls[:20]]
+    assert [meta for meta, _ in from_db] == [meta for meta, _ in uncached[:20]]
+    assert sum(stand_in.requests.values()) == hits, "SQLite cache missed"
+    await fetcher.close()
+
+    def ms(results):
+        return statistics.median(seconds for _, seconds in results) * 1e3
+
+    print(
+        f"{fetches} pages, at most {stand_in.max_in_flight} requests at once: "
+        f"uncached p50 {ms(uncached):.1f} ms, from memory {ms(cached) * 1e3:.1f} us, "
+        f"from SQLite {ms(from_db) * 1e3:.1f} us"
+    )
+
+
+async def check_failures(tmp: Path, url: str, stand_in: StandIn):
+    fetcher = MetadataFetcher(tmp / "failures.sqlite3")
+    await fetcher.start()
+    cases = {
+        "timeout": f"{url}/slow",
+        "404": f"{url}/status/404",
+        "503": f"{url}/status/503",
+        "not HTML": f"{url}/doc.pdf",
+    }
+    for name, case in cases.items():
+        path = case.removeprefix(url)
+        for attempt in (1, 2):
+            meta = await fetcher.fetch(case)
+            assert meta == EMPTY, f"{name}: {meta}"
+            assert stand_in.requests[path] == attempt, f"{name} was cached"
+    rows = fetcher.db.execute("SELECT COUNT(*) FROM page_metadata").fetchone()[0]
+    assert rows == 0, f"{rows} failures cached"
+
+    # fails once, then the real title shows up
+    assert await fetcher.fetch(f"{url}/flaky") == EMPTY
+    meta = await fetcher.fetch(f"{url}/flaky")
+    assert meta["title"] == "Page flaky", meta
+    assert not len(fetcher.host_limits), "per-host semaphores left over"
+    await fetcher.close()
+    print(f"{', '.join(cases)}: empty and not cached; a 503 recovers next fetch")
+
+
+async def check_charset(tmp: Path, url: str):
+    fetcher = MetadataFetcher(tmp / "charset.sqlite3")
+    await fetcher.start()
+    meta = await fetcher.fetch(f"{url}/latin1")
+    assert meta["title"] == "Caf\xe9 d\xe9j\xe0 vu", meta
+    await fetcher.close()
+    print(f"iso-8859-1 page: title {meta['title']!r}")
+
+
+async def main_async(args):
+    logging.basicConfig(level=logging.CRITICAL)
+    # a short timeout so the slow page times out quickly
+    metadata.TIMEOUT = aiohttp.ClientTimeout(total=0.5)
+    stand_in = StandIn()
+    runner, url = await start_stand_in(stand_in)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            await check_cache(tmp, url, stand_in, args.fetches)
+            await check_failures(tmp, url, stand_in)
+            await check_charset(tmp, url)
+    finally:
+        await runner.cleanup()
+    print("all checks passed")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fetches", type=int, default=200)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Checks that entries queued together (Outbox.enqueue_many, e.g. a digest
+approval) report back once however they leave
+
+A stand-in batcher fails given entries for their first attempts. For
+several entries sharing a `notify`:
+
+  1. all delivered in one go: on_delivered sees notify once, with the last
+  2. one failing first: on_failed sees notify for it, and on_delivered only
+     once that one went through too, not when the others did
+  3. several failing together: on_failed sees notify once
+  4. two groups queued with different notify report back apart
+
+Every entry gets its callbacks either way. Everything runs offline.
+
+    python bench/bench_outbox.py [--entries 5]
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import outbox as outbox_module
+from outbox import Outbox
+
+
+class Batcher:
+    """Stand-in for DispatchBatcher, fails payload n `failures[n]` times"""
+
+    def __init__(self, failures: dict):
+        self.failures = dict(failures)
+
+    async def submit(self, action: str, payload: dict) -> bool:
+        n = payload["n"]
+        if self.failures.get(n):
+            self.failures[n] -= 1
+            return False
+        return True
+
+
+class Reports:
+    """The bot's on_delivered/on_failed, noting what they saw"""
+
+    def __init__(self):
+        self.delivered, self.failed, self.calls = [], [], 0
+
+    async def on_delivered(self, entry: dict):
+        self.calls += 1
+        if entry["notify"]:
+            self.delivered.append(
+                (entry["notify"]["message_id"], entry["payload"]["n"])
+            )
+
+    async def on_failed(self, entry: dict):
+        self.calls += 1
+        # like the bot, retries of an entry happen silently
+        if entry["notify"] and entry["attempts"] == 1:
+            self.failed.append((entry["notify"]["message_id"], entry["payload"]["n"]))
+
+
+def notify(message_id: int) -> dict:
+    return {
+        "chat_id": 1,
+        "message_id": message_id,
+        "delivered": "saved",
+        "failed": "will keep retrying",
+    }
+
+
+async def run(tmp: Path, groups: list, failures: dict) -> tuple:
+    """Queue each group of payload numbers with its own notify, deliver all"""
+    reports = Reports()
+    path = tmp / f"outbox-{len(list(tmp.iterdir()))}.sqlite3"
+    outbox = Outbox(path, Batcher(failures), reports.on_delivered, reports.on_failed)
+    for message_id, numbers in enumerate(groups):
+        outbox.enqueue_many(
+            [("add_press", {"n": n}) for n in numbers], notify(message_id)
+        )
+    await outbox.start()
+    while len(outbox):
+        await asyncio.sleep(0.01)
+    await outbox.close()
+    attempts = len([n for g in groups for n in g]) + sum(failures.values())
+    assert reports.calls == attempts, f"{reports.calls} callbacks for {attempts}"
+    return reports.delivered, reports.failed
+
+
+async def check_notify(tmp: Path, entries: int):
+    numbers = list(range(entries))
+    delivered, failed = await run(tmp, [numbers], {})
+    assert delivered == [(0, numbers[-1])] and not failed, delivered
+
+    delivered, failed = await run(tmp, [numbers], {0: 2})
+    assert failed == [(0, 0)], failed
+    assert delivered == [(0, 0)], "reported delivered before the failed one was"
+
+    delivered, failed = await run(tmp, [numbers], {1: 1, 2: 1, 3: 3})
+    assert failed == [(0, 1)] and delivered == [(0, 3)], (failed, delivered)
+
+    first, second = numbers, [n + entries for n in numbers]
+    delivered, failed = await run(tmp, [first, second], {second[0]: 1})
+    assert failed == [(1, second[0])], failed
+    assert sorted(delivered) == [(0, first[-1]), (1, second[0])], delivered
+    print(f"{entries} entries queued together: reported back once in every case")
+
+
+async def main_async(args):
+    logging.basicConfig(level=logging.CRITICAL)
+    # retry right away instead of after seconds
+    outbox_module.backoff = lambda attempts: 0.01
+    with tempfile.TemporaryDirectory() as tmp:
+        await check_notify(Path(tmp), args.entries)
+    print("all checks passed")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=5)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
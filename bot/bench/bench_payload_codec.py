@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Checks and benchmark for the repository_dispatch payload encoding
+
+1. Boundary sizes: entries right below and above COMPRESS_ABOVE, compressed
+   entries that just fit or just don't fit one dispatch, incompressible and
+   non-ASCII content (escaped by json.dumps), MAX_PARTS parts and one more.
+   Each goes through DispatchBackend to a local stand-in for the GitHub API
+   (which answers 422 past MAX_PAYLOAD_BYTES like the real one), then the
+   received events are fed to bot_gen_writer.py, parts shuffled and repeated,
+   and the written files compared with what the entries should render to.
+2. Throughput of the encode path (encode_entry + packing) for small,
+   medium and large entries.
+
+Everything runs offline.
+
+    python bench/bench_payload_codec.py [--seconds 1]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import string
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import bot_gen_writer
+from github_client import MAX_PAYLOAD_BYTES, GitHubClient
+from payload_codec import (
+    CHUNK_ACTION,
+    COMPRESS_ABOVE,
+    MAX_PARTS,
+    PayloadTooLarge,
+    json_size,
+)
+from storage import BATCH_OVERHEAD, DispatchBackend
+
+WORDS = "the of and to in is was for on that with as by at from it this be are".split()
+
+
+def prose(n: int, rng: random.Random) -> str:
+    """About n characters of compressible text"""
+    words = rng.choices(WORDS, k=n // 3 + 1)
+    ends = rng.choices(" " * 8 + ".,", k=len(words))
+    return "".join(map(str.__add__, words, ends))[:n]
+
+
+def noise(n: int, rng: random.Random) -> str:
+    """n characters that hardly compress"""
+    return "".join(rng.choices(string.ascii_letters + string.digits, k=n))
+
+
+def thought(content: str, n: int) -> dict:
+    return {
+        "action": "add_thought",
+        "author": "bench",
+        "css_class": "default",
+        "datetime": f"2025-03-07T19:27:{n % 60:02d}",
+        "content": content,
+        "dispatch_id": f"{n:032x}",
+    }
+
+
+def padded(make, size: int) -> dict:
+    """The entry make(n) gives for the largest n whose JSON is <= `size` bytes"""
+    n = size
+    while json_size(entry := make(n)) > size:
+        n -= json_size(entry) - size
+    return entry
+
+
+async def start_stand_in():
+    """Local dispatch endpoint, returns (runner, base url, received events)"""
+    received = []
+
+    async def dispatches(request):
+        body = await request.read()
+        if len(body) > MAX_PAYLOAD_BYTES:
+            return web.Response(status=422, text="payload too large")
+        received.append(json.loads(body))
+        return web.Response(status=204)
+
+    app = web.Application(client_max_size=4 * MAX_PAYLOAD_BYTES)
+    app.router.add_post("/repos/bench/site/dispatches", dispatches)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}", received
+
+
+def run_workflow(events: list, root: Path, rng: random.Random) -> list:
+    """What bot_gen.yml would write for these events, in a shuffled order"""
+    events = events + events[: len(events) // 2]  # repeated deliveries
+    rng.shuffle(events)
+    written = []
+    for event in events:
+        for action, payload in bot_gen_writer.entries_from_event(
+            event["event_type"], event["client_payload"]
+        ):
+            if action == CHUNK_ACTION:
+                bot_gen_writer.store_chunk(payload, root)
+            elif path := bot_gen_writer.write_entry(action, payload, root):
+                written.append(path)
+        written += bot_gen_writer.assemble_chunks(root)
+    return written
+
+
+async def check_boundaries(rng: random.Random):
+    runner, url, received = await start_stand_in()
+    client = GitHubClient("token", "bench/site", api_url=url)
+    backend = DispatchBackend(client)
+    budget = MAX_PAYLOAD_BYTES - BATCH_OVERHEAD
+
+    def compressed_size(entry):
+        return sum(json_size(piece) for piece in backend.encode(entry))
+
+    cases = {
+        "small": thought(prose(100, rng), 1),
+        "at COMPRESS_ABOVE": padded(
+            lambda n: thought(prose(n, rng), 2), COMPRESS_ABOVE
+        ),
+        "above COMPRESS_ABOVE": padded(
+            lambda n: thought(prose(n, rng), 3), COMPRESS_ABOVE + 1
+        ),
+        "raw at the limit": padded(lambda n: thought(prose(n, rng), 4), budget),
+        "raw above the limit": padded(lambda n: thought(prose(n, rng), 5), budget + 1),
+        "compresses to the limit": padded(lambda n: thought(noise(n, rng), 6), budget),
+        "incompressible": thought(noise(3 * budget, rng), 7),
+        "non-ASCII": thought("né 🎉 " * 20000, 8),
+    }
+    # noise grows ~4/3 in base64: find the largest entry that still fits
+    # MAX_PARTS dispatches, and one a little larger
+    low, high = budget, MAX_PARTS * budget
+    while high - low > 1:
+        mid = (low + high) // 2
+        try:
+            backend.encode(thought(noise(mid, random.Random(9)), 9))
+            low = mid
+        except PayloadTooLarge:
+            high = mid
+    cases["MAX_PARTS parts"] = thought(noise(low, random.Random(9)), 9)
+    too_large = thought(noise(high, random.Random(9)), 10)
+
+    print(f"{'case':>24} {'json':>9} {'sent':>9} {'pieces':>6}")
+    entries = []
+    for name, entry in cases.items():
+        pieces = backend.encode(entry)
+        print(
+            f"{name:>24} {json_size(entry):>9} {compressed_size(entry):>9} "
+            f"{len(pieces):>6}"
+        )
+        entries.append(entry)
+    print(f"{'MAX_PARTS + 1 parts':>24} {json_size(too_large):>9} {'rejected':>9}")
+
+    assert len(backend.encode(cases["small"])) == 1
+    assert backend.encode(cases["at COMPRESS_ABOVE"]) == [cases["at COMPRESS_ABOVE"]]
+    assert "encoding" in backend.encode(cases["above COMPRESS_ABOVE"])[0]
+    assert len(backend.encode(cases["compresses to the limit"])) == 2
+    assert len(backend.encode(cases["MAX_PARTS parts"])) == MAX_PARTS
+    try:
+        backend.check(too_large)
+        raise AssertionError("entry above MAX_PARTS parts accepted")
+    except PayloadTooLarge as e:
+        print(f"rejected with: {e}")
+
+    # everything in one save: packed, sent, then written by the "workflow"
+    assert await backend.save(entries)
+    assert not await backend.save([too_large])
+    sizes = [json_size(event) for event in received]
+    print(
+        f"{len(entries)} entries -> {len(received)} dispatches, "
+        f"largest {max(sizes)} bytes (limit {MAX_PAYLOAD_BYTES})"
+    )
+    assert max(sizes) <= MAX_PAYLOAD_BYTES
+
+    # a body the encoding didn't shrink never leaves the client
+    assert not await client.dispatch("add_batch", {"entries": [too_large]})
+    await client.close()
+    await runner.cleanup()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        written = run_workflow(received, root, rng)
+        assert len(written) == len(entries), f"{len(written)} files written"
+        for entry in entries:
+            entry = dict(entry)
+            folder, _, text = bot_gen_writer.render_entry(entry.pop("action"), entry)
+            matches = [path for path in written if path.read_text() == text]
+            assert len(matches) == 1, f"{entry['dispatch_id']} written wrong"
+        leftovers = list((root / bot_gen_writer.CHUNKS_DIR).glob("*/*.json"))
+        assert not leftovers, f"parts left behind: {leftovers}"
+    print("round trip through bot_gen_writer: every entry written once, intact")
+
+
+def measure(func, seconds: float) -> tuple:
+    """(calls, elapsed) of calling func for about `seconds`"""
+    calls, start = 0, time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < seconds:
+        func()
+        calls += 1
+    return calls, elapsed
+
+
+def bench_encode(seconds: float, rng: random.Random):
+    backend = DispatchBackend(client=None)
+    workloads = {
+        "thought 300 B": [thought(prose(300, rng), n) for n in range(50)],
+        "thought 3 KB": [thought(prose(3000, rng), n) for n in range(20)],
+        "entry 50 KB": [thought(prose(50_000, rng), n) for n in range(4)],
+        "entry 400 KB": [thought(prose(400_000, rng), 1)],
+        "noise 400 KB": [thought(noise(400_000, rng), 1)],
+    }
+    print(f"\n{'encode + pack':>14} {'entries/s':>10} {'MB/s':>8} {'ratio':>6}")
+    for name, entries in workloads.items():
+        calls, elapsed = measure(lambda: backend.payloads(entries), seconds)
+        raw = sum(json_size(entry) for entry in entries)
+        sent = sum(json_size(p) for p in backend.payloads(entries))
+        print(
+            f"{name:>14} {calls * len(entries) / elapsed:>10.0f} "
+            f"{calls * raw / elapsed / 1e6:>8.1f} {sent / raw:>6.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=1.0, help="per workload")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+    rng = random.Random(1)
+    asyncio.run(check_boundaries(rng))
+    bench_encode(args.seconds, rng)
+    print("\nall checks passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Checks for PendingLinks expiry, on a fake clock
+
+  1. a link past its TTL is gone for get(), pop(), `in` and find() right
+     away, not only after the next (throttled) eviction, and the lookup
+     deletes it from SQLite too
+  2. a link still within its TTL is returned until it expires
+  3. sharing an expired link's url again gets a new id that stays findable
+     when the expired one is looked up and deleted
+  4. the database reopened after all that holds just the live links
+
+Then times get() on a registry with many links. Everything runs offline.
+
+    python bench/bench_pending_links.py [--links 10000]
+"""
+
+import argparse
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pending_links import EVICTION_INTERVAL, PendingLinks
+
+TTL = 10 * EVICTION_INTERVAL
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def stored_ids(path: Path) -> set:
+    db = sqlite3.connect(path)
+    try:
+        return {row[0] for row in db.execute("SELECT id FROM pending_links")}
+    finally:
+        db.close()
+
+
+def check_expiry(tmp: Path):
+    path = tmp / "pending.sqlite3"
+    clock = Clock()
+    pending = PendingLinks(path, ttl=TTL, clock=clock)
+    old = [pending.add(f"https://example.com/old/{n}", chat_id="1") for n in range(4)]
+    clock.now += TTL / 2
+    fresh = pending.add("https://example.com/fresh", chat_id="1")
+    # past the TTL of the old ones, but right after the last eviction
+    clock.now += TTL / 2 + 1
+    pending._last_eviction = clock.now
+
+    assert pending.get(old[0]) is None
+    assert pending.pop(old[1]) is None
+    assert old[2] not in pending
+    assert pending.find("https://example.com/old/3") is None
+    assert not {*old} & stored_ids(path), "expired links left in SQLite"
+    assert pending.get(fresh)["url"] == "https://example.com/fresh"
+    assert pending.find("https://example.com/fresh") == fresh
+
+    # shared again while the expired entry is still around
+    expired = pending.add("https://example.com/again", chat_id="1")
+    clock.now += TTL + 1
+    pending._last_eviction = clock.now
+    again = pending.add("https://example.com/again", chat_id="2")
+    assert pending.get(expired) is None
+    assert pending.find("https://example.com/again") == again
+    assert pending.get(fresh) is None, "fresh link outlived its TTL"
+    pending.close()
+
+    reopened = PendingLinks(path, ttl=TTL, clock=clock)
+    assert set(reopened.links) == {again} == stored_ids(path)
+    reopened.close()
+    print("expired links: gone on lookup, before the next eviction")
+
+
+def bench_get(tmp: Path, links: int):
+    pending = PendingLinks(tmp / "bench.sqlite3")
+    ids = [pending.add(f"https://example.com/{n}") for n in range(links)]
+    start = time.perf_counter()
+    for link_id in ids:
+        pending.get(link_id)
+    elapsed = time.perf_counter() - start
+    pending.close()
+    print(f"get() on {links} links: {elapsed / links * 1e6:.2f} µs each")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--links", type=int, default=10_000)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        check_expiry(Path(tmp))
+        bench_get(Path(tmp), args.links)
+    print("all checks passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Simulation of the quota manager (quota.py) against rate-limited stand-ins
+
+A local stand-in for the Telegram Bot API answers 429 with retry_after past
+its limits (overall, per private chat, per group), one for the GitHub API
+sends X-RateLimit-* headers for a small budget per window, 403 once it's
+used up and 403 with Retry-After past a content-creation limit stricter
+than the one quota.py assumes. Limits are scaled up 10x so it runs in
+seconds. Then:
+
+  1. a flood of replies in private chats and groups plus admin
+     notifications (as after a burst of approvals), sent without and with
+     the QuotaManager: without, calls fail; with, every call gets through
+  2. replies and notifications competing for Telegram's overall limit:
+     replies go first whenever both wait
+  3. a burst of dispatches and reads through GitHubClient, without and
+     with the QuotaManager: with, none fails and the budget holds
+
+Everything runs offline.
+
+    python bench/bench_quota.py [--chats 20] [--messages 6] [--notifications 30]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import statistics
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+from aiohttp import web
+from telegram.error import RetryAfter
+from telegram.ext import ExtBot
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from github_client import GitHubClient
+from metrics import Metrics
+from quota import NOTIFY, REPLY, QuotaManager
+
+SCALE = 10
+TOKEN = "123456:BENCH"
+ADMIN_ID = 1000
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+# what the manager is told, quota.LIMITS sped up
+LIMITS = {
+    "telegram": (30 * SCALE, 30),
+    "private_chat": (1 * SCALE, 3),
+    "group_chat": (20 / 60 * SCALE, 3),
+    # GitHub's real burst is 1% of the budget
+    "github": (1000, 4),
+    "github_write": (80 / 60 * SCALE, 10),
+}
+# GitHub's budget: this many requests per window
+GITHUB_BUDGET = 40
+GITHUB_WINDOW = 2  # seconds
+# stricter than LIMITS["github_write"], found out through Retry-After
+GITHUB_WRITES = (8, 4)
+
+
+class Limit:
+    """
+    What a server enforces: `rate` a second with bursts of `burst` (GCRA),
+    plus a call of slack for calls that bunch up on the way
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.interval = 1 / rate
+        self.tolerance = burst * self.interval
+        self.tat = 0.0
+
+    def check(self, now: float) -> float:
+        """0 if the call is allowed (and counted), else seconds to wait"""
+        tat = max(self.tat, now)
+        if tat - now > self.tolerance:
+            return tat - self.tolerance - now
+        self.tat = tat + self.interval
+        return 0.0
+
+
+async def start_stand_ins(stats: Counter):
+    """Telegram + GitHub stand-ins on one local server, returns (runner, url)"""
+    overall = Limit(*LIMITS["telegram"])
+    chats = {}
+    message_ids = iter(range(1, 10**9))
+
+    async def telegram(request):
+        method = request.match_info["method"]
+        params = dict(await request.post()) if request.can_read_body else {}
+        if method == "getMe":
+            return web.json_response({"ok": True, "result": BOT_USER})
+        now = time.monotonic()
+        chat_id = int(params.get("chat_id", ADMIN_ID))
+        if chat_id not in chats:
+            kind = "group_chat" if chat_id < 0 else "private_chat"
+            chats[chat_id] = Limit(*LIMITS[kind])
+        wait = max(overall.check(now), chats[chat_id].check(now))
+        if wait:
+            stats["telegram 429"] += 1
+            retry_after = math.ceil(wait)
+            return web.json_response(
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {retry_after}",
+                    "parameters": {"retry_after": retry_after},
+                },
+                status=429,
+            )
+        stats["telegram ok"] += 1
+        message = {
+            "message_id": next(message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group"},
+            "from": BOT_USER,
+            "text": params.get("text", ""),
+        }
+        return web.json_response({"ok": True, "result": message})
+
+    window = {"start": 0, "used": 0}
+    writes = Limit(*GITHUB_WRITES)
+
+    async def github(request):
+        await request.read()
+        now = time.time()
+        start = int(now // GITHUB_WINDOW * GITHUB_WINDOW)
+        if start != window["start"]:
+            window.update(start=start, used=0)
+        reset = start + GITHUB_WINDOW
+
+        def headers():
+            return {
+                "X-RateLimit-Limit": str(GITHUB_BUDGET),
+                "X-RateLimit-Remaining": str(GITHUB_BUDGET - window["used"]),
+                "X-RateLimit-Reset": str(reset),
+            }
+
+        if window["used"] >= GITHUB_BUDGET:
+            stats["github budget exceeded"] += 1
+            return web.json_response(
+                {"message": "API rate limit exceeded"}, status=403, headers=headers()
+            )
+        if request.method != "GET":
+            wait = writes.check(time.monotonic())
+            if wait:
+                stats["github secondary limit"] += 1
+                return web.json_response(
+                    {"message": "You have exceeded a secondary rate limit"},
+                    status=403,
+                    headers={**headers(), "Retry-After": str(math.ceil(wait))},
+                )
+        window["used"] += 1
+        stats["github ok"] += 1
+        if request.method == "GET":
+            return web.json_response({"object": {"sha": "0" * 40}}, headers=headers())
+        return web.Response(status=204, headers=headers())
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", telegram)
+    app.router.add_post("/repos/bench/site/dispatches", github)
+    app.router.add_get("/repos/bench/site/git/ref/heads/main", github)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def timed(coroutine, start: float) -> tuple:
+    """(True, seconds until done) or (False, seconds until it failed)"""
+    try:
+        await coroutine
+        return True, time.monotonic() - start
+    except RetryAfter:
+        return False, time.monotonic() - start
+
+
+async def telegram_flood(url: str, quota, args) -> dict:
+    """Replies in every chat plus admin notifications, all at once"""
+    bot = ExtBot(TOKEN, base_url=f"{url}/bot", rate_limiter=quota)
+    await bot.initialize()
+    chats = [2000 + n for n in range(args.chats // 2)]
+    chats += [-3000 - n for n in range(args.chats - len(chats))]
+    start = time.monotonic()
+    replies = [
+        timed(bot.send_message(chat_id, f"reply {n}"), start)
+        for n in range(args.messages)
+        for chat_id in chats
+    ]
+    lane = {} if quota is None else {"rate_limit_args": NOTIFY}
+    notifications = [
+        timed(bot.send_message(ADMIN_ID, f"new link {n}", **lane), start)
+        for n in range(args.notifications)
+    ]
+    results = await asyncio.gather(*replies, *notifications)
+    await bot.shutdown()
+    return {
+        "replies": results[: len(replies)],
+        "notifications": results[len(replies) :],
+        "elapsed": time.monotonic() - start,
+    }
+
+
+def summary(results: list) -> str:
+    times = [seconds for ok, seconds in results if ok]
+    failed = len(results) - len(times)
+    if not times:
+        return f"{failed} failed"
+    return (
+        f"{len(times)} sent, {failed} failed, done after "
+        f"p50 {statistics.median(times):.2f}s, max {max(times):.2f}s"
+    )
+
+
+async def check_telegram(url: str, stats: Counter, args):
+    print("Telegram flood:")
+    for name, quota in (
+        ("without quota manager", None),
+        ("with quota manager", QuotaManager(LIMITS)),
+    ):
+        stats.clear()
+        # let the stand-in's limits recover from the previous run
+        await asyncio.sleep(2)
+        result = await telegram_flood(url, quota, args)
+        print(
+            f"  {name}: replies {summary(result['replies'])}\n"
+            f"  {' ' * len(name)}  notifications {summary(result['notifications'])}\n"
+            f"  {' ' * len(name)}  {stats['telegram 429']} answered 429, "
+            f"{result['elapsed']:.1f}s"
+        )
+    failed = [ok for ok, _ in result["replies"] + result["notifications"] if not ok]
+    assert not failed, f"{len(failed)} calls failed with the quota manager"
+
+
+async def check_lanes(count: int):
+    """Both lanes queued behind the overall bucket: replies must come first"""
+    quota = QuotaManager({"telegram": (200, 1)})
+    order = []
+
+    async def call(lane, n):
+        await quota.acquire(("telegram",), lane)
+        order.append(lane)
+
+    # notifications queued first, replies trickling in after
+    tasks = [asyncio.create_task(call(NOTIFY, n)) for n in range(count)]
+    await asyncio.sleep(0.02)
+    tasks += [asyncio.create_task(call(REPLY, n)) for n in range(count)]
+    await asyncio.gather(*tasks)
+    last_reply = max(i for i, lane in enumerate(order) if lane == REPLY)
+    notifications_first = order[:last_reply].count(NOTIFY)
+    print(
+        f"\nlanes: {count} notifications queued, then {count} replies: "
+        f"the last reply went out after {notifications_first} notifications "
+        "(those let out before the replies arrived)"
+    )
+    assert notifications_first <= 0.02 * 200 + 2, order
+
+
+async def github_burst(url: str, quota, requests: int) -> tuple:
+    client = GitHubClient("token", "bench/site", api_url=url, quota=quota)
+    await client.start()
+    start = time.monotonic()
+
+    async def read():
+        status, _ = await client.request("GET", "/repos/bench/site/git/ref/heads/main")
+        return status == 200
+
+    results = await asyncio.gather(
+        *(
+            client.dispatch("add_thought", {"n": n}) if n % 2 else read()
+            for n in range(requests)
+        )
+    )
+    elapsed = time.monotonic() - start
+    await client.close()
+    return results, elapsed
+
+
+async def check_github(url: str, stats: Counter, requests: int):
+    print(
+        f"\nGitHub burst: {requests} requests, budget {GITHUB_BUDGET} per "
+        f"{GITHUB_WINDOW}s, {GITHUB_WRITES[0]} writes a second:"
+    )
+    for name, quota in (
+        ("without quota manager", None),
+        ("with quota manager", QuotaManager(LIMITS, metrics=Metrics())),
+    ):
+        stats.clear()
+        # a fresh window
+        await asyncio.sleep(GITHUB_WINDOW - time.time() % GITHUB_WINDOW)
+        results, elapsed = await github_burst(url, quota, requests)
+        print(
+            f"  {name}: {sum(results)} ok, {len(results) - sum(results)} failed in "
+            f"{elapsed:.1f}s; stand-in: {json.dumps(dict(stats))}"
+        )
+    assert all(results), "GitHub calls failed with the quota manager"
+    assert not stats["github budget exceeded"], "went past the header budget"
+    rate_limited = quota.metrics.rate_limited.values
+    print(f"  rate limit answers seen by the manager: {dict(rate_limited)}")
+
+
+async def main_async(args):
+    logging.basicConfig(level=logging.ERROR)
+    stats = Counter()
+    runner, url = await start_stand_ins(stats)
+    try:
+        await check_telegram(url, stats, args)
+        await check_lanes(args.notifications)
+        await check_github(url, stats, args.github_requests)
+    finally:
+        await runner.cleanup()
+    print("\nall checks passed")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=6, help="per chat")
+    parser.add_argument("--notifications", type=int, default=30)
+    parser.add_argument("--github-requests", type=int, default=100)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
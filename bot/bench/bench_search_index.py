@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Benchmark: building, updating and querying the search index
+
+Generates a synthetic corpus (default 100k entries, 4 thoughts per press
+link, every closed month compacted like compact.py does, the last one loose
+files) with a Zipf-ish vocabulary, then times search_index.py doing a full
+build and the incremental runs the workflows trigger: nothing changed, one
+new entry, compacting the last month, editing an old entry. The corpus and
+index are committed to a git repository after the full build, and a run in a
+fresh clone of it (as on a CI runner) must read no file and leave the
+checkpoint as it is. Queries run
+against a cold reader each time and report what a browser would download.
+
+    python bench/bench_search_index.py [--entries 100000] [--queries 200]
+"""
+
+import argparse
+import datetime
+import itertools
+import json
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from compact import compact_month, shard_path
+from search_index import SearchIndexBuilder, SearchIndexReader
+
+# rough English letter frequencies, so prefixes are as lopsided as real ones
+LETTERS = "etaoinshrdlcumwfgypbvkjxqz"
+LETTER_WEIGHTS = [
+    *(12.7, 9.1, 8.2, 7.5, 7.0, 6.7, 6.3, 6.1, 6.0, 4.3, 4.0, 2.8, 2.8),
+    *(2.4, 2.4, 2.2, 2.0, 2.0, 1.9, 1.5, 1.0, 0.8, 0.2, 0.15, 0.1, 0.07),
+]
+
+
+def make_vocabulary(rng: random.Random, size: int) -> list:
+    """`size` made-up words, most frequent first"""
+    words = {}
+    while len(words) < size:
+        word = "".join(rng.choices(LETTERS, LETTER_WEIGHTS, k=rng.randint(3, 10)))
+        words.setdefault(word, None)
+    return list(words)
+
+
+def make_corpus(content_dir: Path, n: int, words: list, rng: random.Random) -> str:
+    """Write the corpus, returns the last (loose) month"""
+    cum_weights = list(
+        itertools.accumulate(1 / rank for rank in range(1, len(words) + 1))
+    )
+
+    def text(k: int) -> str:
+        return " ".join(rng.choices(words, cum_weights=cum_weights, k=k))
+
+    start = datetime.datetime(2020, 1, 1)
+    shards = {}
+    for i in range(n):
+        t = (start + datetime.timedelta(minutes=25 * i)).isoformat()[:19]
+        if i % 5:
+            collection = "thoughts"
+            data = {
+                "author": f"author {i % 7}",
+                "css_class": "pp",
+                "datetime": f"{t}Z",
+                "content": text(rng.randint(5, 60)),
+            }
+        else:
+            collection = "selected_press"
+            data = {
+                "url": f"https://{rng.choice(words)}.example.com/{text(3).replace(' ', '-')}",
+                "datetime": f"{t}Z",
+                "title": text(rng.randint(5, 12)),
+                "description": text(rng.randint(15, 40)),
+                "image": None,
+            }
+        entry = {"id": f"{t[:7]}/{t}Z", "data": data}
+        shards.setdefault((collection, t[:7]), []).append(entry)
+
+    last_month = max(month for _, month in shards)
+    for (collection, month), entries in shards.items():
+        if month == last_month:
+            month_dir = content_dir / collection / month
+            month_dir.mkdir(parents=True)
+            for entry in entries:
+                with open(month_dir / f"{entry['data']['datetime']}.json", "w") as f:
+                    json.dump(entry["data"], f, indent=4, ensure_ascii=False)
+        else:
+            path = shard_path(content_dir / collection, month)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, "w") as f:
+                f.writelines(json.dumps(entry) + "\n" for entry in entries)
+    return last_month
+
+
+def index_size(index_dir: Path) -> str:
+    files = [p for p in index_dir.rglob("*.json") if p.name != "checkpoint.json"]
+    shards = [p.stat().st_size for p in (index_dir / "terms").glob("*.json")]
+    return (
+        f"{len(files)} files, {sum(p.stat().st_size for p in files) / 1e6:.1f} MB, "
+        f"largest shard {max(shards) / 1e3:.0f} KB, "
+        f"median shard {statistics.median(shards) / 1e3:.1f} KB, "
+        f"checkpoint {(index_dir / 'checkpoint.json').stat().st_size / 1e3:.0f} KB"
+    )
+
+
+def git(*args, cwd: Path):
+    subprocess.run(
+        ["git", "-c", "user.name=bench", "-c", "user.email=bench@example.com", *args],
+        cwd=cwd,
+        check=True,
+        capture_output=True,
+    )
+
+
+def check_fresh_checkout(repo: Path, clone: Path):
+    """An unchanged corpus in a new clone (new mtimes) is not read again"""
+    git("init", "-q", cwd=repo)
+    git("add", "-A", cwd=repo)
+    git("commit", "-q", "-m", "corpus", cwd=repo)
+    git("clone", "-q", str(repo), str(clone), cwd=repo.parent)
+    checkpoint = (clone / "search" / "checkpoint.json").read_bytes()
+    timed_update("fresh checkout", clone / "bot_gen", clone / "search")
+    stats = SearchIndexBuilder(clone / "bot_gen", clone / "search").update()
+    assert stats["files"] == 0, f"{stats['files']} files read again"
+    assert (clone / "search" / "checkpoint.json").read_bytes() == checkpoint
+    shutil.rmtree(clone)
+
+
+def timed_update(name: str, content_dir: Path, index_dir: Path, rebuild=False):
+    start = time.perf_counter()
+    stats = SearchIndexBuilder(content_dir, index_dir).update(rebuild=rebuild)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:<22} {elapsed * 1e3:9.1f} ms  ({stats['files']} files, "
+        f"{stats['indexed']} indexed, {stats['kept']} kept, "
+        f"{stats['deleted']} deleted)"
+    )
+
+
+def bench_queries(index_dir: Path, queries: list):
+    for label, group in queries:
+        times, loaded, hits = [], [], 0
+        for query in group:
+            start = time.perf_counter()
+            # a fresh reader per query: nothing cached, like a first visit
+            reader = SearchIndexReader(index_dir)
+            hits += len(reader.search(query))
+            times.append(time.perf_counter() - start)
+            loaded.append(reader.bytes_loaded)
+        print(
+            f"  {label:<20} median {statistics.median(times) * 1e3:6.1f} ms, "
+            f"p95 {sorted(times)[int(len(times) * 0.95)] * 1e3:6.1f} ms, "
+            f"{statistics.median(loaded) / 1e3:6.0f} KB loaded "
+            f"({hits / len(group):.1f} hits/query)"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--vocabulary", type=int, default=20_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    words = make_vocabulary(rng, args.vocabulary)
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = Path(tmp, "repo")
+        content_dir, index_dir = repo / "bot_gen", repo / "search"
+        last_month = make_corpus(content_dir, args.entries, words, rng)
+        print(f"{args.entries} entries, {len(words)} words, loose month {last_month}")
+
+        timed_update("full build", content_dir, index_dir)
+        print(f"index: {index_size(index_dir)}")
+        timed_update("nothing changed", content_dir, index_dir)
+        check_fresh_checkout(repo, Path(tmp, "clone"))
+
+        month_dir = content_dir / "thoughts" / last_month
+        t = f"{last_month}-28T23:59:59Z"
+        with open(month_dir / f"{t}.json", "w") as f:
+            json.dump(
+                {"author": "bench", "css_class": "pp", "datetime": t, "content": "new"},
+                f,
+            )
+        timed_update("one new entry", content_dir, index_dir)
+
+        compact_month(content_dir / "thoughts", last_month)
+        compact_month(content_dir / "selected_press", last_month)
+        timed_update("month compacted", content_dir, index_dir)
+
+        first_shard = min((content_dir / "thoughts" / "_shards").glob("*.jsonl"))
+        lines = first_shard.read_text().splitlines(keepends=True)
+        entry = json.loads(lines[0])
+        entry["data"]["content"] += " edited"
+        lines[0] = json.dumps(entry) + "\n"
+        first_shard.write_text("".join(lines))
+        timed_update("old entry edited", content_dir, index_dir)
+        timed_update("full rebuild", content_dir, index_dir, rebuild=True)
+
+        common, rare = words[:50], words[-2000:]
+        print(f"cold queries ({args.queries} each):")
+        bench_queries(
+            index_dir,
+            [
+                ("common word", [rng.choice(common) for _ in range(args.queries)]),
+                ("rare word", [rng.choice(rare) for _ in range(args.queries)]),
+                (
+                    "two words",
+                    [
+                        f"{rng.choice(common)} {rng.choice(words[:2000])}"
+                        for _ in range(args.queries)
+                    ],
+                ),
+                (
+                    "prefix (typing)",
+                    [rng.choice(words)[:3] for _ in range(args.queries)],
+                ),
+            ],
+        )
+
+
+if __name__ == "__main__":
+    main()
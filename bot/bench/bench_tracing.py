@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Checks for end-to-end tracing (tracing.py), and what it costs
+
+Runs updates through tracked handlers (one calling another) that queue
+thoughts in an Outbox, delivered by DispatchBackend to a local stand-in for
+the GitHub API that fails now and then. The received events are then
+processed like bot_gen.yml does, in a temporary git repository: the real
+bot_gen_writer.py, and the commit lines taken from the workflow file. Then:
+
+  1. every trace has its telegram, handler, queue and dispatch spans, the
+     nested handler is a child, failed deliveries are dispatch_failed spans
+  2. every commit carries the Trace-Id trailers of its entries, and the
+     trace log is valid OTLP/JSON
+  3. tracing.py's breakdown covers every stage, actions_queue and workflow
+     included, and the entries on disk have no trace_id in them
+  4. the overhead of a traced handler call, against an untraced one
+
+Everything runs offline.
+
+    python bench/bench_tracing.py [--updates 40]
+"""
+
+import argparse
+import asyncio
+import datetime
+import io
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+from aiohttp import web
+
+BOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BOT_DIR))
+
+import bot_gen_writer
+import outbox as outbox_module
+import tracing
+from dispatch_queue import DispatchBatcher
+from github_client import GitHubClient
+from metrics import Metrics, track_handler
+from outbox import Outbox
+from payload_codec import encode_entry
+from storage import DispatchBackend
+
+WORKFLOW = BOT_DIR.parent / ".github" / "workflows" / "bot_gen.yml"
+
+
+class Handlers:
+    """Just enough of ThoughtsBotHandler for track_handler"""
+
+    def __init__(self, tracer, outbox):
+        self.metrics = Metrics()
+        self.tracer = tracer
+        self.outbox = outbox
+
+    @track_handler
+    async def handle_preview_choice(self, update, context):
+        await self.save_thought(update, context)
+
+    @track_handler
+    async def save_thought(self, update, context):
+        self.outbox.enqueue(
+            "add_thought",
+            {
+                "author": "bench",
+                "css_class": "default",
+                "datetime": datetime.datetime.utcnow().isoformat()[:19],
+                "content": f"thought of update {update.update_id}",
+            },
+        )
+
+    @track_handler
+    async def noop(self, update, context):
+        pass
+
+
+async def start_stand_in(rng: random.Random):
+    """Local dispatch endpoint failing 1 in 5 requests, returns (runner, url, events)"""
+    received = []
+
+    async def dispatches(request):
+        if rng.random() < 0.2:
+            return web.Response(status=502, text="bad gateway")
+        received.append(await request.json())
+        return web.Response(status=204)
+
+    app = web.Application()
+    app.router.add_post("/repos/bench/site/dispatches", dispatches)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}", received
+
+
+def update(update_id: int, delay: float):
+    """An update whose message Telegram took `delay` seconds to hand over"""
+    date = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+        seconds=delay
+    )
+    return SimpleNamespace(update_id=update_id, message=SimpleNamespace(date=date))
+
+
+async def run_bot(tmp: Path, updates: int, rng: random.Random) -> list:
+    """Handle the updates until the outbox is empty, returns the received events"""
+    runner, url, received = await start_stand_in(rng)
+    client = GitHubClient("token", "bench/site", api_url=url)
+    await client.start()
+    tracer = tracing.Tracer(tmp / "traces.jsonl", flush_interval=0.1)
+    await tracer.start()
+    batcher = DispatchBatcher(DispatchBackend(client), window=0.05)
+    await batcher.start()
+    outbox = Outbox(tmp / "outbox.sqlite3", batcher, tracer=tracer)
+    # retry right away instead of after seconds
+    backoff, outbox_module.backoff = outbox_module.backoff, lambda attempts: 0.01
+    await outbox.start()
+    handlers = Handlers(tracer, outbox)
+
+    async def arrive(n: int):
+        # spread over several batches
+        await asyncio.sleep(rng.uniform(0, updates * 0.01))
+        await handlers.handle_preview_choice(update(n, rng.uniform(0.5, 3)), None)
+
+    await asyncio.gather(*(arrive(n) for n in range(updates)))
+    assert tracing.current_trace_id() is None, "trace leaked out of the handler"
+    while len(outbox):
+        await asyncio.sleep(0.05)
+    outbox_module.backoff = backoff
+    await outbox.close()
+    await batcher.close()
+    await client.close()
+    await tracer.close()
+    await runner.cleanup()
+    return received
+
+
+def commit_lines() -> str:
+    """The lines of bot_gen.yml building the trailers and committing"""
+    lines = WORKFLOW.read_text().splitlines()
+    start = next(i for i, line in enumerate(lines) if 'trailers="' in line)
+    end = next(i for i, line in enumerate(lines) if "git commit" in line)
+    return "\n".join(line.strip() for line in lines[start : end + 1])
+
+
+def git(repo: Path, *args) -> str:
+    return subprocess.run(
+        ["git", "-C", str(repo), *args], capture_output=True, text=True, check=True
+    ).stdout
+
+
+def run_workflow(repo: Path, events: list, rng: random.Random):
+    """Process each event like bot_gen.yml, a commit per event"""
+    git(repo, "init", "-q")
+    git(repo, "config", "user.name", "bench")
+    git(repo, "config", "user.email", "bench@example.com")
+    script = commit_lines()
+    cwd = os.getcwd()
+    os.chdir(repo)
+    try:
+        for event in events:
+            # the Actions queue: a moment between dispatch and the run
+            time.sleep(rng.uniform(0, 0.02))
+            run_started = datetime.datetime.now(datetime.timezone.utc)
+            event_path = repo.parent / "event.json"
+            outputs = repo.parent / "outputs"
+            event_path.write_text(
+                json.dumps(
+                    {
+                        "action": event["event_type"],
+                        "client_payload": event["client_payload"],
+                    }
+                )
+            )
+            outputs.write_text("")
+            os.environ["GITHUB_EVENT_PATH"] = str(event_path)
+            os.environ["GITHUB_OUTPUT"] = str(outputs)
+            with open(os.devnull, "w") as devnull:
+                stdout, sys.stdout = sys.stdout, devnull
+                try:
+                    bot_gen_writer.main()
+                finally:
+                    sys.stdout = stdout
+            if "count=0" in outputs.read_text():
+                continue
+            git(repo, "add", "src")
+            subprocess.run(
+                ["bash", "-e", "-c", script],
+                env={
+                    **os.environ,
+                    "RUNNER_TEMP": str(repo.parent),
+                    "RUN_STARTED": run_started.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+                },
+                check=True,
+                capture_output=True,
+            )
+    finally:
+        os.chdir(cwd)
+
+
+def check_spans(traces: dict, updates: int):
+    assert len(traces) == updates, f"{len(traces)} traces for {updates} updates"
+    failed = 0
+    for trace_id, spans in traces.items():
+        names = [span["name"] for span in spans]
+        for stage in ("telegram", "handler", "queue", "dispatch"):
+            assert stage in names, f"{trace_id} has no {stage} span: {names}"
+        assert names.count("handler") == 2 and names.count("dispatch") == 1
+        handlers = {
+            tracing.span_attribute(span, "handler"): span
+            for span in spans
+            if span["name"] == "handler"
+        }
+        outer, inner = handlers["handle_preview_choice"], handlers["save_thought"]
+        assert inner["parentSpanId"] == outer["spanId"], "nested handler unparented"
+        assert "parentSpanId" not in outer
+        failed += names.count("dispatch_failed")
+    print(
+        f"{len(traces)} traces, each with telegram/handler/queue/dispatch spans; "
+        f"{failed} failed deliveries recorded as dispatch_failed"
+    )
+
+
+def check_commits(repo: Path, traces: dict, received: list):
+    sent = {
+        entry["trace_id"]
+        for event in received
+        for entry in event["client_payload"]["entries"]
+    }
+    assert sent == set(traces), "payloads don't carry the handlers' trace IDs"
+    # git reads a small --since as a time of day, give it the real start
+    started = min(
+        tracing.span_times(span)[0] for spans in traces.values() for span in spans
+    )
+    commits = tracing.commit_spans(repo, started - 60)
+    assert set(commits) == set(traces), "traces missing from the commit trailers"
+    subjects = git(repo, "log", "--format=%s").splitlines()
+    assert all(s.startswith("Bot: ") for s in subjects), subjects
+    for path in (repo / "src").rglob("*.json"):
+        assert "trace_id" not in path.read_text(), f"trace_id written to {path}"
+    print(
+        f"{len(subjects)} commits carry the Trace-Id trailers of all "
+        f"{len(commits)} traces, no trace_id in the entries"
+    )
+    return commits
+
+
+def check_log(path: Path):
+    for line in path.read_text().splitlines():
+        request = json.loads(line)
+        (resource,) = request["resourceSpans"]
+        assert resource["resource"]["attributes"][0]["key"] == "service.name"
+        for span in resource["scopeSpans"][0]["spans"]:
+            assert len(span["traceId"]) == 32 and len(span["spanId"]) == 16
+            assert int(span["startTimeUnixNano"]) <= int(span["endTimeUnixNano"])
+    print(f"{path.name}: OTLP/JSON, one export request per line")
+
+
+def check_codec():
+    """A compressed or chunked entry still tells the workflow its trace"""
+    entry = {"action": "add_thought", "dispatch_id": "d" * 32, "trace_id": "t" * 32}
+    entry["content"] = "".join(random.Random(1).choices("abcdef", k=100_000))
+    pieces = encode_entry(entry, 5_000)
+    assert len(pieces) > 1 and all(p["trace_id"] == "t" * 32 for p in pieces)
+
+
+def check_report(traces: dict, commits: dict):
+    out = io.StringIO()
+    tracing.report(traces, commits, last=5, out=out)
+    print(out.getvalue())
+    for trace_id, spans in traces.items():
+        durations = tracing.stages(spans, commits[trace_id])
+        missing = set(tracing.STAGES) - set(durations)
+        assert not missing, f"{trace_id} lacks {missing}"
+        # whole seconds in git, stages can't add up exactly
+        assert durations["total"] + 2 >= sum(
+            durations[stage] for stage in tracing.STAGES
+        )
+
+
+async def bench_overhead(calls: int) -> tuple:
+    """(traced, untraced) seconds per tracked handler call"""
+    results = []
+    for path in ("bench.jsonl", None):
+        with tempfile.TemporaryDirectory() as tmp:
+            tracer = tracing.Tracer(path and Path(tmp, path))
+            handlers = Handlers(tracer, outbox=None)
+            message = update(1, 1)
+            start = time.perf_counter()
+            for _ in range(calls):
+                await handlers.noop(message, None)
+            elapsed = time.perf_counter() - start
+            flush = time.perf_counter()
+            tracer.flush()
+            elapsed += time.perf_counter() - flush
+            results.append(elapsed / calls)
+    return tuple(results)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=40)
+    parser.add_argument("--calls", type=int, default=50_000)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+    rng = random.Random(1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        received = asyncio.run(run_bot(tmp, args.updates, rng))
+        traces = tracing.read_spans(tmp / "traces.jsonl")
+        check_log(tmp / "traces.jsonl")
+        check_spans(traces, args.updates)
+        repo = tmp / "site"
+        repo.mkdir()
+        run_workflow(repo, received, rng)
+        commits = check_commits(repo, traces, received)
+        check_codec()
+        check_report(traces, commits)
+
+    traced, untraced = asyncio.run(bench_overhead(args.calls))
+    print(
+        f"tracked handler call: {traced * 1e6:.1f} us traced, "
+        f"{untraced * 1e6:.1f} us with tracing off"
+    )
+    print("all checks passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Benchmark: finding urls in group messages
+
+Compares the old path (filters.Regex with the character-class URL_REGEX,
+then re.findall over the text again in the handler) with HAS_URL +
+extract_urls on long messages as Telegram delivers them, i.e. with url and
+text_link entities. Most messages in a group are chatter without links, so
+those are reported separately. First checks that the filter and the
+extraction agree: what HAS_URL lets through has its links extracted from
+the entities (text or caption), and a link Telegram didn't mark up is
+neither let through nor extracted.
+
+    python bench/bench_url_extraction.py [--messages 2000] [--length 4000]
+"""
+
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+from telegram import Message
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from url_entities import HAS_URL, extract_urls
+
+OLD_URL_REGEX = (
+    r"http[s]?:\/\/(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\(\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+"
+)
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do 😀 perché".split()
+)
+
+
+def utf16_len(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+def make_message(rng: random.Random, length: int, links: int, n: int) -> dict:
+    """Message json with `links` urls/text links placed in `length` chars of text"""
+    text, entities = "", []
+    for i in range(links):
+        while len(text) < length * (i + 1) // (links + 1):
+            text += rng.choice(WORDS) + " "
+        if i % 3 == 2:
+            label = "this article"
+            entities.append(
+                {
+                    "type": "text_link",
+                    "offset": utf16_len(text),
+                    "length": utf16_len(label),
+                    "url": f"https://example.org/hidden/{n}-{i}",
+                }
+            )
+            text += label + ". "
+        else:
+            url = f"https://news{i}.example.com/2025/04/a-long-slug-{n}?utm_source=tg"
+            entities.append(
+                {"type": "url", "offset": utf16_len(text), "length": utf16_len(url)}
+            )
+            text += url + ", "
+    while len(text) < length:
+        text += rng.choice(WORDS) + " "
+    return {
+        "message_id": n,
+        "date": 0,
+        "chat": {"id": -1, "type": "group", "title": "bench"},
+        "text": text,
+        "entities": entities,
+    }
+
+
+def old_path(message: Message) -> list:
+    if not re.search(OLD_URL_REGEX, message.text):
+        return []
+    return re.findall(OLD_URL_REGEX, message.text)
+
+
+def new_path(message: Message) -> list:
+    if not HAS_URL.filter(message):
+        return []
+    return extract_urls(message)
+
+
+def check_paths():
+    url = "https://example.com/a?b=1"
+    # name -> (message fields, links expected)
+    cases = {
+        "text with a url entity": (
+            {
+                "text": f"see {url}.",
+                "entities": [{"type": "url", "offset": 4, "length": len(url)}],
+            },
+            [url],
+        ),
+        "caption with a text_link": (
+            {
+                "caption": "read this article",
+                "caption_entities": [
+                    {"type": "text_link", "offset": 10, "length": 7, "url": url}
+                ],
+            },
+            [url],
+        ),
+        "text without entities": ({"text": f"see {url}."}, []),
+        "bold text only": (
+            {
+                "text": f"see {url}.",
+                "entities": [{"type": "bold", "offset": 0, "length": 3}],
+            },
+            [],
+        ),
+    }
+    for name, (fields, expected) in cases.items():
+        chat = {"id": -1, "type": "group"}
+        message = Message.de_json(
+            {"message_id": 1, "date": 0, "chat": chat, **fields}, None
+        )
+        assert HAS_URL.filter(message) == bool(expected), name
+        assert extract_urls(message) == expected, name
+    print(f"HAS_URL and extract_urls agree on {len(cases)} kinds of messages")
+
+
+def bench(name: str, fn, messages: list) -> int:
+    start = time.perf_counter()
+    found = sum(len(fn(message)) for message in messages)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<24} {elapsed / len(messages) * 1e6:10.2f} us/msg  ({found} urls)")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--length", type=int, default=4000, help="chars per message")
+    args = parser.parse_args()
+
+    check_paths()
+    rng = random.Random(0)
+    corpora = {
+        "chatter": [
+            Message.de_json(make_message(rng, args.length, 0, n), None)
+            for n in range(args.messages)
+        ],
+        "with links": [
+            Message.de_json(make_message(rng, args.length, 3, n), None)
+            for n in range(args.messages)
+        ],
+    }
+    for corpus, messages in corpora.items():
+        print(f"{corpus}, {args.messages} messages of {args.length} chars:")
+        bench("  regex filter+findall", old_path, messages)
+        bench("  HAS_URL+entities", new_path, messages)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark: url blacklist lookup
+
+Compares the old "re.search every pattern" loop with UrlRules on a few
+thousand synthetic rules and a corpus of urls (mostly allowed, as in real
+group chats).
+
+    python bench/bench_url_rules.py [--rules 5000] [--urls 2000]
+"""
+
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from url_rules import UrlRules
+
+TLDS = ["com", "org", "net", "it", "io", "co.uk"]
+
+
+def make_rules(n: int, rng: random.Random) -> list:
+    rules = []
+    for i in range(n):
+        host = f"site{i}.{rng.choice(TLDS)}"
+        rules.append(f"{host}/section{i % 7}/" if i % 3 == 0 else host)
+    return rules
+
+
+def make_urls(n: int, rules: list, rng: random.Random) -> list:
+    urls = []
+    for i in range(n):
+        if i % 10 == 0:
+            # blocked: subdomain or path under a rule
+            rule = rng.choice(rules)
+            urls.append(f"https://www.{rule.rstrip('/')}/article-{i}")
+        else:
+            host = f"news{i}.{rng.choice(TLDS)}"
+            urls.append(
+                f"https://{host}/2025/03/some-long-article-slug-{i}?utm_source=x"
+            )
+    return urls
+
+
+def bench(name: str, fn, urls: list) -> int:
+    start = time.perf_counter()
+    blocked = sum(1 for url in urls if fn(url))
+    elapsed = time.perf_counter() - start
+    print(f"{name:<12} {elapsed / len(urls) * 1e6:10.2f} us/url  ({blocked} blocked)")
+    return blocked
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rules", type=int, default=5000)
+    parser.add_argument("--urls", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    rules = make_rules(args.rules, rng)
+    urls = make_urls(args.urls, rules, rng)
+
+    start = time.perf_counter()
+    engine = UrlRules(rules)
+    print(f"built {engine.count} rules in {(time.perf_counter() - start) * 1e3:.1f} ms")
+
+    bench("re.search", lambda url: any(re.search(p, url) for p in rules), urls)
+    bench("UrlRules", engine.matches, urls)
+
+
+if __name__ == "__main__":
+    main()
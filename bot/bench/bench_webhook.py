@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Checks for webhook mode (web.py), posting fake updates to the real server
+
+Runs WebServer on a free local port with a webhook that queues updates the
+way ThoughtsBotHandler.receive_update does, and a readiness check that can
+be flipped. Then:
+
+  1. an update with the right secret answers 200 and lands in the queue
+  2. a wrong or missing secret answers 403, nothing is queued
+  3. malformed JSON answers 400, nothing is queued
+  4. /healthz answers, /readyz follows its checks (200, or 503 when one fails)
+  5. a burst of updates from concurrent connections all arrive, in updates/s
+
+Everything runs offline.
+
+    python bench/bench_webhook.py [--updates 2000]
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+import time
+from pathlib import Path
+
+import aiohttp
+from telegram import Update
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from web import SECRET_HEADER, WebServer
+
+PATH = "/telegram"
+SECRET = "s3cret-token"
+
+
+def fake_update(update_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": 1000, "type": "private"},
+            "from": {"id": 1000, "is_bot": False, "first_name": "bench"},
+            "text": f"/start {update_id}",
+        },
+    }
+
+
+async def check_webhook(session, url: str, queue: asyncio.Queue):
+    async def post(secret=None, **kwargs):
+        headers = {} if secret is None else {SECRET_HEADER: secret}
+        async with session.post(url + PATH, headers=headers, **kwargs) as response:
+            return response.status
+
+    assert await post(SECRET, json=fake_update(1)) == 200
+    update = queue.get_nowait()
+    assert isinstance(update, Update) and update.update_id == 1, update
+    assert update.message.text == "/start 1"
+
+    assert await post("wrong", json=fake_update(2)) == 403
+    assert await post(None, json=fake_update(3)) == 403
+    assert await post(SECRET, data=b'{"update_id": 4, ') == 400
+    assert queue.empty(), "rejected calls were queued"
+    print("webhook: 200 and queued with the secret; 403 without/wrong; 400 bad JSON")
+
+
+async def check_health(session, url: str, ready: dict):
+    async with session.get(url + "/healthz") as response:
+        assert response.status == 200 and await response.text() == "ok"
+    async with session.get(url + "/readyz") as response:
+        assert response.status == 200
+        assert await response.json() == {"telegram": True}
+    ready["telegram"] = False
+    async with session.get(url + "/readyz") as response:
+        assert response.status == 503
+        assert await response.json() == {"telegram": False}
+    ready["telegram"] = True
+    print("healthz: ok; readyz: 200 while ready, 503 with a failing check")
+
+
+async def bench_burst(session, url: str, queue: asyncio.Queue, updates: int):
+    headers = {SECRET_HEADER: SECRET}
+    start = time.perf_counter()
+
+    async def post(n: int):
+        async with session.post(url + PATH, headers=headers, json=fake_update(n)):
+            pass
+
+    await asyncio.gather(*(post(n) for n in range(100, 100 + updates)))
+    elapsed = time.perf_counter() - start
+    received = sorted(queue.get_nowait().update_id for _ in range(queue.qsize()))
+    assert received == list(range(100, 100 + updates)), "updates lost"
+    print(f"burst: {updates} updates in {elapsed:.2f}s, {updates / elapsed:.0f}/s")
+
+
+async def main_async(args):
+    logging.basicConfig(level=logging.CRITICAL)
+    queue = asyncio.Queue()
+    ready = {"telegram": True}
+
+    async def receive_update(data: dict):
+        await queue.put(Update.de_json(data, None))
+
+    server = WebServer("127.0.0.1", 0)
+    server.add_readiness_check("telegram", lambda: ready["telegram"])
+    server.add_webhook(PATH, SECRET, receive_update)
+    await server.start()
+    url = f"http://127.0.0.1:{server.port}"
+    try:
+        connector = aiohttp.TCPConnector(limit=50)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            await check_webhook(session, url, queue)
+            await check_health(session, url, ready)
+            await bench_burst(session, url, queue, args.updates)
+    finally:
+        await server.stop()
+    print("all checks passed")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=2000)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Checks that back-to-back dispatches all land when bot_gen.yml runs overlap
+
+bot_gen.yml has no concurrency group (GitHub would cancel pending runs), so
+every dispatch gets its own run and they race to push. This runs the
+workflow's "Process content, commit and push" script, taken from the
+workflow file, once per event in its own clone of a local bare repository.
+All clones are made before any run pushes, like runs started together.
+The events are:
+
+  - add_batch events with a few thoughts each
+  - the parts of a large entry (add_chunk, see payload_codec.py), one
+    event each, up to MAX_PARTS back to back
+  - an edit and a delete of entries other events add, which may run before
+    the entry is pushed and then wait in src/bot_gen/_deferred/
+
+Then checks that the branch has every entry, the large one assembled, the
+edit and the delete applied, and nothing left deferred. Also checks that a
+deferred operation whose entry never shows up is dropped after DEFER_TTL.
+Everything runs offline (git and bash needed).
+
+    python bench/bench_workflow_runs.py [--batches 12] [--parts 16]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import string
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+import uuid
+from pathlib import Path
+
+BOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BOT_DIR))
+
+from bot_gen_writer import (
+    DEFER_TTL,
+    DEFERRED_DIR,
+    DELETE_ACTION,
+    EDIT_ACTION,
+    apply_deferred,
+    defer_operation,
+    entry_text,
+    git_blob_sha,
+    render_entry,
+)
+from github_client import MAX_PAYLOAD_BYTES
+from payload_codec import MAX_PARTS
+from storage import BATCH_EVENT, DispatchBackend
+
+WORKFLOW = BOT_DIR.parent / ".github" / "workflows" / "bot_gen.yml"
+STEP = "- name: Process content, commit and push"
+
+
+def workflow_script() -> str:
+    """The shell script of the commit step, as the runner would get it"""
+    lines = WORKFLOW.read_text().splitlines()
+    start = next(i for i, line in enumerate(lines) if line.strip() == STEP)
+    start = next(i for i in range(start, len(lines)) if lines[i].strip() == "run: |")
+    indent = len(lines[start]) - len(lines[start].lstrip()) + 2
+    body = []
+    for line in lines[start + 1 :]:
+        if line.strip() and len(line) - len(line.lstrip()) < indent:
+            break
+        body.append(line)
+    script = textwrap.dedent("\n".join(body))
+    return script.replace("${{ github.event.repository.default_branch }}", "main")
+
+
+def git(*args, cwd: Path, env: dict = None):
+    subprocess.run(
+        ["git", *args], cwd=cwd, env=env, check=True, capture_output=True, text=True
+    )
+
+
+def thought(n: int, content: str = None) -> dict:
+    return {
+        "action": "add_thought",
+        "author": "bench",
+        "css_class": "default",
+        "datetime": f"2025-03-07T19:{n // 60 % 60:02d}:{n % 60:02d}",
+        "content": content or f"thought number {n}",
+        "dispatch_id": uuid.uuid4().hex,
+    }
+
+
+def operation(action: str, entry: dict, **extra) -> dict:
+    payload = {k: v for k, v in entry.items() if k != "action"}
+    folder, stem, text = render_entry(entry["action"], payload)
+    op = {"action": action, "target": f"{folder}/{stem}", "sha": git_blob_sha(text)}
+    return {**op, **extra, "dispatch_id": uuid.uuid4().hex}
+
+
+def make_events(batches: int, parts: int, rng: random.Random) -> tuple:
+    """(events, thoughts that should be there in the end, edited, deleted)"""
+    backend = DispatchBackend(client=None)
+    events, entries = [], []
+    for b in range(batches):
+        batch = [thought(b * 3 + k) for k in range(3)]
+        entries += batch
+        events.append({"action": BATCH_EVENT, "client_payload": {"entries": batch}})
+
+    # sized so it takes `parts` dispatches, and hardly compresses
+    size = (parts - 1) * MAX_PAYLOAD_BYTES // 2
+    large = thought(9999, "".join(rng.choices(string.ascii_letters, k=size)))
+    entries.append(large)
+    for payload in backend.payloads([large]):
+        events.append({"action": BATCH_EVENT, "client_payload": {"entries": payload}})
+
+    edited, deleted = entries[0], entries[4]
+    ops = [
+        operation(EDIT_ACTION, edited, fields={"content": "edited"}),
+        operation(DELETE_ACTION, deleted),
+    ]
+    # dispatched last, the bot only sends them once the entries went out
+    events.append({"action": BATCH_EVENT, "client_payload": {"entries": ops}})
+    return events, entries, edited, deleted
+
+
+async def run_workflow(script: str, clone: Path, event: dict) -> int:
+    """One run, returns how many push attempts it took"""
+    temp = clone.parent / f"{clone.name}-temp"
+    temp.mkdir()
+    (temp / "event.json").write_text(json.dumps(event))
+    env = {
+        **os.environ,
+        # the script sets global git config, each runner has its own
+        "HOME": str(temp),
+        "GITHUB_EVENT_PATH": str(temp / "event.json"),
+        "GITHUB_OUTPUT": str(temp / "github_output"),
+        "RUNNER_TEMP": str(temp),
+        "RUN_STARTED": "2025-03-07T19:00:00.000Z",
+    }
+    proc = await asyncio.create_subprocess_exec(
+        "bash",
+        "-e",
+        "-c",
+        script,
+        cwd=clone,
+        env=env,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+    )
+    output, _ = await proc.communicate()
+    output = output.decode()
+    assert proc.returncode == 0, f"run failed:\n{output}"
+    return 1 + output.count("push rejected, retrying on the new head")
+
+
+def landed(origin: Path, work: Path) -> dict:
+    """{dispatch_id: data} of every thought on the branch, and leftovers"""
+    git("clone", "-q", str(origin), str(work), cwd=origin.parent)
+    content = work / "src" / "bot_gen"
+    thoughts = {}
+    for path in content.glob("thoughts/*/*.json"):
+        data = json.loads(path.read_text())
+        thoughts[data["dispatch_id"]] = data
+    leftovers = [str(p) for p in content.glob(f"{DEFERRED_DIR}/*.json")]
+    leftovers += [str(p) for p in content.glob("_chunks/*/*.json")]
+    return thoughts, leftovers
+
+
+async def check_runs(tmp: Path, batches: int, parts: int):
+    rng = random.Random(7)
+    events, entries, edited, deleted = make_events(batches, parts, rng)
+    home = tmp / "home"
+    home.mkdir()
+    origin, seed = tmp / "origin.git", tmp / "seed"
+    git("init", "-q", "--bare", "-b", "main", str(origin), cwd=tmp)
+    git("init", "-q", "-b", "main", str(seed), cwd=tmp)
+    shutil.copytree(
+        BOT_DIR,
+        seed / "bot",
+        ignore=shutil.ignore_patterns("bench", "old", "__pycache__"),
+    )
+    (seed / "src" / "bot_gen").mkdir(parents=True)
+    (seed / "src" / "bot_gen" / ".gitkeep").touch()
+    (seed / "public" / "search").mkdir(parents=True)
+    (seed / "public" / "search" / ".gitkeep").touch()
+    env = {**os.environ, "HOME": str(home)}
+    git("config", "--global", "user.name", "bench", cwd=seed, env=env)
+    git("config", "--global", "user.email", "bench@example.com", cwd=seed, env=env)
+    git("add", "-A", cwd=seed, env=env)
+    git("commit", "-q", "-m", "seed", cwd=seed, env=env)
+    git("push", "-q", str(origin), "main", cwd=seed, env=env)
+
+    # every run checks out the same head before any of them pushes
+    clones = []
+    for n in range(len(events)):
+        clone = tmp / f"run-{n}"
+        git("clone", "-q", str(origin), str(clone), cwd=tmp, env=env)
+        clones.append(clone)
+    script = workflow_script()
+    start = time.perf_counter()
+    attempts = await asyncio.gather(
+        *(run_workflow(script, clone, event) for clone, event in zip(clones, events)),
+        return_exceptions=True,
+    )
+    # let every run finish before reporting one that failed
+    for result in attempts:
+        if isinstance(result, BaseException):
+            raise result
+    elapsed = time.perf_counter() - start
+
+    thoughts, leftovers = landed(origin, tmp / "result")
+    expected = {e["dispatch_id"] for e in entries} - {deleted["dispatch_id"]}
+    assert thoughts.keys() == expected, (
+        f"missing {len(expected - thoughts.keys())}, "
+        f"unexpected {len(thoughts.keys() - expected)}"
+    )
+    assert thoughts[edited["dispatch_id"]]["content"] == "edited", "edit lost"
+    large = next(e for e in entries if e["datetime"].endswith("46:39"))
+    assert thoughts[large["dispatch_id"]]["content"] == large["content"]
+    assert not leftovers, leftovers
+    chunk_events = len(events) - batches - 1
+    print(
+        f"{len(events)} overlapping runs ({batches} batches, {chunk_events} parts "
+        f"of a large entry, 1 edit + delete): all landed in {elapsed:.1f}s, "
+        f"up to {max(attempts)} push attempts per run"
+    )
+
+
+def check_expiry(tmp: Path):
+    root = tmp / "expiry"
+    entry = thought(1)
+    op = operation(EDIT_ACTION, entry, fields={"content": "never applied"})
+    assert defer_operation(op, root) and not defer_operation(op, root)
+    now = time.time()
+    assert apply_deferred(root, now) == ([], 0), "dropped too early"
+    assert apply_deferred(root, now + DEFER_TTL + 1) == ([], 1)
+    assert not list((root / DEFERRED_DIR).glob("*.json"))
+    # and one whose entry showed up meanwhile is applied
+    defer_operation(op, root)
+    folder, stem, text = render_entry("add_thought", {**entry})
+    (root / folder).mkdir(parents=True)
+    (root / folder / f"{stem}.json").write_text(text)
+    applied, dropped = apply_deferred(root, now)
+    assert [o["target"] for o in applied] == [op["target"]] and not dropped
+    data = json.loads((root / folder / f"{stem}.json").read_text())
+    assert data["content"] == "never applied"
+    assert git_blob_sha(entry_text(data)) != op["sha"]
+    print("deferred operations: applied once their entry is there, dropped after TTL")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batches", type=int, default=12)
+    parser.add_argument("--parts", type=int, default=MAX_PARTS)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        check_expiry(tmp)
+        asyncio.run(check_runs(tmp, args.batches, args.parts))
+    print("all checks passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,18 @@
 #!/usr/bin/env python3
+import asyncio
 import datetime
+import functools
 import json
 import logging
-import re
+import signal
 from pathlib import Path
+from urllib.parse import urlsplit
 
-import aiohttp
 from telegram import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.constants import ParseMode
 from telegram.ext import (
     Application,
+    ApplicationBuilder,
     CallbackQueryHandler,
     CommandHandler,
     ContextTypes,
@@ -18,6 +21,31 @@ from telegram.ext import (
     filters,
 )
 
+from backlog import backlog_batches, split_backlog
+from bot_gen_writer import DELETE_ACTION, EDIT_ACTION, EDITABLE
+from config_store import ConfigStore
+from dispatch_queue import DispatchBatcher
+from entry_index import EntryIndex
+from github_client import GitHubClient
+from images import ImagePipeline
+from link_digest import MAX_DIGEST_LINKS, LinkDigest
+from link_rot import LinkRotChecker
+from metadata import MetadataFetcher
+from metrics import Metrics, track_handler
+from outbox import Outbox
+from payload_codec import PayloadTooLarge
+from pending_links import PendingLinks
+from press_index import PressIndex
+from quota import NOTIFY, QuotaManager
+from state_persistence import StatePersistence
+from storage import DispatchBackend, GitDataBackend
+from tracing import Tracer
+from update_lanes import ChatLaneProcessor
+from url_entities import HAS_URL, extract_urls
+from url_rules import UrlBlacklist
+from urls import canonicalize, resolve_short_url
+from web import WebServer
+
 # States
 CONTENT = 1
 USERNAME_CONFIRM = 2
@@ -25,16 +53,12 @@ AUTHOR_INPUT = 3
 PREVIEW = 4
 CSS_INPUT = 5  # New state for CSS class input
 
-# Message pattern
-URL_REGEX = (
-    r"http[s]?:\/\/(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\(\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+"
-)
-
-# Blacklisted URL patterns
+# Blacklisted URL rules (host suffix + optional path prefix), used when
+# blacklist.txt doesn't exist
 BLACKLISTED_URLS = [
-    r"instagram.com/reels/",
-    r"youtube.com/shorts/",
-    r"tiktok.com",
+    "instagram.com/reels/",
+    "youtube.com/shorts/",
+    "tiktok.com",
 ]
 
 # Callback data
@@ -45,10 +69,34 @@ OK = "ok"
 APPROVE = "approve"  # New callback data for chat approval
 APPROVE_LINK = "approve_link"  # New callback data for link approval
 REJECT_LINK = "reject_link"  # New callback data for link rejection
+DIGEST_TOGGLE = "digest_toggle"
+DIGEST_APPROVE = "digest_approve"
+DIGEST_REJECT = "digest_reject"
+CHECKED = "✅"
+UNCHECKED = "❌"
+# Telegram's limit for message text
+MAX_MESSAGE_LENGTH = 4096
+# error notifications waiting for the admin chat's rate limit, more are dropped
+MAX_QUEUED_NOTIFICATIONS = 5
+# where press_index says an approved link is until a pull shows it published
+NOT_YET_PULLED = "approved, not yet pulled"
 
 # File paths
 CREDENTIALS_FILE = Path("./credentials.json")
 CONFIG_FILE = Path("./config.json")
+OUTBOX_FILE = Path("./outbox.sqlite3")
+PENDING_LINKS_FILE = Path("./pending_links.sqlite3")
+BLACKLIST_FILE = Path("./blacklist.txt")
+METADATA_CACHE_FILE = Path("./metadata_cache.sqlite3")
+LINK_CHECKS_FILE = Path("./link_checks.sqlite3")
+# which message became which entry, for /edit and /delete
+ENTRY_INDEX_FILE = Path("./entries.sqlite3")
+# conversation states, drafts and pending admin input
+STATE_FILE = Path("./state.sqlite3")
+# photo variants waiting to be committed, laid out like CONTENT_DIR
+MEDIA_DIR = Path("./media")
+# the bot runs from bot/ inside a checkout of the website repo
+CONTENT_DIR = Path("../src/bot_gen")
 
 # Loading credentials
 if not CREDENTIALS_FILE.exists():
@@ -62,29 +110,53 @@ with open(CREDENTIALS_FILE) as f:
     DEVELOPER_CHAT_ID = credentials["admin_chat_id"]
     REPO = credentials["github_repo"]
     GH_TOKEN = credentials["github_token"]
-
-
-def load_config():
-    """Load config file or return empty dict if not exists"""
-    try:
-        with open(CONFIG_FILE) as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {}
-
-
-def save_config(config):
-    """Save config to file"""
-    with open(CONFIG_FILE, "w") as f:
-        json.dump(config, f, indent=4)
+    # entries approved within this many seconds are committed together
+    DISPATCH_WINDOW = credentials.get("dispatch_window_seconds", 2.0)
+    # "dispatch" (repository_dispatch + bot_gen.yml) or "git" (Git Data API)
+    STORAGE_BACKEND = credentials.get("storage_backend", "dispatch")
+    GITHUB_BRANCH = credentials.get("github_branch", "main")
+    GITHUB_API_URL = credentials.get("github_api_url", "https://api.github.com")
+    # "polling" (default) or "webhook"
+    BOT_MODE = credentials.get("mode", "polling")
+    WEBHOOK_URL = credentials.get("webhook_url")
+    WEBHOOK_SECRET = credentials.get("webhook_secret")
+    WEBHOOK_MAX_CONNECTIONS = credentials.get("webhook_max_connections", 40)
+    # updates handled at the same time (different chats only), 1 = sequential
+    CONCURRENT_UPDATES = credentials.get("concurrent_updates", 16)
+    # > 0: announce new links to the admin in one message per window (or
+    # per admin_digest_max_links links) instead of one message per link
+    ADMIN_DIGEST_WINDOW = credentials.get("admin_digest_window_seconds", 0)
+    ADMIN_DIGEST_MAX_LINKS = credentials.get("admin_digest_max_links", 10)
+    # how often changed conversation/user state is written to STATE_FILE
+    STATE_FLUSH_INTERVAL = credentials.get("state_flush_seconds", 5)
+    # on startup, process what queued up while the bot was down in one go,
+    # dropping messages older than catchup_max_age_seconds
+    CATCHUP = credentials.get("catchup", True)
+    CATCHUP_MAX_AGE = credentials.get("catchup_max_age_seconds", 24 * 3600)
+    # processes encoding photo variants, default one per core
+    IMAGE_WORKERS = credentials.get("image_workers")
+    # re-check every selected_press link this often, 0 = only on /checklinks
+    LINK_CHECK_INTERVAL = credentials.get("link_check_interval_days", 7)
+    # embedded web server (webhook + /healthz, /readyz); in polling mode it
+    # only runs if http_port is set
+    HTTP_LISTEN = credentials.get("http_listen", "127.0.0.1")
+    HTTP_PORT = credentials.get("http_port")
+    HTTP_CERT = credentials.get("http_cert")
+    HTTP_KEY = credentials.get("http_key")
+    # spans of every update, from Telegram to the commit (see tracing.py),
+    # appended here as OTLP/JSON; "" turns tracing off
+    TRACE_LOG = credentials.get("trace_log", "traces.jsonl")
+    # overrides of quota.py's LIMITS, {"group_chat": [calls per second, burst]}
+    RATE_LIMITS = credentials.get("rate_limits", {})
 
 
 def check_enabled(func):
     """Decorator to check if user is authorized"""
 
+    @functools.wraps(func)
     async def wrapper(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = str(update.effective_chat.id)
-        config = load_config()
+        config = self.config_store.load()
 
         if user_id in config:
             return await func(self, update, context)
@@ -107,61 +179,244 @@ def format_datetime(t: datetime):
 #     "css_class": css_class,
 #     "content": context.user_data["content"],
 # },
-# "selected_press", {"url": url, "datetime": now_str, "title": url}
-
-
-async def trigger_github_action(
-    event_type: str,
-    payload: dict,
-) -> bool:
-    """
-    Trigger GitHub Action to save content via repository_dispatch event
-
-    Args:
-        github_token: GitHub Personal Access Token
-        payload: Additional payload data for thought entries
-
-    Returns:
-        bool: True if successful, False otherwise
-    """
-    headers = {
-        "Accept": "application/vnd.github+json",
-        "Authorization": f"Bearer {GH_TOKEN}",
-    }
-
-    data = {
-        "event_type": event_type,
-        "client_payload": payload,
-    }
-
-    logging.info(f"Attempting to run action {event_type} for payload {payload}")
-
-    # remember, 64kb max
-    try:
-        async with aiohttp.ClientSession() as session:
-            url = f"https://api.github.com/repos/{REPO}/dispatches"
-            async with session.post(url, headers=headers, json=data) as response:
-                logging.info(f"github responded: {response.status}")
-                return (
-                    response.status == 204
-                )  # GitHub returns 204 No Content on success
-    except Exception as e:
-        logging.error(f"Error triggering GitHub Action: {e}")
-        return False
+# "selected_press", {"url": url, "datetime": now_str, "title": title, "description": ..., "image": ...}
 
 
 class ThoughtsBotHandler:
-    def __init__(self):
-        self.application = Application.builder().token(TOKEN).build()
-        self.config = load_config()
+    def __init__(
+        self,
+        builder: ApplicationBuilder = None,
+        concurrent_updates: int = CONCURRENT_UPDATES,
+    ):
+        # benchmarks pass their own builder (e.g. with a fake request)
+        if builder is None:
+            builder = Application.builder().token(TOKEN)
+        self.update_lanes = ChatLaneProcessor(concurrent_updates)
+        self.metrics = Metrics()
+        self.quota = QuotaManager(RATE_LIMITS, metrics=self.metrics)
+        self.application = (
+            builder.concurrent_updates(self.update_lanes)
+            .rate_limiter(self.quota)
+            .persistence(StatePersistence(STATE_FILE, STATE_FLUSH_INTERVAL))
+            .build()
+        )
+        self.tracer = Tracer(TRACE_LOG)
+        self.config_store = ConfigStore(CONFIG_FILE)
         self.github_token = credentials.get("github_token")
         if not self.github_token:
             raise ValueError("GitHub token not found in credentials")
+        self.github = GitHubClient(
+            self.github_token,
+            REPO,
+            GITHUB_API_URL,
+            metrics=self.metrics,
+            quota=self.quota,
+        )
+        self.dispatcher = DispatchBatcher(self.setup_storage(), window=DISPATCH_WINDOW)
+        self.pending_links = PendingLinks(PENDING_LINKS_FILE)
+        self.blacklist = UrlBlacklist(BLACKLIST_FILE, BLACKLISTED_URLS)
+        self.metadata = MetadataFetcher(METADATA_CACHE_FILE)
+        self.images = ImagePipeline(MEDIA_DIR, IMAGE_WORKERS)
+        self.press_index = PressIndex(CONTENT_DIR / "selected_press")
+        self.entry_index = EntryIndex(ENTRY_INDEX_FILE, CONTENT_DIR)
+        self.link_checker = LinkRotChecker(
+            LINK_CHECKS_FILE,
+            CONTENT_DIR / "selected_press",
+            interval=LINK_CHECK_INTERVAL * 24 * 3600,
+            on_report=self.send_link_report,
+        )
+        self.digest = None
+        if ADMIN_DIGEST_WINDOW:
+            self.digest = LinkDigest(
+                self.send_link_digest, ADMIN_DIGEST_WINDOW, ADMIN_DIGEST_MAX_LINKS
+            )
+        self.outbox = Outbox(
+            OUTBOX_FILE,
+            self.dispatcher,
+            on_delivered=self.dispatch_delivered,
+            on_failed=self.dispatch_failed,
+            tracer=self.tracer,
+        )
+        self.setup_metrics()
+        self.web = self.setup_web()
         self.setup_handlers()
 
+    def setup_metrics(self):
+        """Values read at scrape time, handler/GitHub metrics fill themselves"""
+        self.metrics.gauge(
+            "bot_pending_links",
+            "Links waiting for admin approval",
+            lambda: len(self.pending_links),
+        )
+        self.metrics.gauge(
+            "bot_outbox_entries",
+            "Entries not yet accepted by GitHub",
+            lambda: len(self.outbox),
+        )
+        self.metrics.read_counter(
+            "bot_config_reloads_total",
+            "Times config.json was (re)read",
+            lambda: self.config_store.reloads,
+        )
+        self.metrics.read_counter(
+            "bot_blacklist_reloads_total",
+            "Times the url blacklist was (re)loaded",
+            lambda: self.blacklist.reloads,
+        )
+        self.metrics.read_counter(
+            "bot_state_rows_written_total",
+            "Rows written to the state database since start",
+            lambda: self.application.persistence.rows_written,
+        )
+        self.metrics.gauge(
+            "bot_updates_in_progress",
+            "Updates being processed right now",
+            lambda: self.update_lanes.current_concurrent_updates,
+        )
+        self.metrics.gauge(
+            "bot_api_calls_waiting",
+            "Telegram/GitHub calls waiting for their rate limits",
+            lambda: self.quota.waiting(),
+        )
+        self.metrics.gauge(
+            "bot_updates_parked",
+            "Updates waiting for an earlier update of the same chat",
+            lambda: len(self.update_lanes),
+        )
+
+    def setup_storage(self):
+        """Pick the storage backend configured in credentials"""
+        # photos are committed through the Git Data API with either backend
+        git = GitDataBackend(self.github, GITHUB_BRANCH, MEDIA_DIR)
+        if STORAGE_BACKEND == "dispatch":
+            return DispatchBackend(self.github, media=git)
+        if STORAGE_BACKEND == "git":
+            return git
+        raise ValueError(f"Unknown storage backend {STORAGE_BACKEND!r}")
+
+    def setup_web(self):
+        """Create the embedded web server, if this mode needs one"""
+        if BOT_MODE not in ("polling", "webhook"):
+            raise ValueError(f"Unknown bot mode {BOT_MODE!r}")
+        if BOT_MODE == "polling" and not HTTP_PORT:
+            return None
+
+        web = WebServer(HTTP_LISTEN, HTTP_PORT or 8080, HTTP_CERT, HTTP_KEY)
+        web.add_readiness_check("telegram", lambda: self.application.running)
+        web.add_readiness_check("github", lambda: self.github.session is not None)
+        web.add_metrics(self.metrics.render)
+        if BOT_MODE == "webhook":
+            if not WEBHOOK_URL or not WEBHOOK_SECRET:
+                raise ValueError("webhook mode needs webhook_url and webhook_secret")
+            web.add_webhook(
+                urlsplit(WEBHOOK_URL).path or "/", WEBHOOK_SECRET, self.receive_update
+            )
+        return web
+
+    async def receive_update(self, data: dict):
+        """Webhook callback: hand the update to the application"""
+        await self.application.update_queue.put(
+            Update.de_json(data, self.application.bot)
+        )
+
+    async def post_init(self, application: Application):
+        """Open long-lived resources once the application is up"""
+        await self.tracer.start()
+        await self.github.start()
+        await self.metadata.start()
+        await self.dispatcher.start()
+        await self.outbox.start()
+        await self.link_checker.start()
+        if self.web is not None:
+            await self.web.start()
+
+    async def catch_up(self):
+        """
+        Work through the updates queued while the bot was down
+
+        Instead of trickling in at normal pace, the backlog is fetched in full
+        batches and run through the update processor all at once (still in
+        order per chat). Links detected in it are announced in one digest
+        (deduplicated like always), and messages older than CATCHUP_MAX_AGE
+        are dropped, so recovery takes about as long as the backlog's distinct
+        links need to be fetched, not one round trip per update.
+
+        Runs once the application is started, before polling or the webhook
+        begins. Telegram only forgets a batch once it is processed.
+        """
+        start = asyncio.get_running_loop().time()
+        # getUpdates doesn't work while a webhook is set, serve() sets it again
+        await self.application.bot.delete_webhook()
+
+        # flushed when full or at the end, the window is just an upper bound
+        digest = LinkDigest(self.send_link_digest, 3600, MAX_DIGEST_LINKS)
+        previous, self.digest = self.digest, digest
+        processed = dropped = 0
+        try:
+            processor = self.application.update_processor
+            async for batch in backlog_batches(self.application.bot):
+                updates, stale = split_backlog(batch, CATCHUP_MAX_AGE)
+                await asyncio.gather(
+                    *(
+                        processor.process_update(
+                            update, self.application.process_update(update)
+                        )
+                        for update in updates
+                    )
+                )
+                await self.update_lanes.join()
+                processed += len(updates)
+                dropped += stale
+        finally:
+            self.digest = previous
+            self.forget_unannounced(await digest.close())
+        if processed or dropped:
+            logging.info(
+                f"Caught up on {processed} updates ({dropped} older than "
+                f"{CATCHUP_MAX_AGE}s dropped) in "
+                f"{asyncio.get_running_loop().time() - start:.1f}s"
+            )
+
+    async def post_stop(self, application: Application):
+        """
+        Finish what reports back through the bot while it can still send
+        messages: the outbox's last deliveries (their callbacks edit the
+        original messages) and buffered links
+        """
+        await self.outbox.close()
+        if self.digest is not None:
+            self.forget_unannounced(await self.digest.close())
+
+    def forget_unannounced(self, items: list):
+        """
+        Drop digest links the admin never got to see from the pending ones,
+        so they're announced again the next time someone shares them
+        """
+        for item in items:
+            self.pending_links.pop(item["id"])
+        if items:
+            logging.warning(f"Forgot {len(items)} links whose digest wasn't sent")
+
+    async def post_shutdown(self, application: Application):
+        """Release long-lived resources"""
+        if self.web is not None:
+            await self.web.stop()
+        await self.dispatcher.close()
+        await self.github.close()
+        await self.metadata.close()
+        await self.images.close()
+        await self.link_checker.close()
+        self.pending_links.close()
+        self.entry_index.close()
+        await self.tracer.close()
+
     def setup_handlers(self):
         """Set up all command and conversation handlers"""
         self.application.add_handler(CommandHandler("addchat", self.add_chat))
+        self.application.add_handler(CommandHandler("ghstats", self.github_stats))
+        self.application.add_handler(CommandHandler("checklinks", self.check_links))
+        self.application.add_handler(CommandHandler("edit", self.edit_entry))
+        self.application.add_handler(CommandHandler("delete", self.delete_entry))
 
         # Chat registration handler
         self.application.add_handler(
@@ -188,6 +443,8 @@ class ThoughtsBotHandler:
                     ],
                 },
                 fallbacks=[CommandHandler("cancel", self.cancel)],
+                name="chat_registration",
+                persistent=True,
             )
         )
 
@@ -198,7 +455,11 @@ class ThoughtsBotHandler:
                     MessageHandler(
                         filters.TEXT & ~filters.COMMAND & filters.ChatType.PRIVATE,
                         self.start_thought,
-                    )
+                    ),
+                    # photo with the thought as its caption
+                    MessageHandler(
+                        filters.PHOTO & filters.ChatType.PRIVATE, self.start_thought
+                    ),
                 ],
                 states={
                     USERNAME_CONFIRM: [
@@ -212,6 +473,8 @@ class ThoughtsBotHandler:
                     PREVIEW: [CallbackQueryHandler(self.handle_preview_choice)],
                 },
                 fallbacks=[CommandHandler("cancel", self.cancel)],
+                name="thought",
+                persistent=True,
             )
         )
 
@@ -221,7 +484,7 @@ class ThoughtsBotHandler:
                 (
                     filters.ChatType.GROUPS | filters.ChatType.SUPERGROUP
                 )  # Only in groups
-                & filters.Regex(URL_REGEX)  # Match URLs
+                & HAS_URL  # url entities in text or caption
                 & ~filters.COMMAND,  # Ignore commands
                 self.handle_url_detection,
             )
@@ -239,8 +502,22 @@ class ThoughtsBotHandler:
             )
         )
 
+        # Digest mode: one message with a toggle per link
+        self.application.add_handler(
+            CallbackQueryHandler(
+                self.handle_digest_toggle, pattern=f"^{DIGEST_TOGGLE}:.*$"
+            )
+        )
+        self.application.add_handler(
+            CallbackQueryHandler(
+                self.handle_digest_decision,
+                pattern=f"^({DIGEST_APPROVE}|{DIGEST_REJECT})$",
+            )
+        )
+
         self.application.add_error_handler(self.error_handler)
 
+    @track_handler
     @check_enabled
     async def start_thought(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Start the thought creation process"""
@@ -248,15 +525,25 @@ class ThoughtsBotHandler:
         if update.effective_chat.type != "private":
             return ConversationHandler.END
 
-        context.user_data["content"] = update.message.text
+        context.user_data["content"] = (
+            update.message.text or update.message.caption or ""
+        )
+        # replying to it later with /edit or /delete finds the entry
+        context.user_data["message_id"] = update.message.message_id
+        # largest size Telegram made of the photo, downloaded when submitted
+        context.user_data["photo"] = (
+            update.message.photo[-1].file_id if update.message.photo else None
+        )
         context.user_data["creation_time"] = (
             datetime.datetime.now()
         )  # doesn't deal with timezones
 
         # Get user's saved name from config
-        config = load_config()
+        config = self.config_store.load()
         chat_id = str(update.effective_chat.id)
         current_thoughts_author = config[chat_id]["thoughts_author"]
+        # show_preview reads it from here when the user keeps this name
+        context.user_data["thoughts_author"] = current_thoughts_author
         await update.message.reply_text(
             f"You are saved as: {current_thoughts_author}\nWould you like to continue with this name?",
             reply_markup=InlineKeyboardMarkup(
@@ -270,6 +557,7 @@ class ThoughtsBotHandler:
         )
         return USERNAME_CONFIRM
 
+    @track_handler
     async def handle_username_confirm(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
     ):
@@ -283,6 +571,7 @@ class ThoughtsBotHandler:
             await query.edit_message_text("Please enter your new name:")
             return AUTHOR_INPUT
 
+    @track_handler
     async def save_custom_author(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
     ):
@@ -291,10 +580,9 @@ class ThoughtsBotHandler:
         chat_id = str(update.effective_chat.id)
 
         # Update config with new default author
-        config = load_config()
-        config[chat_id]["thoughts_author"] = new_name
+        async with self.config_store.edit() as config:
+            config[chat_id]["thoughts_author"] = new_name
         context.user_data["thoughts_author"] = new_name
-        save_config(config)
 
         return await self.show_preview(update, context)
 
@@ -304,9 +592,12 @@ class ThoughtsBotHandler:
         author = context.user_data["thoughts_author"]
         time = context.user_data["creation_time"]
 
+        photo = "Photo: attached\n" if context.user_data.get("photo") else ""
+
         preview = (
             "Preview of your thought:\n\n"
             f"Content: {content}\n"
+            f"{photo}"
             f"Author: {author}\n"
             f"Time: {format_datetime(time)}"
         )
@@ -328,6 +619,7 @@ class ThoughtsBotHandler:
 
         return PREVIEW
 
+    @track_handler
     async def handle_preview_choice(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
     ):
@@ -347,41 +639,105 @@ class ThoughtsBotHandler:
         now_str = format_datetime(now)
 
         # Get chat's css_class from config
-        config = load_config()
+        config = self.config_store.load()
         chat_id = str(update.effective_chat.id)
         css_class = config.get(chat_id, {}).get("css_class", "default")
 
+        payload = {
+            "author": context.user_data["thoughts_author"],
+            "css_class": css_class,
+            "datetime": now_str,
+            "content": context.user_data["content"],
+        }
+
+        # compressed and split into several dispatches if needed, this only
+        # fails for something absurdly long
+        try:
+            self.dispatcher.backend.check({"action": "add_thought", **payload})
+        except PayloadTooLarge as e:
+            logging.error(f"Thought too large to save: {e}")
+            await update.callback_query.edit_message_text(
+                f"This thought is too large to save ({e}), please shorten it."
+            )
+            return ConversationHandler.END
+
+        if context.user_data.get("photo"):
+            message = await update.callback_query.edit_message_text(
+                "Processing photo..."
+            )
+            try:
+                photo = await self.application.bot.get_file(context.user_data["photo"])
+                payload["image"], payload["media"] = await self.images.process(
+                    photo.file_path, f"thoughts/{now_str[:7]}", now_str
+                )
+            except Exception as e:
+                logging.error(f"Error processing photo: {e}")
+                await message.edit_text(f"Error processing photo: {e}")
+                return ConversationHandler.END
+
         logging.info(f"Triggering GitHub Action to save thought")
-        await update.callback_query.edit_message_text("Saving thought...")
+        message = await update.callback_query.edit_message_text("Saving thought...")
 
-        # Trigger GitHub Action
-        success = await trigger_github_action(
+        # Queue the GitHub Action, the outbox worker reports back on this message
+        dispatch_id = self.outbox.enqueue(
             "add_thought",
-            {
-                "author": context.user_data["thoughts_author"],
-                "css_class": css_class,
-                "datetime": now_str,
-                "content": context.user_data["content"],
+            payload,
+            notify={
+                "chat_id": message.chat_id,
+                "message_id": message.message_id,
+                "delivered": "Thought action submitted successfully!",
+                "failed": "Error saving thought via GitHub API, will keep retrying",
             },
         )
+        self.entry_index.record(
+            "add_thought",
+            payload,
+            dispatch_id,
+            [
+                (chat_id, context.user_data.get("message_id")),
+                (message.chat_id, message.message_id),
+            ],
+        )
 
-        if success:
-            await update.callback_query.edit_message_text(
-                "Thought action submitted successfully!"
-            )
-        else:
-            error_msg = "Error saving thought via GitHub API"
-            await update.callback_query.edit_message_text(error_msg)
-            await self.application.bot.send_message(
-                chat_id=DEVELOPER_CHAT_ID, text=error_msg
+        return ConversationHandler.END
+
+    async def dispatch_delivered(self, entry: dict):
+        """Outbox callback: tell the original message its entry went through"""
+        self.images.discard(entry["payload"].get("media", ()))
+        # an /edit or /delete only counts once it's on its way to the repo
+        before = self.entry_index.confirm(entry["id"])
+        if before and entry["action"] == DELETE_ACTION and before["data"].get("url"):
+            self.press_index.remove(before["data"]["url"])
+        notify = entry["notify"]
+        if notify:
+            await self.application.bot.edit_message_text(
+                notify["delivered"],
+                chat_id=notify["chat_id"],
+                message_id=notify["message_id"],
             )
 
-        return ConversationHandler.END
+    async def dispatch_failed(self, entry: dict):
+        """Outbox callback: report the first failure, retries happen silently"""
+        if entry["attempts"] != 1:
+            return
+        notify = entry["notify"]
+        error_msg = f"Dispatch {entry['id']} failed: {entry['last_error']}"
+        if notify:
+            await self.application.bot.edit_message_text(
+                notify["failed"],
+                chat_id=notify["chat_id"],
+                message_id=notify["message_id"],
+            )
+            error_msg = notify["failed"]
+        await self.application.bot.send_message(
+            chat_id=DEVELOPER_CHAT_ID, text=error_msg, rate_limit_args=NOTIFY
+        )
 
+    @track_handler
     async def add_chat(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Request to add a new chat"""
         chat_id = str(update.effective_chat.id)
-        config = load_config()
+        config = self.config_store.load()
 
         if chat_id in config:
             await update.message.reply_text("This chat is already registered!")
@@ -416,6 +772,7 @@ class ThoughtsBotHandler:
                     ]
                 ]
             ),
+            rate_limit_args=NOTIFY,
         )
 
         # Custom message based on chat type
@@ -432,6 +789,7 @@ class ThoughtsBotHandler:
 
         await update.message.reply_text(user_message)
 
+    @track_handler
     async def handle_chat_refusal(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
     ):
@@ -472,6 +830,7 @@ class ThoughtsBotHandler:
         except Exception as e:
             raise Exception(f"Failed to notify chat {chat_desc}: {e}")
 
+    @track_handler
     async def handle_chat_approval(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
     ):
@@ -488,8 +847,6 @@ class ThoughtsBotHandler:
         except ValueError:
             raise Exception("Invalid callback data format in handle_chat_approval")
 
-        config = load_config()
-
         # For private chats, request CSS class
         if chat_type == "private":
             # Store chat info for CSS handler
@@ -506,8 +863,8 @@ class ThoughtsBotHandler:
             return CSS_INPUT
 
         # For group chats, approve immediately
-        config[chat_id] = {"chat_name": chat_name, "type": chat_type}
-        save_config(config)
+        async with self.config_store.edit() as config:
+            config[chat_id] = {"chat_name": chat_name, "type": chat_type}
 
         await query.edit_message_text(
             f"Chat {chat_name} ({chat_type}) has been approved."
@@ -524,6 +881,7 @@ class ThoughtsBotHandler:
             logging.error(f"Failed to notify chat {chat_name} ({chat_type}): {e}")
         return ConversationHandler.END
 
+    @track_handler
     async def handle_css_input(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
     ):
@@ -539,14 +897,13 @@ class ThoughtsBotHandler:
         chat_type = pending["chat_type"]
 
         # Save to config
-        config = load_config()
-        config[chat_id] = {
-            "chat_name": chat_name,
-            "type": chat_type,
-            "css_class": css_class,
-            "thoughts_author": chat_name,
-        }
-        save_config(config)
+        async with self.config_store.edit() as config:
+            config[chat_id] = {
+                "chat_name": chat_name,
+                "type": chat_type,
+                "css_class": css_class,
+                "thoughts_author": chat_name,
+            }
 
         # Clean up pending state
         del context.bot_data["pending_css"]
@@ -567,38 +924,73 @@ class ThoughtsBotHandler:
             logging.error(f"Failed to notify chat {chat_name}: {e}")
         return ConversationHandler.END
 
+    @track_handler
     async def handle_url_detection(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
     ):
         """Handle URL detection in group messages"""
         # Only proceed if chat is enabled
         chat_id = str(update.effective_chat.id)
-        config = load_config()
+        config = self.config_store.load()
         if chat_id not in config:
             return
 
-        # Extract URLs from message
-        message_text = update.message.text
-        urls = re.findall(URL_REGEX, message_text)
+        # Extract URLs from the message's url/text_link entities
+        message_text = update.message.text or update.message.caption
+        urls = extract_urls(update.message)
 
         if not urls:
             return
 
-        # Check each URL against blacklist
+        # Resolve shorteners, then check each URL against blacklist
+        urls = await asyncio.gather(
+            *(resolve_short_url(self.metadata.session, url) for url in urls)
+        )
+        urls = [url for url in urls if not self.blacklist.is_blocked(url)]
+
+        # Skip links that are already published or waiting for approval; the
+        # canonical form only compares them, the link is kept as shared
+        shared = {}
         for url in urls:
-            if any(re.search(pattern, url) for pattern in BLACKLISTED_URLS):
+            shared.setdefault(canonicalize(url), url)
+        new_urls = []
+        for url in shared.values():
+            if (where := self.press_index.get(url)) is not None:
+                logging.info(f"Skipping {url}, already published: {where}")
+            elif self.pending_links.find(url) is not None:
+                logging.info(f"Skipping {url}, already waiting for approval")
+            else:
+                new_urls.append(url)
+        urls = new_urls
+
+        # Fetch title/description up front so the admin sees them right away
+        pages = await asyncio.gather(*(self.metadata.fetch(url) for url in urls))
+
+        chat_name = update.effective_chat.title
+        user_name = update.effective_user.username or update.effective_user.first_name
+
+        for url, page in zip(urls, pages):
+            # another message with this link may have been handled meanwhile
+            if self.pending_links.find(url) is not None:
                 continue
             logging.info(f"{APPROVE_LINK}:{url}")
 
-            # Create approval request for admin
-            # Create a unique identifier for this URL request
-            # TODO this is not unique in async obv
-            url_id = len(context.bot_data.get("pending_urls", []))
+            # Create approval request for admin, the button carries the link's id
+            url_id = self.pending_links.add(
+                url, chat_id=chat_id, message_id=update.message.message_id, **page
+            )
 
-            # Store URL in bot data
-            if "pending_urls" not in context.bot_data:
-                context.bot_data["pending_urls"] = []
-            context.bot_data["pending_urls"].append(url)
+            if self.digest is not None:
+                await self.digest.add(
+                    {
+                        "id": url_id,
+                        "url": url,
+                        "title": page["title"],
+                        "chat_name": chat_name,
+                        "user_name": user_name,
+                    }
+                )
+                continue
 
             keyboard = [
                 [
@@ -612,21 +1004,175 @@ class ThoughtsBotHandler:
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
 
-            chat_name = update.effective_chat.title
-            user_name = (
-                update.effective_user.username or update.effective_user.first_name
+            page_info = "".join(
+                f"{label}: {page[key]}\n"
+                for key, label in (("title", "Title"), ("description", "Description"))
+                if page[key]
             )
 
             await self.application.bot.send_message(
                 chat_id=DEVELOPER_CHAT_ID,
                 text=(
                     f"New link shared in <{chat_name}> by @{user_name}:\n\n"
-                    f"<{url}>\n\n"
+                    f"<{url}>\n"
+                    f"{page_info}\n"
                     f"Context: {message_text}"
                 ),
                 reply_markup=reply_markup,
+                rate_limit_args=NOTIFY,
             )
 
+    async def send_link_digest(self, items: list):
+        """LinkDigest callback: one admin message for a batch of new links"""
+        lines = [f"{len(items)} new links:\n"]
+        buttons = []
+        for n, item in enumerate(items, 1):
+            lines.append(
+                f"{n}. {item['title'] or item['url']}\n<{item['url']}>\n"
+                f"in <{item['chat_name']}> by @{item['user_name']}\n"
+            )
+            buttons.append(
+                [
+                    InlineKeyboardButton(
+                        f"{CHECKED} {n}. {(item['title'] or item['url'])[:40]}",
+                        callback_data=f"{DIGEST_TOGGLE}:{item['id']}",
+                    )
+                ]
+            )
+        buttons.append(
+            [
+                InlineKeyboardButton(
+                    f"Approve all {CHECKED}", callback_data=DIGEST_APPROVE
+                ),
+                InlineKeyboardButton("Reject all", callback_data=DIGEST_REJECT),
+            ]
+        )
+        await self.application.bot.send_message(
+            chat_id=DEVELOPER_CHAT_ID,
+            text="\n".join(lines)[:MAX_MESSAGE_LENGTH],
+            reply_markup=InlineKeyboardMarkup(buttons),
+            rate_limit_args=NOTIFY,
+        )
+
+    @staticmethod
+    def digest_selection(markup: InlineKeyboardMarkup) -> list:
+        """[(link id, checked), ...] read back from a digest message's keyboard"""
+        return [
+            (button.callback_data.split(":", 1)[1], button.text.startswith(CHECKED))
+            for row in markup.inline_keyboard
+            for button in row
+            if button.callback_data.startswith(f"{DIGEST_TOGGLE}:")
+        ]
+
+    @track_handler
+    async def handle_digest_toggle(
+        self, update: Update, context: ContextTypes.DEFAULT_TYPE
+    ):
+        """Flip one link of a digest between approve and reject"""
+        query = update.callback_query
+        await query.answer()
+
+        if str(query.from_user.id) != DEVELOPER_CHAT_ID:
+            raise Exception("A non-admin received a link digest!")
+
+        # the keyboard itself holds the selection, no server-side state
+        keyboard = []
+        for row in query.message.reply_markup.inline_keyboard:
+            new_row = []
+            for button in row:
+                if button.callback_data == query.data:
+                    mark, label = button.text.split(" ", 1)
+                    mark = UNCHECKED if mark == CHECKED else CHECKED
+                    button = InlineKeyboardButton(
+                        f"{mark} {label}", callback_data=button.callback_data
+                    )
+                new_row.append(button)
+            keyboard.append(new_row)
+        await query.edit_message_reply_markup(InlineKeyboardMarkup(keyboard))
+
+    @track_handler
+    async def handle_digest_decision(
+        self, update: Update, context: ContextTypes.DEFAULT_TYPE
+    ):
+        """
+        Approve the checked links of a digest (rejecting the rest), or reject all
+
+        Approved links are queued in one outbox transaction, so they end up in
+        a single batch and commit.
+        """
+        query = update.callback_query
+        await query.answer()
+
+        if str(query.from_user.id) != DEVELOPER_CHAT_ID:
+            raise Exception("A non-admin received a link digest!")
+
+        approve = query.data == DIGEST_APPROVE
+        approved, rejected, missing = [], [], 0
+        for link_id, checked in self.digest_selection(query.message.reply_markup):
+            link = self.pending_links.pop(link_id)
+            if link is None:
+                missing += 1
+            elif approve and checked:
+                approved.append(link)
+            else:
+                rejected.append(link)
+
+        summary = "".join(f"{CHECKED} {link['url']}\n" for link in approved) + "".join(
+            f"{UNCHECKED} {link['url']}\n" for link in rejected
+        )
+        if missing:
+            summary += f"{missing} already handled or expired\n"
+
+        if not approved:
+            await query.edit_message_text(f"Links rejected:\n{summary}")
+            return
+
+        now_str = format_datetime(datetime.datetime.now())
+        for link in approved:
+            self.press_index.add(link["url"], NOT_YET_PULLED)
+        try:
+            message = await query.edit_message_text(
+                f"Saving {len(approved)} links...\n{summary}"
+            )
+            payloads = [self.press_payload(link, now_str) for link in approved]
+            dispatch_ids = self.outbox.enqueue_many(
+                [("add_press", payload) for payload in payloads],
+                notify={
+                    "chat_id": message.chat_id,
+                    "message_id": message.message_id,
+                    "delivered": f"Link action started for {len(approved)} links\n{summary}",
+                    "failed": f"Error saving links via GitHub API, will keep retrying\n{summary}",
+                },
+            )
+        except Exception:
+            self.forget_approvals(approved)
+            raise
+        # the digest message stands for all of them, only the group messages count
+        for link, payload, dispatch_id in zip(approved, payloads, dispatch_ids):
+            self.entry_index.record(
+                "add_press",
+                payload,
+                dispatch_id,
+                [(link.get("chat_id"), link.get("message_id"))],
+            )
+
+    def forget_approvals(self, links: list):
+        """Approved links that never made it into the outbox can be shared again"""
+        for link in links:
+            if self.press_index.get(link["url"]) == NOT_YET_PULLED:
+                self.press_index.remove(link["url"])
+
+    @staticmethod
+    def press_payload(link: dict, now_str: str) -> dict:
+        return {
+            "url": link["url"],
+            "datetime": now_str,
+            "title": link.get("title") or link["url"],
+            "description": link.get("description"),
+            "image": link.get("image"),
+        }
+
+    @track_handler
     async def handle_link_approval(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
     ):
@@ -634,7 +1180,7 @@ class ThoughtsBotHandler:
         Handle admin's approval of shared link
 
         When a link is approved:
-        1. Gets the URL from pending_urls using the ID in callback data
+        1. Gets the URL from pending_links using the ID in callback data
         2. Triggers a GitHub Action to create the selected press entry
         3. Updates the message with success/failure status
         """
@@ -645,42 +1191,56 @@ class ThoughtsBotHandler:
             raise Exception("A non-admin received a link approval request!")
 
         # Extract URL ID from callback data and get URL from bot data
-        url_id = int(query.data.split(":", 1)[1])
+        url_id = query.data.split(":", 1)[1]
 
+        link = dispatch_id = None
         try:
-            if "pending_urls" not in context.bot_data:
-                await query.edit_message_text("Error: No pending URLs found")
+            # Get and clean up the pending URL
+            link = self.pending_links.pop(url_id)
+            if link is None:
+                await query.edit_message_text(
+                    "Error: link not found (already handled or expired)"
+                )
                 return
-
-            url = context.bot_data["pending_urls"][url_id]
-            # Clean up the used URL
-            context.bot_data["pending_urls"].pop(url_id)
+            url = link["url"]
+            self.press_index.add(url, NOT_YET_PULLED)
 
             # Get current timestamp
             now = datetime.datetime.now()
             now_str = format_datetime(now)
 
             # Update status
-            await query.edit_message_text(f"{url}\nSaving link...")
-
-            # Trigger GitHub Action to save the link
-            # TODO fetch the title maaaan
-            if await trigger_github_action(
-                "add_press", {"url": url, "datetime": now_str, "title": url}
-            ):
-                await query.edit_message_text(f"Link action started for {url}")
-            else:
-                error_msg = f"Error saving link via GitHub API: {url}"
-                await query.edit_message_text(error_msg)
-                # Notify admin
-                await self.application.bot.send_message(
-                    chat_id=DEVELOPER_CHAT_ID, text=error_msg
-                )
+            message = await query.edit_message_text(f"{url}\nSaving link...")
+
+            # Queue GitHub Action to save the link
+            payload = self.press_payload(link, now_str)
+            dispatch_id = self.outbox.enqueue(
+                "add_press",
+                payload,
+                notify={
+                    "chat_id": message.chat_id,
+                    "message_id": message.message_id,
+                    "delivered": f"Link action started for {url}",
+                    "failed": f"Error saving link via GitHub API, will keep retrying: {url}",
+                },
+            )
+            self.entry_index.record(
+                "add_press",
+                payload,
+                dispatch_id,
+                [
+                    (link.get("chat_id"), link.get("message_id")),
+                    (message.chat_id, message.message_id),
+                ],
+            )
 
         except Exception as e:
             logging.error(f"Error saving approved link: {e}")
+            if link is not None and dispatch_id is None:
+                self.forget_approvals([link])
             await query.edit_message_text(f"Error saving link: {e}")
 
+    @track_handler
     async def handle_link_rejection(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
     ):
@@ -692,18 +1252,148 @@ class ThoughtsBotHandler:
             raise Exception("A non-admin received a link rejection request!")
 
         # Extract URL ID from callback data and get URL from bot data
-        url_id = int(query.data.split(":", 1)[1])
+        url_id = query.data.split(":", 1)[1]
 
-        if "pending_urls" not in context.bot_data:
-            await query.edit_message_text("Error: No pending URLs found")
+        # Get and clean up the pending URL
+        link = self.pending_links.pop(url_id)
+        if link is None:
+            await query.edit_message_text(
+                "Error: link not found (already handled or expired)"
+            )
             return
-
-        url = context.bot_data["pending_urls"][url_id]
-        # Clean up the used URL
-        context.bot_data["pending_urls"].pop(url_id)
+        url = link["url"]
 
         await query.edit_message_text(f"Link rejected: {url}")
 
+    @track_handler
+    async def github_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Show GitHub connection reuse stats (admin only)"""
+        if str(update.effective_user.id) != DEVELOPER_CHAT_ID:
+            return
+        await update.message.reply_text(
+            "GitHub session stats:\n" + self.github.format_stats().replace(", ", "\n")
+        )
+
+    async def entry_for_reply(self, update: Update):
+        """
+        The entry the command's message replies to, or None after telling the
+        user why not (no reply, unknown message, already deleted, not saved yet)
+        """
+        message = update.effective_message
+        # in groups only the admin changes the links shared there
+        if (
+            update.effective_chat.type != "private"
+            and str(update.effective_user.id) != DEVELOPER_CHAT_ID
+        ):
+            return None
+        if message.reply_to_message is None:
+            await message.reply_text(
+                "Reply with this command to a saved thought or link, "
+                "or to my confirmation of it."
+            )
+            return None
+        entry = self.entry_index.find(
+            update.effective_chat.id, message.reply_to_message.message_id
+        )
+        if entry is None:
+            await message.reply_text("That message didn't become an entry I know of.")
+        elif entry["deleted"]:
+            await message.reply_text(f"{entry['target']} is already deleted.")
+        elif entry["dispatch_id"] in self.outbox or any(
+            op_id in self.outbox for op_id in entry["operations"]
+        ):
+            # an edit now would start from content the repo doesn't have yet
+            await message.reply_text(
+                "That entry is still on its way to GitHub, try again in a minute."
+            )
+        else:
+            return entry
+        return None
+
+    @track_handler
+    @check_enabled
+    async def edit_entry(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """/edit <new text> as a reply: replace a thought's text or a link's title"""
+        entry = await self.entry_for_reply(update)
+        if entry is None:
+            return
+        # everything after the command, line breaks included
+        parts = update.effective_message.text.split(None, 1)
+        if len(parts) < 2 or not parts[1].strip():
+            await update.effective_message.reply_text("Usage: /edit <new text>")
+            return
+        field = EDITABLE[entry["target"].split("/", 1)[0]]
+        message = await update.effective_message.reply_text(
+            f"Saving the new {field} of {entry['target']}..."
+        )
+        fields = {field: parts[1].strip()}
+        op_id = self.outbox.enqueue(
+            EDIT_ACTION,
+            self.entry_index.edit(entry, fields),
+            notify={
+                "chat_id": message.chat_id,
+                "message_id": message.message_id,
+                "delivered": f"Edit of {entry['target']} submitted",
+                "failed": f"Error editing {entry['target']}, will keep retrying",
+            },
+        )
+        self.entry_index.hold(op_id, entry, fields)
+
+    @track_handler
+    @check_enabled
+    async def delete_entry(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """/delete as a reply: remove a thought (and its photo) or a link"""
+        entry = await self.entry_for_reply(update)
+        if entry is None:
+            return
+        message = await update.effective_message.reply_text(
+            f"Deleting {entry['target']}..."
+        )
+        op_id = self.outbox.enqueue(
+            DELETE_ACTION,
+            self.entry_index.delete(entry),
+            notify={
+                "chat_id": message.chat_id,
+                "message_id": message.message_id,
+                "delivered": f"Deletion of {entry['target']} submitted",
+                "failed": f"Error deleting {entry['target']}, will keep retrying",
+            },
+        )
+        self.entry_index.hold(op_id, entry)
+
+    @track_handler
+    async def check_links(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Start a link-rot sweep of the press archive now (admin only)"""
+        if str(update.effective_user.id) != DEVELOPER_CHAT_ID:
+            return
+        if self.link_checker.running:
+            await update.message.reply_text("A link check is already running.")
+            return
+        self.link_checker.trigger()
+        await update.message.reply_text(
+            "Checking the press archive, I'll report dead or moved links."
+        )
+
+    async def send_link_report(self, summary: dict):
+        """LinkRotChecker callback: one admin message per sweep"""
+        lines = [
+            f"Link check: {summary['links']} archived links, "
+            f"{len(summary['dead'])} newly dead, "
+            f"{len(summary['redirected'])} newly redirected "
+            f"({summary['known']} reported before)\n"
+        ]
+        for row in summary["dead"]:
+            lines.append(f"Dead ({row['status'] or 'unreachable'}): {row['url']}")
+        for row in summary["redirected"]:
+            lines.append(f"Moved: {row['url']}\n  -> {row['final_url']}")
+        await self.application.bot.send_message(
+            chat_id=DEVELOPER_CHAT_ID,
+            text="\n".join(lines)[:MAX_MESSAGE_LENGTH],
+            disable_web_page_preview=True,
+            rate_limit_args=NOTIFY,
+        )
+
+    @track_handler
     async def cancel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Cancel the conversation"""
         await update.message.reply_text(f"Thought creation cancelled.")
@@ -712,15 +1402,58 @@ class ThoughtsBotHandler:
     async def error_handler(self, update: object, context: ContextTypes.DEFAULT_TYPE):
         """Handle errors"""
         logging.error(f"Error: {context.error}")
+        # during a flood the notifications already queued say enough, the
+        # rest is in the log
+        if self.quota.waiting(NOTIFY) >= MAX_QUEUED_NOTIFICATIONS:
+            return
         # Notify admin
         await self.application.bot.send_message(
-            chat_id=DEVELOPER_CHAT_ID, text=f"Error in bot: {context.error}"
+            chat_id=DEVELOPER_CHAT_ID,
+            text=f"Error in bot: {context.error}",
+            rate_limit_args=NOTIFY,
         )
 
+    async def serve(self):
+        """
+        Catch up on the backlog, then receive updates (polling or through the
+        embedded web server) until SIGINT/SIGTERM
+        """
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+        # run_polling/run_webhook would start receiving before a catch-up
+        async with self.application:
+            await self.post_init(self.application)
+            await self.application.start()
+            try:
+                if CATCHUP:
+                    await self.catch_up()
+                if BOT_MODE == "webhook":
+                    await self.application.bot.set_webhook(
+                        WEBHOOK_URL,
+                        secret_token=WEBHOOK_SECRET,
+                        max_connections=WEBHOOK_MAX_CONNECTIONS,
+                        allowed_updates=Update.ALL_TYPES,
+                    )
+                else:
+                    # also removes a webhook left over from webhook mode
+                    await self.application.updater.start_polling(
+                        allowed_updates=Update.ALL_TYPES
+                    )
+                await stop.wait()
+            finally:
+                if self.application.updater.running:
+                    await self.application.updater.stop()
+                await self.application.stop()
+                await self.post_stop(self.application)
+                await self.post_shutdown(self.application)
+
     def run(self):
         """Run the bot"""
-        print("Starting thoughts bot...")
-        self.application.run_polling()
+        print(f"Starting thoughts bot ({BOT_MODE})...")
+        asyncio.run(self.serve())
 
 
 if __name__ == "__main__":
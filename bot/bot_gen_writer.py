@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+"""
+Write bot_gen content files from a repository_dispatch event
+
+Run by .github/workflows/bot_gen.yml from the repository root. Handles the
+single-entry events (add_thought, add_press) as well as add_batch, whose
+client_payload is {"entries": [{"action": "add_thought", ...}, ...]}, so a
+whole batch ends up in one commit.
+
+Large entries arrive compressed, or split into add_chunk parts over several
+events (see payload_codec.py). Parts wait in src/bot_gen/_chunks/<dispatch_id>/
+until all of them are there, then the entry is written like any other.
+
+edit_entry and delete_entry change or remove a published entry, loose or
+compacted: {"target": "thoughts/2025-03/<stem>", "sha": <its git blob sha>,
+"fields": {"content": ...}} (no fields for delete). They only apply if the
+entry is still exactly what the bot last saw, see `operation_changes()`.
+Runs aren't serialized, so an operation can get here before the run adding
+its entry pushed: it waits in src/bot_gen/_deferred/ and every later run
+applies it once the entry is there (or drops it after DEFER_TTL, the entry
+was deleted meanwhile and this is a repeated delivery).
+
+Payloads queued while the bot handled an update carry its "trace_id", which
+never ends up in an entry: the ids are written to the step's outputs
+(trace_ids, space separated) for the commit message, see bot/tracing.py.
+
+The bot's Git Data storage backend imports `render_entry()`, `free_name()`
+and `operation_changes()` so both paths produce identical files.
+"""
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+from compact import (
+    MANIFEST,
+    SHARDS_DIR,
+    atomic_write,
+    manifest_text,
+    parse_shard,
+    read_shard,
+    shard_path,
+    shard_record,
+    shard_text,
+)
+from payload_codec import CHUNK_ACTION, decode_entry, join_parts
+
+CONTENT_ROOT = Path("src/bot_gen")
+CHUNKS_DIR = "_chunks"
+# left behind once an entry is assembled, so a repeated part is ignored
+ASSEMBLED = "assembled"
+DEFERRED_DIR = "_deferred"
+DEFER_TTL = 24 * 3600  # seconds
+EDIT_ACTION = "edit_entry"
+DELETE_ACTION = "delete_entry"
+# the field /edit replaces, per collection
+EDITABLE = {"thoughts": "content", "selected_press": "title"}
+# files of a photo thought (see bot/images.py), deleted along with it
+MEDIA_KEYS = ("webp", "avif", "thumb")
+
+
+def thought_entry(payload: dict, timestamp: str) -> dict:
+    entry = {
+        "author": payload["author"],
+        "css_class": payload["css_class"],
+        "datetime": timestamp,
+        "content": payload["content"],
+    }
+    # photo variants, committed next to the entry (see bot/images.py)
+    if payload.get("image"):
+        entry["image"] = payload["image"]
+    return with_dispatch_id(entry, payload)
+
+
+def press_entry(payload: dict, timestamp: str) -> dict:
+    entry = {
+        "url": payload["url"],
+        "datetime": timestamp,
+        "title": payload["title"],
+        "description": payload.get("description"),
+        "image": payload.get("image"),
+    }
+    return with_dispatch_id(entry, payload)
+
+
+def with_dispatch_id(entry: dict, payload: dict) -> dict:
+    # the bot's outbox delivers at-least-once, the id lets us spot repeats
+    if payload.get("dispatch_id"):
+        entry["dispatch_id"] = payload["dispatch_id"]
+    return entry
+
+
+def already_written(content_dir: Path, dispatch_id: str):
+    """Return where `dispatch_id` is stored, if a previous delivery wrote it"""
+    for path in content_dir.glob("*.json"):
+        with open(path) as f:
+            if json.load(f).get("dispatch_id") == dispatch_id:
+                return path
+    # the month may already be compacted (see compact.py)
+    shard = shard_path(content_dir.parent, content_dir.name)
+    for entry in read_shard(shard):
+        if entry["data"].get("dispatch_id") == dispatch_id:
+            return f"{shard}:{entry['id']}"
+    return None
+
+
+# action -> (content folder, entry builder)
+WRITERS = {
+    "add_thought": ("thoughts", thought_entry),
+    "add_press": ("selected_press", press_entry),
+}
+
+
+def entries_from_event(action: str, client_payload: dict):
+    """Yield (action, payload) pairs contained in a dispatch event"""
+    if action == "add_batch":
+        for entry in client_payload["entries"]:
+            entry = dict(decode_entry(entry))
+            yield entry.pop("action"), entry
+    else:
+        yield action, client_payload
+
+
+def entry_text(data: dict) -> str:
+    return json.dumps(data, indent=4, ensure_ascii=False) + "\n"
+
+
+def git_blob_sha(text: str) -> str:
+    """What git names a file with this content, the entries' content hash"""
+    data = text.encode()
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def render_entry(action: str, payload: dict):
+    """
+    Return (directory relative to the content root, file stem, file content)
+
+    e.g. ("thoughts/2025-03", "2025-03-07T19:27:46Z-3f2a9c1b", '{"author": ...}')
+
+    The stem ends with the start of the dispatch_id, so entries landing in
+    the same second get different names and the bot knows the name up front.
+    """
+    folder, build = WRITERS[action]
+    timestamp = f"{payload['datetime']}Z"
+    stem = timestamp
+    if payload.get("dispatch_id"):
+        stem = f"{timestamp}-{payload['dispatch_id'][:8]}"
+    return f"{folder}/{timestamp[:7]}", stem, entry_text(build(payload, timestamp))
+
+
+def free_name(stem: str, taken) -> str:
+    """First of <stem>.json, <stem>-1.json, ... not in `taken`"""
+    name = f"{stem}.json"
+    n = 1
+    while name in taken:
+        name = f"{stem}-{n}.json"
+        n += 1
+    return name
+
+
+def write_entry(action: str, payload: dict, root: Path = CONTENT_ROOT):
+    """
+    Write a single entry to src/bot_gen/<folder>/YYYY-MM/<stem>.json
+
+    Returns the new file, or None if this dispatch_id was already written.
+    """
+    folder, stem, text = render_entry(action, payload)
+    content_dir = root / folder
+    content_dir.mkdir(parents=True, exist_ok=True)
+
+    if payload.get("dispatch_id"):
+        previous = already_written(content_dir, payload["dispatch_id"])
+        if previous is not None:
+            print(f"skipping {payload['dispatch_id']}, already in {previous}")
+            return None
+
+    # don't clobber an entry that landed in the same second, loose or compacted
+    taken = {p.name for p in content_dir.iterdir()}
+    taken.update(
+        f"{entry['id'].split('/', 1)[1]}.json"
+        for entry in read_shard(shard_path(content_dir.parent, content_dir.name))
+    )
+    path = content_dir / free_name(stem, taken)
+    with open(path, "w") as f:
+        f.write(text)
+    return path
+
+
+def operation_paths(target: str) -> tuple:
+    """
+    Files (relative to the content root) an edit or delete of `target` reads:
+    its loose file, else its month's shard and the shards' manifest
+    """
+    collection, entry_id = target.split("/", 1)
+    shards = f"{collection}/{SHARDS_DIR}"
+    return f"{target}.json", f"{shards}/{entry_id[:7]}.jsonl", f"{shards}/{MANIFEST}"
+
+
+def operation_changes(op: dict, texts: dict) -> dict:
+    """
+    {path relative to the content root: new content, None to delete} for an
+    edit_entry/delete_entry operation, given the current content of its
+    `operation_paths()` (missing or None if they don't exist)
+
+    Empty if the target is gone or its content isn't `op["sha"]` anymore: a
+    repeated delivery finds its own result, and an entry changed by hand
+    meanwhile is left alone.
+    """
+    loose, shard, manifest = operation_paths(op["target"])
+    entry_id = op["target"].split("/", 1)[1]
+    entries = None
+    if texts.get(loose) is not None:
+        data = json.loads(texts[loose])
+    else:
+        # compacted meanwhile, see compact.py
+        entries = parse_shard(texts.get(shard) or "")
+        found = [entry["data"] for entry in entries if entry["id"] == entry_id]
+        if not found:
+            return {}
+        data = found[0]
+    if git_blob_sha(entry_text(data)) != op["sha"]:
+        return {}
+
+    changes = {}
+    if op["action"] == DELETE_ACTION:
+        new = None
+        image = data.get("image") or {}
+        changes.update({image[key]: None for key in MEDIA_KEYS if image.get(key)})
+    else:
+        new = {**data, **op["fields"]}
+    if entries is None:
+        changes[loose] = None if new is None else entry_text(new)
+        return changes
+
+    entries = [entry for entry in entries if entry["id"] != entry_id]
+    if new is not None:
+        entries.append({"id": entry_id, "data": new})
+    records = json.loads(texts.get(manifest) or "{}")
+    if entries:
+        changes[shard] = shard_text(entries)
+        records[entry_id[:7]] = shard_record(changes[shard])
+    else:
+        changes[shard] = None
+        records.pop(entry_id[:7], None)
+    changes[manifest] = manifest_text(records)
+    return changes
+
+
+def apply_operation(op: dict, root: Path = CONTENT_ROOT) -> list:
+    """Carry out an edit_entry/delete_entry in the checkout, returns changed files"""
+    texts = {}
+    for path in operation_paths(op["target"]):
+        if (root / path).exists():
+            texts[path] = (root / path).read_text()
+    changes = operation_changes(op, texts)
+    if not changes:
+        print(f"skipping {op['action']} of {op['target']}: gone or changed since")
+    for path, text in changes.items():
+        if text is None:
+            (root / path).unlink(missing_ok=True)
+        else:
+            atomic_write(root / path, text)
+    return list(changes)
+
+
+def entry_exists(target: str, root: Path = CONTENT_ROOT) -> bool:
+    """Whether the entry is in the checkout, loose or compacted"""
+    loose, shard, _ = operation_paths(target)
+    if (root / loose).exists():
+        return True
+    entry_id = target.split("/", 1)[1]
+    return any(entry["id"] == entry_id for entry in read_shard(root / shard))
+
+
+def deferred_operations(root: Path = CONTENT_ROOT) -> list:
+    """(file, operation) pairs waiting for their entry, oldest first"""
+    waiting = []
+    for path in (root / DEFERRED_DIR).glob("*.json"):
+        with open(path) as f:
+            waiting.append((path, json.load(f)))
+    return sorted(waiting, key=lambda item: (item[1]["deferred_at"], item[0].name))
+
+
+def defer_operation(op: dict, root: Path = CONTENT_ROOT) -> bool:
+    """Keep an operation until its entry shows up, False if already kept"""
+    path = root / DEFERRED_DIR / f"{op['dispatch_id']}.json"
+    if path.exists():
+        print(f"skipping {op['action']} of {op['target']}, already deferred")
+        return False
+    path.parent.mkdir(parents=True, exist_ok=True)
+    atomic_write(path, json.dumps({**op, "deferred_at": time.time()}) + "\n")
+    return True
+
+
+def handle_operation(op: dict, root: Path = CONTENT_ROOT):
+    """
+    Apply an edit_entry/delete_entry, or defer it when its entry isn't there
+    yet (or an earlier operation on it still waits, to keep their order).
+    Returns "applied", "deferred" or None if it changed nothing.
+    """
+    waiting = {other["target"] for _, other in deferred_operations(root)}
+    if op["target"] in waiting or not entry_exists(op["target"], root):
+        if op.get("dispatch_id") and defer_operation(op, root):
+            return "deferred"
+        return None
+    return "applied" if apply_operation(op, root) else None
+
+
+def apply_deferred(root: Path = CONTENT_ROOT, now: float = None) -> tuple:
+    """
+    Apply the deferred operations whose entry is there now, in the order
+    they came, and drop the expired ones; returns (applied operations,
+    number dropped)
+    """
+    now = time.time() if now is None else now
+    applied, dropped = [], 0
+    for path, op in deferred_operations(root):
+        if entry_exists(op["target"], root):
+            if apply_operation(op, root):
+                applied.append(op)
+        elif now - op["deferred_at"] > DEFER_TTL:
+            print(f"dropping {op['action']} of {op['target']}: entry never showed up")
+            dropped += 1
+        else:
+            continue
+        path.unlink()
+    return applied, dropped
+
+
+def store_chunk(part: dict, root: Path = CONTENT_ROOT) -> bool:
+    """Keep one add_chunk part until the others arrive, False if not needed"""
+    chunk_dir = root / CHUNKS_DIR / part["dispatch_id"]
+    if (chunk_dir / ASSEMBLED).exists():
+        print(f"skipping part {part['part']} of {part['dispatch_id']}, assembled")
+        return False
+    chunk_dir.mkdir(parents=True, exist_ok=True)
+    with open(chunk_dir / f"{part['part']}.json", "w") as f:
+        json.dump(part, f)
+    return True
+
+
+def assemble_chunks(root: Path = CONTENT_ROOT) -> list:
+    """Write every chunked entry whose parts are all there, returns new files"""
+    written = []
+    for chunk_dir in sorted((root / CHUNKS_DIR).glob("*")):
+        part_files = sorted(chunk_dir.glob("*.json"))
+        if not part_files:
+            continue
+        parts = []
+        for path in part_files:
+            with open(path) as f:
+                parts.append(json.load(f))
+        if len(parts) < parts[0]["parts"]:
+            continue
+        payload = join_parts(parts)
+        path = write_entry(payload.pop("action"), payload, root)
+        if path is not None:
+            written.append(path)
+        for path in part_files:
+            path.unlink()
+        (chunk_dir / ASSEMBLED).touch()
+    return written
+
+
+def main():
+    with open(os.environ["GITHUB_EVENT_PATH"]) as f:
+        event = json.load(f)
+
+    stored, written, operations, deferred = 0, [], [], 0
+    trace_ids = {}
+    for action, payload in entries_from_event(event["action"], event["client_payload"]):
+        if action == CHUNK_ACTION:
+            changed = store_chunk(payload)
+            stored += changed
+        elif action in (EDIT_ACTION, DELETE_ACTION):
+            result = handle_operation({"action": action, **payload})
+            changed = result is not None
+            if result == "applied":
+                operations.append((action, payload["target"]))
+            deferred += result == "deferred"
+        else:
+            path = write_entry(action, payload)
+            changed = path is not None
+            if changed:
+                written.append(path)
+        # repeated deliveries change nothing, their traces ended earlier
+        if changed and payload.get("trace_id"):
+            trace_ids[payload["trace_id"]] = None
+    # parts of a large entry come in separate events, this one may complete it
+    written += assemble_chunks()
+    # operations that got here before their entry, which may be here now
+    applied, dropped = apply_deferred()
+    operations += [(op["action"], op["target"]) for op in applied]
+    for path in written:
+        print(f"wrote {path}")
+    for action, target in operations:
+        print(f"{'edited' if action == EDIT_ACTION else 'deleted'} {target}")
+
+    count = len(written) + stored + len(operations) + deferred + dropped
+    if len(written) == 1 and count == 1:
+        kind = written[0].parent.parent.name
+        commit_message = f"Bot: Add new {kind} entry at {written[0].stem}"
+    elif len(operations) == 1 and count == 1:
+        action, target = operations[0]
+        verb = "Edit" if action == EDIT_ACTION else "Delete"
+        commit_message = f"Bot: {verb} entry {target}"
+    elif written and count == len(written):
+        commit_message = f"Bot: Add {len(written)} new entries"
+    elif written or operations:
+        commit_message = (
+            f"Bot: Add {len(written)}, edit or delete {len(operations)} entries"
+        )
+    elif stored:
+        parts = "a part" if stored == 1 else f"{stored} parts"
+        commit_message = f"Bot: Store {parts} of a large entry"
+    elif deferred:
+        commit_message = (
+            f"Bot: Defer {deferred} edits or deletes of entries not there yet"
+        )
+    elif dropped:
+        commit_message = f"Bot: Drop {dropped} deferred edits or deletes"
+    else:
+        commit_message = ""
+
+    with open(os.environ["GITHUB_OUTPUT"], "a") as f:
+        f.write(f"count={count}\n")
+        f.write(f"commit_message={commit_message}\n")
+        f.write(f"trace_ids={' '.join(trace_ids)}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Fold closed months of bot_gen content into one shard file per month
+
+Every thought and link is its own small JSON file under
+src/bot_gen/<collection>/YYYY-MM/, which the site build has to stat and parse
+one by one. This tool moves every month before the current one into
+src/bot_gen/<collection>/_shards/YYYY-MM.jsonl (one {"id", "data"} object
+per line, sorted by datetime) and records count, size and last-modified
+time of each shard in _shards/manifest.json.
+
+The current month keeps its loose files so new entries stay append-only. An
+entry that shows up late for an already compacted month is just a loose file
+again, the site reads both and the next run merges it. A loose file already
+in the shard (a run that died before unlinking) is merged as the same entry,
+so running again after a crash is safe.
+
+    python compact.py [--content-dir ../src/bot_gen] [--month 2025-04]
+"""
+
+import argparse
+import datetime
+import json
+import os
+import re
+import tempfile
+from pathlib import Path
+
+COLLECTIONS = ("thoughts", "selected_press")
+SHARDS_DIR = "_shards"
+MANIFEST = "manifest.json"
+MONTH_DIR = re.compile(r"^\d{4}-\d{2}$")
+
+
+def shard_path(collection_dir: Path, month: str) -> Path:
+    return collection_dir / SHARDS_DIR / f"{month}.jsonl"
+
+
+def parse_shard(text: str) -> list:
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def read_shard(path: Path) -> list:
+    """[{"id": "YYYY-MM/<stem>", "data": {...}}, ...], empty if no shard"""
+    try:
+        with open(path) as f:
+            return parse_shard(f.read())
+    except FileNotFoundError:
+        return []
+
+
+def shard_text(entries: list) -> str:
+    """A shard's content: one entry per line, sorted by datetime"""
+    ordered = sorted(entries, key=lambda e: (e["data"].get("datetime", ""), e["id"]))
+    return "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in ordered)
+
+
+def shard_record(text: str) -> dict:
+    """The manifest record of a shard with this content"""
+    return {
+        "count": text.count("\n"),
+        "bytes": len(text.encode()),
+        "last_modified": datetime.datetime.now(datetime.timezone.utc).isoformat()[:19]
+        + "Z",
+    }
+
+
+def manifest_text(manifest: dict) -> str:
+    return json.dumps(dict(sorted(manifest.items())), indent=4) + "\n"
+
+
+def read_manifest(collection_dir: Path) -> dict:
+    try:
+        with open(collection_dir / SHARDS_DIR / MANIFEST) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def atomic_write(path: Path, text: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def compact_month(collection_dir: Path, month: str) -> dict:
+    """Merge YYYY-MM/*.json into the month's shard, returns its manifest record"""
+    month_dir = collection_dir / month
+    shard = shard_path(collection_dir, month)
+    entries = {entry["id"]: entry for entry in read_shard(shard)}
+
+    loose = sorted(month_dir.glob("*.json"))
+    for path in loose:
+        with open(path) as f:
+            data = json.load(f)
+        entry_id = f"{month}/{path.stem}"
+        n = 1
+        # the same content under this id (or a numbered one) is this very
+        # entry, left behind by a run that didn't get to unlink it
+        while entry_id in entries and entries[entry_id]["data"] != data:
+            # same-second entry that arrived after the month was compacted
+            entry_id = f"{month}/{path.stem}-{n}"
+            n += 1
+        entries[entry_id] = {"id": entry_id, "data": data}
+
+    text = shard_text(list(entries.values()))
+    atomic_write(shard, text)
+
+    # only drop the loose files once the shard holding them is on disk
+    for path in loose:
+        path.unlink()
+    if not any(month_dir.iterdir()):
+        month_dir.rmdir()
+
+    return shard_record(text)
+
+
+def compact_collection(collection_dir: Path, current_month: str) -> list:
+    """Compact every month dir older than current_month, returns those months"""
+    if not collection_dir.is_dir():
+        return []
+    months = sorted(
+        p.name
+        for p in collection_dir.iterdir()
+        if p.is_dir() and MONTH_DIR.match(p.name) and p.name < current_month
+    )
+    if not months:
+        return []
+
+    manifest = read_manifest(collection_dir)
+    for month in months:
+        manifest[month] = compact_month(collection_dir, month)
+    atomic_write(collection_dir / SHARDS_DIR / MANIFEST, manifest_text(manifest))
+    return months
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--content-dir", type=Path, default=Path("../src/bot_gen"))
+    parser.add_argument(
+        "--month",
+        default=datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m"),
+        help="current month (YYYY-MM), everything before it gets compacted",
+    )
+    args = parser.parse_args()
+
+    for collection in COLLECTIONS:
+        months = compact_collection(args.content_dir / collection, args.month)
+        print(f"{collection}: compacted {', '.join(months) or 'nothing'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import asyncio
+import copy
+import json
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+
+class ConfigStore:
+    """
+    In-memory copy of config.json
+
+    The parsed config is kept in memory and only re-read when the file's
+    inode, mtime or size change (e.g. someone edited it by hand). Writes go
+    through an asyncio lock and are atomic (temp file + rename), so handlers
+    running at the same time can't tear the file or lose each other's updates.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._config = {}
+        self._stamp = None
+        self._lock = asyncio.Lock()
+        self.reloads = 0
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def load(self) -> dict:
+        """Return the current config, re-reading the file only if it changed on disk"""
+        stamp = self._stat()
+        if stamp != self._stamp:
+            if stamp is None:
+                self._config = {}
+            else:
+                with open(self.path) as f:
+                    self._config = json.load(f)
+            self._stamp = stamp
+            self.reloads += 1
+        return self._config
+
+    def _write(self, config: dict):
+        fd, tmp_path = tempfile.mkstemp(
+            dir=self.path.parent, prefix=f".{self.path.name}.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(config, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self._config = config
+        self._stamp = self._stat()
+
+    async def save(self, config: dict):
+        """Atomically replace config file with the given config"""
+        async with self._lock:
+            self._write(copy.deepcopy(config))
+
+    @asynccontextmanager
+    async def edit(self):
+        """
+        Read-modify-write the config under the lock
+
+            async with store.edit() as config:
+                config[chat_id] = {...}
+
+        Changes are written atomically when the block exits without errors.
+        """
+        async with self._lock:
+            config = copy.deepcopy(self.load())
+            yield config
+            self._write(config)
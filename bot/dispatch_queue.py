@@ -0,0 +1,101 @@
+import asyncio
+import json
+import logging
+
+from storage import BATCH_EVENT, StorageBackend
+
+
+class DispatchBatcher:
+    """
+    Coalesce add_thought/add_press entries into batches for the storage backend
+
+    Entries submitted within `window` seconds of the first queued one are
+    packed into as few batches as fit under the backend's size limit (the
+    add_batch client_payload limit for the dispatch backend), so a burst of
+    approvals becomes a single commit. Every `submit()` call still gets back
+    its own result.
+    """
+
+    def __init__(self, backend: StorageBackend, window: float = 2.0):
+        self.backend = backend
+        self.window = window
+        self.max_payload_bytes = backend.max_batch_bytes
+        self.queue = asyncio.Queue()
+        self.task = None
+
+    async def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Flush whatever is still queued and stop the worker"""
+        if self.task is None:
+            return
+        await self.queue.put(None)
+        await self.task
+        self.task = None
+
+    async def submit(self, event_type: str, payload: dict) -> bool:
+        """Queue an entry and wait until the batch containing it was dispatched"""
+        if self.task is None:
+            await self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put(({"action": event_type, **payload}, future))
+        return await future
+
+    async def _collect(self):
+        """Wait for an entry, then gather everything arriving within the window"""
+        first = await self.queue.get()
+        if first is None:
+            return [], True
+        pending = [first]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.window
+        while (timeout := deadline - loop.time()) > 0:
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if item is None:
+                return pending, True
+            pending.append(item)
+        return pending, False
+
+    def _pack(self, pending: list) -> list:
+        """Greedily split pending entries into batches under the payload limit"""
+        # size of the request body with an empty entry list, then each entry
+        # adds its own serialized size plus the ", " separator
+        overhead = len(
+            json.dumps(
+                {"event_type": BATCH_EVENT, "client_payload": {"entries": []}}
+            ).encode()
+        )
+        batches, current, size = [], [], overhead
+        for entry, future in pending:
+            entry_size = len(json.dumps(entry).encode()) + 2
+            if current and size + entry_size > self.max_payload_bytes:
+                batches.append(current)
+                current, size = [], overhead
+            current.append((entry, future))
+            size += entry_size
+        if current:
+            batches.append(current)
+        return batches
+
+    async def _send(self, batch: list):
+        try:
+            ok = await self.backend.save([entry for entry, _ in batch])
+        except Exception as e:
+            logging.error(f"Error dispatching batch: {e}")
+            ok = False
+        logging.info(f"Dispatched batch of {len(batch)} entries: {ok}")
+        for _, future in batch:
+            if not future.done():
+                future.set_result(ok)
+
+    async def _run(self):
+        closing = False
+        while not closing:
+            pending, closing = await self._collect()
+            for batch in self._pack(pending):
+                await self._send(batch)
@@ -0,0 +1,210 @@
+import json
+import logging
+import sqlite3
+import time
+from pathlib import Path
+
+from bot_gen_writer import entry_text, git_blob_sha, render_entry
+from compact import COLLECTIONS, MONTH_DIR, SHARDS_DIR, read_shard
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    dispatch_id TEXT PRIMARY KEY,
+    target TEXT NOT NULL,
+    sha TEXT NOT NULL,
+    data TEXT NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS operations (
+    id TEXT PRIMARY KEY,
+    dispatch_id TEXT NOT NULL,
+    fields TEXT
+);
+CREATE TABLE IF NOT EXISTS messages (
+    chat_id TEXT NOT NULL,
+    message_id INTEGER NOT NULL,
+    dispatch_id TEXT NOT NULL,
+    PRIMARY KEY (chat_id, message_id)
+);
+"""
+
+
+def iter_entries(content_dir: Path):
+    """Yield (target, data) for every entry under src/bot_gen/, loose or compacted"""
+    for collection in COLLECTIONS:
+        collection_dir = content_dir / collection
+        for shard in sorted((collection_dir / SHARDS_DIR).glob("*.jsonl")):
+            for entry in read_shard(shard):
+                yield f"{collection}/{entry['id']}", entry["data"]
+        for path in sorted(collection_dir.glob("*/*.json")):
+            if not MONTH_DIR.match(path.parent.name):
+                continue
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Skipping unreadable entry {path}: {e}")
+                continue
+            yield f"{collection}/{path.parent.name}/{path.stem}", data
+
+
+class EntryIndex:
+    """
+    Telegram message -> the entry it became, for /edit and /delete
+
+    Every saved entry is recorded under its dispatch_id with its target
+    ("thoughts/2025-03/<stem>", known before the workflow even runs, see
+    render_entry()), its content and that content's git blob sha, and linked
+    to the messages it came from: the user's message, the bot's status
+    message, the group message with the link. Resolving a reply is two
+    primary key lookups.
+
+    An edit or delete changes the index only once its dispatch went through
+    (`confirm()`); until then it is recorded under the entry's operations,
+    and the bot refuses another one that would start from the old content.
+
+    On first use the entries already in src/bot_gen/ are indexed by their
+    dispatch_id; which messages they came from was never written down, so
+    only entries saved from now on can be found by message.
+    """
+
+    def __init__(self, path: Path, content_dir: Path):
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+        if len(self) == 0:
+            self.scan(Path(content_dir))
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def scan(self, content_dir: Path):
+        start = time.perf_counter()
+        with self.db:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO entries (dispatch_id, target, sha, data)"
+                " VALUES (?, ?, ?, ?)",
+                (
+                    (
+                        data["dispatch_id"],
+                        target,
+                        git_blob_sha(entry_text(data)),
+                        json.dumps(data),
+                    )
+                    for target, data in iter_entries(content_dir)
+                    if data.get("dispatch_id")
+                ),
+            )
+        logging.info(
+            f"Indexed {len(self)} entries "
+            f"in {(time.perf_counter() - start) * 1e3:.0f} ms"
+        )
+
+    def record(self, action: str, payload: dict, dispatch_id: str, messages: list):
+        """
+        Remember a just queued add_thought/add_press entry and the
+        (chat_id, message_id) pairs it came from, returns its target
+        """
+        folder, stem, text = render_entry(
+            action, {**payload, "dispatch_id": dispatch_id}
+        )
+        target = f"{folder}/{stem}"
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO entries (dispatch_id, target, sha, data)"
+                " VALUES (?, ?, ?, ?)",
+                (dispatch_id, target, git_blob_sha(text), json.dumps(json.loads(text))),
+            )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO messages (chat_id, message_id, dispatch_id)"
+                " VALUES (?, ?, ?)",
+                [
+                    (str(chat_id), message_id, dispatch_id)
+                    for chat_id, message_id in messages
+                    if message_id is not None
+                ],
+            )
+        return target
+
+    def find(self, chat_id, message_id: int):
+        """
+        The entry a message belongs to (a dict, with "deleted" and the outbox
+        ids of its unconfirmed "operations"), or None
+        """
+        row = self.db.execute(
+            "SELECT entries.* FROM messages JOIN entries USING (dispatch_id)"
+            " WHERE chat_id = ? AND message_id = ?",
+            (str(chat_id), message_id),
+        ).fetchone()
+        if row is None:
+            return None
+        operations = self.db.execute(
+            "SELECT id FROM operations WHERE dispatch_id = ?", (row["dispatch_id"],)
+        )
+        return {
+            **dict(row),
+            "data": json.loads(row["data"]),
+            "operations": [op_id for op_id, in operations],
+        }
+
+    @staticmethod
+    def edit(entry: dict, fields: dict) -> dict:
+        """The edit_entry payload changing `fields` of the entry"""
+        return {"target": entry["target"], "sha": entry["sha"], "fields": fields}
+
+    @staticmethod
+    def delete(entry: dict) -> dict:
+        """The delete_entry payload for the entry"""
+        return {"target": entry["target"], "sha": entry["sha"]}
+
+    def hold(self, op_id: str, entry: dict, fields: dict = None):
+        """Remember a queued edit (of `fields`) or delete (no fields) of the entry"""
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO operations (id, dispatch_id, fields)"
+                " VALUES (?, ?, ?)",
+                (
+                    op_id,
+                    entry["dispatch_id"],
+                    None if fields is None else json.dumps(fields),
+                ),
+            )
+
+    def confirm(self, op_id: str):
+        """
+        Apply a delivered operation to the index, so the next edit builds on
+        it; returns the entry as it was before, None if `op_id` isn't one
+        """
+        op = self.db.execute(
+            "SELECT * FROM operations WHERE id = ?", (op_id,)
+        ).fetchone()
+        if op is None:
+            return None
+        row = self.db.execute(
+            "SELECT * FROM entries WHERE dispatch_id = ?", (op["dispatch_id"],)
+        ).fetchone()
+        entry = {**dict(row), "data": json.loads(row["data"])}
+        with self.db:
+            if op["fields"] is None:
+                self.db.execute(
+                    "UPDATE entries SET deleted = 1 WHERE dispatch_id = ?",
+                    (op["dispatch_id"],),
+                )
+            else:
+                data = {**entry["data"], **json.loads(op["fields"])}
+                self.db.execute(
+                    "UPDATE entries SET sha = ?, data = ? WHERE dispatch_id = ?",
+                    (
+                        git_blob_sha(entry_text(data)),
+                        json.dumps(data),
+                        op["dispatch_id"],
+                    ),
+                )
+            self.db.execute("DELETE FROM operations WHERE id = ?", (op_id,))
+        return entry
+
+    def close(self):
+        self.db.close()
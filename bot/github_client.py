@@ -0,0 +1,183 @@
+import asyncio
+import logging
+
+import aiohttp
+
+from payload_codec import json_size
+
+GITHUB_API_URL = "https://api.github.com"
+
+# Connection pool settings. We only ever talk to api.github.com, so a handful
+# of kept-alive connections is plenty.
+POOL_SIZE = 10
+DNS_CACHE_TTL = 300  # seconds
+KEEPALIVE_TIMEOUT = 60  # seconds
+TIMEOUT = aiohttp.ClientTimeout(total=20, connect=5, sock_read=15)
+
+# repository_dispatch request body limit
+MAX_PAYLOAD_BYTES = 64 * 1024
+
+
+class GitHubClient:
+    """
+    Long-lived, pooled HTTP session for the GitHub REST API
+
+    Create once with `await client.start()` at application startup and
+    `await client.close()` on shutdown, so every dispatch reuses an already
+    open TCP/TLS connection instead of handshaking again.
+
+    With a `quota` (QuotaManager) requests are paced to GitHub's rate limits
+    and the ones answered with a rate limit error are tried again.
+    """
+
+    def __init__(
+        self,
+        token: str,
+        repo: str,
+        api_url: str = GITHUB_API_URL,
+        metrics=None,
+        quota=None,
+    ):
+        self.repo = repo
+        self.api_url = api_url.rstrip("/")
+        self.headers = {
+            "Accept": "application/vnd.github+json",
+            "Authorization": f"Bearer {token}",
+        }
+        self.session = None
+        self.metrics = metrics
+        self.quota = quota
+        self.stats = {
+            "requests": 0,
+            "connections_created": 0,
+            "connections_reused": 0,
+            "dns_cache_hits": 0,
+            "dns_cache_misses": 0,
+        }
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+
+        def counter(key):
+            async def inc(session, ctx, params):
+                self.stats[key] += 1
+
+            return inc
+
+        trace.on_request_start.append(counter("requests"))
+        trace.on_connection_create_end.append(counter("connections_created"))
+        trace.on_connection_reuseconn.append(counter("connections_reused"))
+        trace.on_dns_cache_hit.append(counter("dns_cache_hits"))
+        trace.on_dns_cache_miss.append(counter("dns_cache_misses"))
+
+        if self.metrics is not None:
+            trace.on_request_start.append(self._request_started)
+            trace.on_request_end.append(self._request_finished)
+            trace.on_request_exception.append(self._request_finished)
+        return trace
+
+    @staticmethod
+    def _operation(url) -> str:
+        """/repos/o/r/git/trees -> git/trees, /repos/o/r/dispatches -> dispatches"""
+        parts = url.path.strip("/").split("/")[3:]
+        return "/".join(parts[:2] if parts[:1] == ["git"] else parts[:1])
+
+    async def _request_started(self, session, ctx, params):
+        ctx.start = asyncio.get_running_loop().time()
+
+    async def _request_finished(self, session, ctx, params):
+        operation = self._operation(params.url)
+        status = params.response.status if hasattr(params, "response") else "error"
+        self.metrics.github_requests.inc(operation=operation, status=status)
+        self.metrics.github_latency.observe(
+            asyncio.get_running_loop().time() - ctx.start, operation=operation
+        )
+
+    async def start(self):
+        """Open the shared session"""
+        if self.session is not None:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=POOL_SIZE,
+            limit_per_host=POOL_SIZE,
+            ttl_dns_cache=DNS_CACHE_TTL,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            headers=self.headers,
+            timeout=TIMEOUT,
+            trace_configs=[self._trace_config()],
+        )
+
+    async def close(self):
+        """Close the shared session and its pooled connections"""
+        if self.session is None:
+            return
+        logging.info(f"Closing GitHub session, stats: {self.format_stats()}")
+        await self.session.close()
+        self.session = None
+
+    def format_stats(self) -> str:
+        return ", ".join(f"{key}={value}" for key, value in self.stats.items())
+
+    async def request(self, method: str, path: str, **kwargs):
+        """Call the API on the shared session, returns (status, decoded json or None)"""
+        if self.session is None:
+            await self.start()
+        attempts = 1 if self.quota is None else self.quota.max_retries
+        for attempt in range(1, attempts + 1):
+            if self.quota is not None:
+                await self.quota.acquire(self.quota.github_keys(method))
+            async with self.session.request(
+                method, f"{self.api_url}{path}", **kwargs
+            ) as response:
+                data = None
+                if response.content_type == "application/json":
+                    data = await response.json()
+                else:
+                    await response.read()
+                limited = self.quota is not None and self.quota.github_response(
+                    method, response.status, response.headers
+                )
+                if not limited or attempt == attempts:
+                    return response.status, data
+
+    async def dispatch(self, event_type: str, payload: dict) -> bool:
+        """
+        Trigger GitHub Action to save content via repository_dispatch event
+
+        Args:
+            event_type: repository_dispatch event type (add_thought, add_press, add_batch)
+            payload: client_payload for the workflow
+
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        if self.session is None:
+            await self.start()
+
+        data = {
+            "event_type": event_type,
+            "client_payload": payload,
+        }
+
+        # GitHub rejects larger bodies, DispatchBackend encodes entries to fit
+        size = json_size(data)
+        if size > MAX_PAYLOAD_BYTES:
+            logging.error(
+                f"Not dispatching {event_type}: {size} bytes, limit {MAX_PAYLOAD_BYTES}"
+            )
+            return False
+
+        logging.info(f"Attempting to run action {event_type} ({size} bytes)")
+
+        try:
+            status, _ = await self.request(
+                "POST", f"/repos/{self.repo}/dispatches", json=data
+            )
+            logging.info(f"github responded: {status}")
+            return status == 204  # GitHub returns 204 No Content on success
+        except Exception as e:
+            logging.error(f"Error triggering GitHub Action: {e}")
+            return False
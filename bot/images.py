@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import aiohttp
+from PIL import Image, ImageOps
+
+# longest side of the web-size variants and of the thumbnail
+WEB_SIZE = 1600
+THUMB_SIZE = 400
+WEBP_QUALITY = 80
+AVIF_QUALITY = 60
+CHUNK_SIZE = 64 * 1024
+# Bot API downloads are capped at 20 MB anyway
+MAX_DOWNLOAD_BYTES = 20 * 1024 * 1024
+DOWNLOAD_TIMEOUT = aiohttp.ClientTimeout(total=120, sock_read=30)
+
+
+def render_variants(source: str, out_dir: str, stem: str) -> dict:
+    """
+    Write <stem>.webp, <stem>.avif and <stem>-thumb.webp for one photo
+
+    Runs in a worker process. JPEG is decoded straight at a reduced scale
+    (draft mode), so a 20 MB upload never turns into a full-size bitmap:
+    memory per worker stays around what the web-size image needs.
+    """
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    with Image.open(source) as image:
+        # draft wants the smallest size both sides must still reach
+        scale = WEB_SIZE / max(image.size)
+        image.draft("RGB", (int(image.width * scale), int(image.height * scale)))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+    image.thumbnail((WEB_SIZE, WEB_SIZE), Image.Resampling.LANCZOS)
+    image.save(out / f"{stem}.webp", "WEBP", quality=WEBP_QUALITY, method=4)
+    image.save(out / f"{stem}.avif", "AVIF", quality=AVIF_QUALITY)
+    width, height = image.size
+    image.thumbnail((THUMB_SIZE, THUMB_SIZE), Image.Resampling.LANCZOS)
+    image.save(out / f"{stem}-thumb.webp", "WEBP", quality=WEBP_QUALITY, method=4)
+    return {
+        "webp": f"{stem}.webp",
+        "avif": f"{stem}.avif",
+        "thumb": f"{stem}-thumb.webp",
+        "width": width,
+        "height": height,
+    }
+
+
+class ImagePipeline:
+    """
+    Turn a Telegram photo into the web-size variants a thought shows
+
+    The file is streamed from Telegram into a temporary file, the resizing and
+    encoding happen in a process pool (one worker per core by default), so
+    neither the download nor the CPU-heavy part holds up the event loop, and
+    encoding several photos at once uses all cores.
+
+    Variants are written to `staging_dir` under the same relative path they
+    get in src/bot_gen/ (e.g. thoughts/2025-04/<stem>.webp); the storage
+    backend commits them from there next to the entry's JSON.
+    """
+
+    def __init__(self, staging_dir: Path, workers: int = None):
+        self.staging_dir = Path(staging_dir)
+        self.workers = workers or os.cpu_count()
+        self.pool = None
+        self.session = None
+
+    async def start(self):
+        if self.pool is None:
+            # spawn, forking a process with a running event loop isn't safe
+            self.pool = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            self.session = aiohttp.ClientSession(timeout=DOWNLOAD_TIMEOUT)
+
+    async def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+            await self.session.close()
+            self.session = None
+
+    async def download(self, url: str, dest) -> int:
+        """Stream `url` into the open file `dest`, returns the size"""
+        size = 0
+        async with self.session.get(url) as response:
+            # not raise_for_status(), its message has the url with the bot token
+            if response.status != 200:
+                raise ValueError(f"photo download failed ({response.status})")
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                size += len(chunk)
+                if size > MAX_DOWNLOAD_BYTES:
+                    raise ValueError(f"photo larger than {MAX_DOWNLOAD_BYTES} bytes")
+                dest.write(chunk)
+        return size
+
+    async def process(self, url: str, folder: str, stem: str) -> tuple:
+        """
+        Download the photo at `url` and render its variants into
+        staging_dir/<folder>/
+
+        Returns (image info for the entry, files to commit), paths relative to
+        the content root.
+        """
+        if self.pool is None:
+            await self.start()
+        stem = f"{stem}-{uuid.uuid4().hex[:8]}"
+        fd, source = tempfile.mkstemp(prefix="photo-", suffix=".jpg")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                size = await self.download(url, f)
+            logging.info(f"Downloaded photo for {folder}/{stem} ({size} bytes)")
+            variants = await asyncio.get_running_loop().run_in_executor(
+                self.pool,
+                render_variants,
+                source,
+                str(self.staging_dir / folder),
+                stem,
+            )
+        finally:
+            os.unlink(source)
+
+        for key in ("webp", "avif", "thumb"):
+            variants[key] = f"{folder}/{variants[key]}"
+        media = [variants[key] for key in ("webp", "avif", "thumb")]
+        return variants, media
+
+    def discard(self, media: list):
+        """Remove staged files once they are committed"""
+        for path in media:
+            (self.staging_dir / path).unlink(missing_ok=True)
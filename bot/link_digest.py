@@ -0,0 +1,77 @@
+import asyncio
+import logging
+
+# one inline button per link plus the approve/reject row, Telegram allows 100
+MAX_DIGEST_LINKS = 50
+
+
+class LinkDigest:
+    """
+    Collect detected links and announce them to the admin in one message
+
+    The first link starts a `window` second timer; when it runs out, or as
+    soon as `max_links` links are waiting, everything collected is handed to
+    `send(items)` in one go. A busy group then costs one admin message per
+    window instead of one per link.
+
+    If `send()` fails, the items are kept for the next window (no extra
+    attempts in between, however many links come in). `close()` tries once
+    more and hands back what still couldn't be sent.
+    """
+
+    def __init__(self, send, window: float, max_links: int = 10):
+        self.send = send
+        self.window = window
+        self.max_links = min(max_links, MAX_DIGEST_LINKS)
+        self.items = []
+        self.timer = None
+        self.failing = False
+        self.closed = False
+
+    def __len__(self):
+        return len(self.items)
+
+    async def add(self, item: dict):
+        self.items.append(item)
+        if len(self.items) >= self.max_links and not self.failing:
+            await self.flush()
+        elif self.timer is None:
+            self.timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        self.timer = None
+        await self.flush()
+
+    async def flush(self):
+        """Send what's collected right away"""
+        if self.timer is not None and self.timer is not asyncio.current_task():
+            self.timer.cancel()
+            self.timer = None
+        items, self.items = self.items, []
+        sent = 0
+        try:
+            # more than max_links only after failed sends
+            while sent < len(items):
+                batch = items[sent : sent + self.max_links]
+                await self.send(batch)
+                sent += len(batch)
+        except Exception as e:
+            # keep them for the next window, ahead of what came in meanwhile
+            self.items = items[sent:] + self.items
+            self.failing = True
+            logging.error(
+                f"Error sending digest of {len(items) - sent} links, "
+                f"trying again in {self.window}s: {e}"
+            )
+            if self.timer is None and not self.closed:
+                self.timer = asyncio.create_task(self._flush_later())
+            return
+        self.failing = False
+
+    async def close(self) -> list:
+        """Send what's collected, returns the items that couldn't be"""
+        self.closed = True
+        await self.flush()
+        items, self.items = self.items, []
+        return items
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Re-check the links of the selected_press archive
+
+    python link_rot.py [--content-dir ../src/bot_gen] [--db link_checks.sqlite3]
+
+runs one sweep (or finishes an interrupted one) and prints what is dead or
+redirected; the bot runs sweeps on its own every link_check_interval_days.
+"""
+
+import argparse
+import asyncio
+import logging
+import sqlite3
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from metadata import USER_AGENT, HostLimits
+from press_index import iter_press_urls
+from urls import MAX_REDIRECTS, canonicalize
+
+GLOBAL_LIMIT = 16
+PER_HOST_LIMIT = 2
+TIMEOUT = aiohttp.ClientTimeout(total=20, connect=10, sock_read=10)
+# a link is only dead after failing this many sweeps in a row (404/410 right away)
+DEAD_AFTER = 2
+GONE = (404, 410)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS link_checks (
+    url TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    status INTEGER,
+    final_url TEXT,
+    etag TEXT,
+    last_modified TEXT,
+    failures INTEGER NOT NULL DEFAULT 0,
+    checked REAL NOT NULL,
+    sweep INTEGER NOT NULL,
+    reported TEXT
+);
+CREATE TABLE IF NOT EXISTS sweeps (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    finished REAL
+);
+"""
+
+
+def same_place(url: str, final_url: str) -> bool:
+    """Whether a redirect is just http -> https, www. or a trailing slash"""
+
+    def normalized(u: str) -> str:
+        parts = urlsplit(canonicalize(u))
+        host = (parts.hostname or "").removeprefix("www.")
+        return f"{host}{parts.path.rstrip('/')}?{parts.query}"
+
+    return normalized(url) == normalized(final_url)
+
+
+class LinkRotChecker:
+    """
+    Sweep every selected_press link and remember which ones stopped working
+
+    Each link gets a HEAD request, and a GET for the first byte only (Range:
+    bytes=0-0) if the server doesn't like HEAD. Links that answered with an
+    ETag or Last-Modified before are asked conditionally, so an unchanged
+    page is a bodyless 304. At most GLOBAL_LIMIT requests run at a time and
+    PER_HOST_LIMIT against the same host; a slot for the host is taken
+    before a global one, so a slow host doesn't hold up the others.
+
+    Every result is committed as it comes in, tagged with the sweep, and an
+    interrupted sweep (restart, crash) continues with the links it hadn't
+    checked yet. When a sweep is done `on_report(summary)` is awaited with
+    the links that went dead or got redirected since the last report.
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        press_dir: Path,
+        interval: float = 7 * 24 * 3600,
+        on_report=None,
+        global_limit: int = GLOBAL_LIMIT,
+        per_host_limit: int = PER_HOST_LIMIT,
+    ):
+        self.db = sqlite3.connect(db_path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+        self.press_dir = Path(press_dir)
+        self.interval = interval
+        self.on_report = on_report
+        self.global_limit = asyncio.Semaphore(global_limit)
+        self.host_limits = HostLimits(per_host_limit)
+        self.session = None
+        self.task = None
+        self._wakeup = asyncio.Event()
+        self.running = False
+
+    async def start(self):
+        """Open the session and sweep in the background every `interval`"""
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=0, ttl_dns_cache=300),
+                headers={"User-Agent": USER_AGENT},
+                timeout=TIMEOUT,
+            )
+        if self.task is None and self.interval:
+            self.task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Stop sweeping, a sweep in progress continues next start"""
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        self.db.close()
+
+    def trigger(self):
+        """Start a sweep now instead of when it's due"""
+        if self.task is None or self.task.done():
+            # no periodic sweeps (interval 0), just this one
+            self.task = asyncio.create_task(self.sweep())
+        else:
+            self._wakeup.set()
+
+    def _next_due(self) -> float:
+        """Seconds until the next sweep, 0 if one is due or unfinished"""
+        row = self.db.execute(
+            "SELECT finished FROM sweeps ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+        if row is None or row["finished"] is None:
+            return 0
+        return max(0, row["finished"] + self.interval - time.time())
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._next_due())
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.sweep()
+            except Exception as e:
+                logging.error(f"Link check sweep failed: {e}")
+                await asyncio.sleep(600)
+
+    def _current_sweep(self) -> int:
+        row = self.db.execute(
+            "SELECT id FROM sweeps WHERE finished IS NULL ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+        if row is not None:
+            return row["id"]
+        with self.db:
+            return self.db.execute(
+                "INSERT INTO sweeps (started) VALUES (?)", (time.time(),)
+            ).lastrowid
+
+    async def _request(self, method: str, url: str, headers: dict) -> tuple:
+        async with self.session.request(
+            method, url, headers=headers, max_redirects=MAX_REDIRECTS
+        ) as response:
+            # the body is never read, leaving the block drops the connection
+            return response.status, str(response.url), response.headers
+
+    async def check(self, url: str, previous) -> dict:
+        """Check one link, `previous` is its last row (or None)"""
+        headers = {}
+        if previous is not None and previous["state"] == "ok":
+            if previous["etag"]:
+                headers["If-None-Match"] = previous["etag"]
+            if previous["last_modified"]:
+                headers["If-Modified-Since"] = previous["last_modified"]
+
+        result = {
+            "status": None,
+            "final_url": None,
+            "etag": None,
+            "last_modified": None,
+        }
+        try:
+            try:
+                status, final_url, response_headers = await self._request(
+                    "HEAD", url, headers
+                )
+            except aiohttp.ClientResponseError:
+                status = None
+            if status is None or status >= 400:
+                # HEAD is unsupported or refused by some servers, or bot-blocked
+                status, final_url, response_headers = await self._request(
+                    "GET", url, {**headers, "Range": "bytes=0-0"}
+                )
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            failures = (previous["failures"] if previous else 0) + 1
+            logging.info(f"Link check of {url} failed ({failures}x): {e!r}")
+            return {
+                **result,
+                "state": "dead" if failures >= DEAD_AFTER else "error",
+                "failures": failures,
+            }
+
+        if status == 304 and previous is not None:
+            return {**dict(previous), "status": 304, "failures": 0}
+        result.update(
+            status=status,
+            final_url=final_url,
+            etag=response_headers.get("ETag"),
+            last_modified=response_headers.get("Last-Modified"),
+        )
+        if status >= 400:
+            failures = (previous["failures"] if previous else 0) + 1
+            dead = status in GONE or failures >= DEAD_AFTER
+            return {
+                **result,
+                "state": "dead" if dead else "error",
+                "failures": failures,
+            }
+        state = "ok" if same_place(url, final_url) else "redirected"
+        return {**result, "state": state, "failures": 0}
+
+    async def _check_and_store(self, url: str, previous, sweep: int):
+        host = urlsplit(url).hostname or ""
+        async with self.host_limits(host):
+            async with self.global_limit:
+                result = await self.check(url, previous)
+        with self.db:
+            self.db.execute(
+                "INSERT INTO link_checks (url, state, status, final_url, etag,"
+                " last_modified, failures, checked, sweep)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (url) DO UPDATE SET state = excluded.state,"
+                " status = excluded.status, final_url = excluded.final_url,"
+                " etag = excluded.etag, last_modified = excluded.last_modified,"
+                " failures = excluded.failures, checked = excluded.checked,"
+                " sweep = excluded.sweep",
+                (
+                    url,
+                    result["state"],
+                    result["status"],
+                    result["final_url"],
+                    result["etag"],
+                    result["last_modified"],
+                    result["failures"],
+                    time.time(),
+                    sweep,
+                ),
+            )
+
+    async def sweep(self) -> dict:
+        """Check every archived link not checked in this sweep yet, then report"""
+        if self.session is None:
+            await self.start()
+        self.running = True
+        try:
+            sweep = self._current_sweep()
+            start = time.perf_counter()
+            urls = list(
+                dict.fromkeys(url for url, _ in iter_press_urls(self.press_dir))
+            )
+            previous = {
+                row["url"]: row for row in self.db.execute("SELECT * FROM link_checks")
+            }
+            todo = [
+                url
+                for url in urls
+                if url not in previous or previous[url]["sweep"] != sweep
+            ]
+            logging.info(
+                f"Link check sweep {sweep}: {len(todo)} of {len(urls)} links to check"
+            )
+            await asyncio.gather(
+                *(self._check_and_store(url, previous.get(url), sweep) for url in todo)
+            )
+            with self.db:
+                self.db.execute(
+                    "UPDATE sweeps SET finished = ? WHERE id = ?", (time.time(), sweep)
+                )
+            summary = self.summary(urls)
+            summary["checked"] = len(todo)
+            summary["seconds"] = time.perf_counter() - start
+        finally:
+            self.running = False
+
+        if self.on_report is not None and (summary["dead"] or summary["redirected"]):
+            await self.on_report(summary)
+        self.mark_reported(summary)
+        return summary
+
+    def summary(self, urls: list) -> dict:
+        """Links of `urls` that went dead or got redirected since last reported"""
+        archived = set(urls)
+        rows = self.db.execute(
+            "SELECT * FROM link_checks WHERE state IN ('dead', 'redirected')"
+        )
+        summary = {"links": len(urls), "dead": [], "redirected": [], "known": 0}
+        for row in rows:
+            # links removed from the archive keep their row but don't count
+            if row["url"] not in archived:
+                continue
+            if row["reported"] == report_key(row):
+                summary["known"] += 1
+            else:
+                summary[row["state"]].append(dict(row))
+        return summary
+
+    def mark_reported(self, summary: dict):
+        with self.db:
+            self.db.executemany(
+                "UPDATE link_checks SET reported = ? WHERE url = ?",
+                [
+                    (report_key(row), row["url"])
+                    for row in summary["dead"] + summary["redirected"]
+                ],
+            )
+            # a link that came back gets reported again if it breaks again
+            self.db.execute("UPDATE link_checks SET reported = NULL WHERE state = 'ok'")
+
+
+def report_key(row) -> str:
+    return f"{row['state']} {row['final_url'] or ''}"
+
+
+async def run_once(content_dir: Path, db_path: Path):
+    checker = LinkRotChecker(db_path, content_dir / "selected_press", interval=0)
+    try:
+        summary = await checker.sweep()
+    finally:
+        await checker.close()
+    print(
+        f"checked {summary['checked']} of {summary['links']} links in "
+        f"{summary['seconds']:.1f}s, {summary['known']} already reported"
+    )
+    for row in summary["dead"]:
+        print(f"dead ({row['status'] or 'unreachable'}): {row['url']}")
+    for row in summary["redirected"]:
+        print(f"redirected: {row['url']} -> {row['final_url']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--content-dir", type=Path, default=Path("../src/bot_gen"))
+    parser.add_argument("--db", type=Path, default=Path("link_checks.sqlite3"))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_once(args.content_dir, args.db))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import asyncio
+import codecs
+import contextlib
+import json
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from html.parser import HTMLParser
+from pathlib import Path
+from urllib.parse import urljoin, urlsplit
+
+import aiohttp
+from urls import canonicalize
+
+MAX_HEAD_BYTES = 256 * 1024  # stop reading if </head> didn't show up by then
+CHUNK_SIZE = 8 * 1024
+PER_HOST_LIMIT = 2
+TIMEOUT = aiohttp.ClientTimeout(total=8, connect=4, sock_read=4)
+LRU_SIZE = 512
+CACHE_TTL = 7 * 24 * 3600  # seconds
+USER_AGENT = "Mozilla/5.0 (compatible; marzolo-web-bot; +https://www.marzolo.com)"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS page_metadata (
+    url TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    fetched REAL NOT NULL
+)
+"""
+
+
+class NoMetadata(Exception):
+    """The page can't tell us anything right now (error status, not HTML)"""
+
+
+class HostLimits:
+    """
+    At most `limit` requests at a time per host
+
+    A host's semaphore only lives while something holds or waits for it, so
+    hosts seen once don't pile up.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        # host -> [semaphore, holders and waiters]
+        self.hosts = {}
+
+    def __len__(self):
+        return len(self.hosts)
+
+    @contextlib.asynccontextmanager
+    async def __call__(self, host: str):
+        entry = self.hosts.setdefault(host, [asyncio.Semaphore(self.limit), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self.hosts[host]
+
+
+class HeadParser(HTMLParser):
+    """Collects <title> and description/og:image meta tags until </head>"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.done = False
+        self.meta = {}
+        self._title = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "body":
+            self.done = True
+        elif tag == "title" and "title" not in self.meta:
+            self._title = []
+        elif tag == "meta":
+            attrs = dict(attrs)
+            key = (attrs.get("property") or attrs.get("name") or "").lower()
+            content = (attrs.get("content") or "").strip()
+            if content and key in (
+                "og:title",
+                "og:description",
+                "description",
+                "og:image",
+            ):
+                self.meta.setdefault(key, content)
+
+    def handle_endtag(self, tag):
+        if tag == "title" and self._title is not None:
+            self.meta["title"] = " ".join("".join(self._title).split())
+            self._title = None
+        elif tag == "head":
+            self.done = True
+
+    def handle_data(self, data):
+        if self._title is not None:
+            self._title.append(data)
+
+    def result(self) -> dict:
+        return {
+            "title": self.meta.get("og:title") or self.meta.get("title"),
+            "description": self.meta.get("og:description")
+            or self.meta.get("description"),
+            "image": self.meta.get("og:image"),
+        }
+
+
+class MetadataFetcher:
+    """
+    Fetch title, description and og:image of shared links
+
+    Only the <head> is read: the body is streamed through the parser and the
+    download stops at </head> (or after MAX_HEAD_BYTES). At most
+    PER_HOST_LIMIT requests run against the same host. Results are kept in an
+    in-memory LRU backed by an SQLite cache, both keyed by canonical url.
+    """
+
+    def __init__(self, cache_path: Path):
+        self.db = sqlite3.connect(cache_path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(SCHEMA)
+        self.db.commit()
+        self.lru = OrderedDict()
+        self.host_limits = HostLimits(PER_HOST_LIMIT)
+        self.session = None
+
+    async def start(self):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=20, ttl_dns_cache=300),
+                headers={"User-Agent": USER_AGENT, "Accept": "text/html"},
+                timeout=TIMEOUT,
+            )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        self.db.close()
+
+    def _cached(self, key: str):
+        if key in self.lru:
+            self.lru.move_to_end(key)
+            return self.lru[key]
+        row = self.db.execute(
+            "SELECT data FROM page_metadata WHERE url = ? AND fetched > ?",
+            (key, time.time() - CACHE_TTL),
+        ).fetchone()
+        if row is None:
+            return None
+        meta = json.loads(row[0])
+        self._remember(key, meta)
+        return meta
+
+    def _remember(self, key: str, meta: dict):
+        self.lru[key] = meta
+        self.lru.move_to_end(key)
+        if len(self.lru) > LRU_SIZE:
+            self.lru.popitem(last=False)
+
+    async def _download(self, url: str) -> dict:
+        parser = HeadParser()
+        async with self.session.get(url) as response:
+            if response.status >= 400:
+                raise NoMetadata(f"HTTP {response.status}")
+            if response.content_type not in ("text/html", "application/xhtml+xml"):
+                raise NoMetadata(f"not HTML: {response.content_type}")
+            decoder = codecs.getincrementaldecoder(response.charset or "utf-8")(
+                errors="replace"
+            )
+            read = 0
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                read += len(chunk)
+                parser.feed(decoder.decode(chunk))
+                if parser.done or read >= MAX_HEAD_BYTES:
+                    break
+            meta = parser.result()
+            if meta["image"]:
+                # og:image is often relative to the (possibly redirected) page
+                meta["image"] = urljoin(str(response.url), meta["image"])
+        return meta
+
+    async def fetch(self, url: str) -> dict:
+        """Return {"title", "description", "image"} for url, values may be None"""
+        key = canonicalize(url)
+        meta = self._cached(key)
+        if meta is not None:
+            return meta
+
+        if self.session is None:
+            await self.start()
+        host = urlsplit(key).hostname or ""
+        try:
+            async with self.host_limits(host):
+                meta = await self._download(url)
+        except (
+            NoMetadata,
+            aiohttp.ClientError,
+            asyncio.TimeoutError,
+            UnicodeError,
+            LookupError,
+        ) as e:
+            # don't cache failures, the site may just be having a bad minute
+            logging.info(f"Could not fetch metadata for {url}: {e!r}")
+            return {"title": None, "description": None, "image": None}
+
+        self._remember(key, meta)
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO page_metadata (url, data, fetched) VALUES (?, ?, ?)",
+                (key, json.dumps(meta), time.time()),
+            )
+        return meta
@@ -0,0 +1,177 @@
+import functools
+import time
+from collections import defaultdict
+
+# seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra="") -> str:
+    pairs = [f'{n}="{escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = defaultdict(float)
+
+    def inc(self, amount: float = 1, **labels):
+        self.values[tuple(str(labels[n]) for n in self.labels)] += amount
+
+    def render(self):
+        for key, value in sorted(self.values.items()):
+            yield f"{self.name}{format_labels(self.labels, key)} {value:g}"
+
+
+class Gauge:
+    """Value read from a callback at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, read):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def render(self):
+        yield f"{self.name} {self.read():g}"
+
+
+class ReadCounter(Gauge):
+    """Count that only goes up, read from a callback at scrape time"""
+
+    kind = "counter"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket..., +Inf count], sum
+        self.counts = defaultdict(lambda: [0] * (len(self.buckets) + 1))
+        self.sums = defaultdict(float)
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[n]) for n in self.labels)
+        counts = self.counts[key]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        self.sums[key] += value
+
+    def render(self):
+        for key in sorted(self.counts):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), self.counts[key]):
+                cumulative += count
+                le = format_labels(self.labels, key, f'le="{bound}"')
+                yield f"{self.name}_bucket{le} {cumulative}"
+            labels = format_labels(self.labels, key)
+            yield f"{self.name}_sum{labels} {self.sums[key]:g}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Metrics:
+    """
+    Tiny Prometheus-style registry for the bot
+
+    Handler metrics are filled by the `track_handler` decorator, GitHub ones
+    by GitHubClient; anything else is read at scrape time, registered with
+    `gauge()` (queue depths) or `read_counter()` (reload counts).
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.handler_calls = self.counter(
+            "bot_handler_calls_total", "Handler invocations", ["handler"]
+        )
+        self.handler_errors = self.counter(
+            "bot_handler_errors_total",
+            "Handler invocations that raised",
+            ["handler", "error"],
+        )
+        self.handler_latency = self.histogram(
+            "bot_handler_latency_seconds", "Handler run time", ["handler"]
+        )
+        self.github_requests = self.counter(
+            "bot_github_requests_total", "GitHub API responses", ["operation", "status"]
+        )
+        self.github_latency = self.histogram(
+            "bot_github_latency_seconds", "GitHub API request time", ["operation"]
+        )
+        self.rate_limited = self.counter(
+            "bot_rate_limited_total",
+            "Responses telling the bot to slow down (see quota.py)",
+            ["api"],
+        )
+
+    def counter(self, name: str, help: str, labels=()) -> Counter:
+        metric = Counter(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help: str, read) -> Gauge:
+        metric = Gauge(name, help, read)
+        self.metrics.append(metric)
+        return metric
+
+    def read_counter(self, name: str, help: str, read) -> ReadCounter:
+        metric = ReadCounter(name, help, read)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def track_handler(func):
+    """
+    Decorator recording calls, latency and errors of a handler in self.metrics,
+    and its span in self.tracer (starting the update's trace, see tracing.py)
+    """
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(self, update, context):
+        metrics = self.metrics
+        metrics.handler_calls.inc(handler=name)
+        start = time.perf_counter()
+        try:
+            with self.tracer.handler(name, update):
+                return await func(self, update, context)
+        except Exception as e:
+            metrics.handler_errors.inc(handler=name, error=type(e).__name__)
+            raise
+        finally:
+            metrics.handler_latency.observe(time.perf_counter() - start, handler=name)
+
+    return wrapper
@@ -0,0 +1,268 @@
+import asyncio
+import json
+import logging
+import random
+import sqlite3
+import time
+import uuid
+from pathlib import Path
+
+from dispatch_queue import DispatchBatcher
+from tracing import current_trace_id
+
+# Retry schedule: BASE_DELAY * 2^(attempts - 1), capped, with jitter
+BASE_DELAY = 5  # seconds
+MAX_DELAY = 30 * 60  # seconds
+# how long a graceful shutdown may spend delivering what's left
+SHUTDOWN_GRACE = 10  # seconds
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id TEXT PRIMARY KEY,
+    action TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    notify TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    created REAL NOT NULL,
+    last_error TEXT
+)
+"""
+
+
+def backoff(attempts: int) -> float:
+    """Delay before the next attempt, with jitter so retries don't stampede"""
+    delay = min(MAX_DELAY, BASE_DELAY * 2 ** (attempts - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class Outbox:
+    """
+    Durable queue of outgoing dispatches backed by SQLite (WAL mode)
+
+    Handlers `enqueue()` entries, which is just a local insert, and return
+    right away. A background worker hands due entries to the DispatchBatcher
+    and deletes them once GitHub accepted them; failures are retried with
+    exponential backoff. Rows survive restarts, so delivery is at-least-once:
+    every entry carries its `dispatch_id` so the workflow can skip repeats.
+
+    `on_delivered(entry)` and `on_failed(entry)` are awaited with the stored
+    row (as a dict) so the bot can report back to the original message.
+    Entries queued together share their `notify`, which the callbacks only
+    see once for all of them: on_delivered with the last one delivered,
+    on_failed with the first one that fails.
+
+    Entries queued while handling an update carry its "trace_id"; with a
+    `tracer` their time in the queue and the delivery are recorded as spans.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        batcher: DispatchBatcher,
+        on_delivered=None,
+        on_failed=None,
+        tracer=None,
+    ):
+        self.path = Path(path)
+        self.batcher = batcher
+        self.on_delivered = on_delivered
+        self.on_failed = on_failed
+        self.tracer = tracer
+        self.db = sqlite3.connect(self.path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(SCHEMA)
+        self.db.commit()
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self.task = None
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def __contains__(self, dispatch_id: str):
+        """Whether that entry is still waiting to be delivered"""
+        return (
+            self.db.execute(
+                "SELECT 1 FROM outbox WHERE id = ?", (dispatch_id,)
+            ).fetchone()
+            is not None
+        )
+
+    def enqueue(self, action: str, payload: dict, notify: dict = None) -> str:
+        """Persist an entry for delivery, returns its idempotency key"""
+        return self.enqueue_many([(action, payload)], notify)[0]
+
+    def enqueue_many(self, entries: list, notify: dict = None) -> list:
+        """
+        Persist several (action, payload) entries in one transaction
+
+        `notify` goes with every entry, they can leave in different dispatches
+        and be retried apart. Returns the entries' idempotency keys.
+        """
+        now = time.time()
+        trace_id = current_trace_id()
+        if trace_id:
+            entries = [
+                (action, {**payload, "trace_id": trace_id})
+                for action, payload in entries
+            ]
+        rows = [
+            (
+                uuid.uuid4().hex,
+                action,
+                json.dumps(payload),
+                json.dumps(notify) if notify is not None else None,
+                now,
+                now,
+            )
+            for action, payload in entries
+        ]
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO outbox (id, action, payload, notify, next_attempt, created)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        self._wakeup.set()
+        return [row[0] for row in rows]
+
+    def _due(self) -> list:
+        rows = self.db.execute(
+            "SELECT * FROM outbox WHERE next_attempt <= ? ORDER BY created",
+            (time.time(),),
+        ).fetchall()
+        return [self._to_entry(row) for row in rows]
+
+    def _next_wakeup(self):
+        row = self.db.execute("SELECT MIN(next_attempt) FROM outbox").fetchone()
+        if row[0] is None:
+            return None
+        return max(0, row[0] - time.time())
+
+    @staticmethod
+    def _to_entry(row: sqlite3.Row) -> dict:
+        entry = dict(row)
+        entry["payload"] = json.loads(entry["payload"])
+        entry["notify"] = json.loads(entry["notify"]) if entry["notify"] else None
+        return entry
+
+    async def _deliver(self, entries: list):
+        start = time.time()
+        results = await asyncio.gather(
+            *(
+                self.batcher.submit(
+                    entry["action"], {**entry["payload"], "dispatch_id": entry["id"]}
+                )
+                for entry in entries
+            ),
+            return_exceptions=True,
+        )
+        end = time.time()
+        for entry, result in zip(entries, results):
+            self._trace(entry, result, start, end)
+            if result is True:
+                with self.db:
+                    self.db.execute("DELETE FROM outbox WHERE id = ?", (entry["id"],))
+                callback = self.on_delivered
+            else:
+                entry["attempts"] += 1
+                entry["last_error"] = (
+                    str(result) if isinstance(result, Exception) else "dispatch failed"
+                )
+                delay = backoff(entry["attempts"])
+                logging.warning(
+                    f"Dispatch {entry['id']} failed ({entry['attempts']} attempts), "
+                    f"retrying in {delay:.0f}s"
+                )
+                with self.db:
+                    self.db.execute(
+                        "UPDATE outbox SET attempts = ?, next_attempt = ?, last_error = ?"
+                        " WHERE id = ?",
+                        (
+                            entry["attempts"],
+                            time.time() + delay,
+                            entry["last_error"],
+                            entry["id"],
+                        ),
+                    )
+                callback = self.on_failed
+            if entry["notify"] is not None and self._reported(entry, result is True):
+                entry["notify"] = None
+            if callback is not None:
+                try:
+                    await callback(entry)
+                except Exception as e:
+                    logging.error(f"Outbox callback failed for {entry['id']}: {e}")
+
+    def _reported(self, entry: dict, delivered: bool) -> bool:
+        """Whether another entry queued with this one has or will report back"""
+        # a delivery is reported by the last of them, a failure by the first
+        condition = "" if delivered else " AND attempts > 0"
+        row = self.db.execute(
+            "SELECT 1 FROM outbox WHERE notify = ? AND id != ?" + condition,
+            (json.dumps(entry["notify"]), entry["id"]),
+        ).fetchone()
+        return row is not None
+
+    def _trace(self, entry: dict, result, start: float, end: float):
+        trace_id = entry["payload"].get("trace_id")
+        if self.tracer is None or not trace_id:
+            return
+        attempt = entry["attempts"] + 1
+        if result is not True:
+            error = str(result) if isinstance(result, Exception) else "dispatch failed"
+            self.tracer.add(
+                "dispatch_failed", trace_id, start, end, error=error, attempt=attempt
+            )
+            return
+        self.tracer.add(
+            "queue", trace_id, entry["created"], start, dispatch_id=entry["id"]
+        )
+        self.tracer.add(
+            "dispatch",
+            trace_id,
+            start,
+            end,
+            dispatch_id=entry["id"],
+            action=entry["action"],
+            attempt=attempt,
+        )
+
+    async def _run(self):
+        while not self._closing:
+            due = self._due()
+            if due:
+                await self._deliver(due)
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._next_wakeup())
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self):
+        if self.task is None:
+            pending = len(self)
+            if pending:
+                logging.info(f"Outbox has {pending} undelivered entries from last run")
+            self.task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Let in-flight deliveries finish, try once more for what's due, then close"""
+        if self.task is not None:
+            self._closing = True
+            self._wakeup.set()
+            await self.task
+            self.task = None
+            due = self._due()
+            if due:
+                try:
+                    await asyncio.wait_for(self._deliver(due), SHUTDOWN_GRACE)
+                except asyncio.TimeoutError:
+                    logging.warning(
+                        "Outbox shutdown timed out, entries kept for next run"
+                    )
+        self.db.close()
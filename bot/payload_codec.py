@@ -0,0 +1,94 @@
+"""
+Fit entries into repository_dispatch's client_payload size limit
+
+Used by the bot's DispatchBackend to encode and by bot_gen_writer.py (in the
+workflow, so standard library only) to decode. An entry is sent
+
+- as is, while its JSON is at most COMPRESS_ABOVE bytes
+- compressed, {"action", "dispatch_id", "encoding": "zlib+base64", "data"}
+- split into {"action": "add_chunk", ..., "part", "parts", "data"} pieces of
+  the compressed form, one dispatch each, if even that doesn't fit; the
+  workflow keeps parts in src/bot_gen/_chunks/ until it has all of them
+
+and rejected with PayloadTooLarge past MAX_PARTS pieces.
+"""
+
+import base64
+import json
+import math
+import zlib
+
+ENCODING = "zlib+base64"
+CHUNK_ACTION = "add_chunk"
+COMPRESS_ABOVE = 2 * 1024
+COMPRESSION_LEVEL = 6
+MAX_PARTS = 16
+
+
+class PayloadTooLarge(ValueError):
+    pass
+
+
+def json_size(data) -> int:
+    """Bytes `data` takes in a request body (aiohttp's json= serialization)"""
+    return len(json.dumps(data).encode())
+
+
+def encode_entry(entry: dict, max_bytes: int) -> list:
+    """
+    The pieces to dispatch for `entry` (with its "action"), each of them at
+    most `max_bytes` of JSON
+    """
+    if json_size(entry) <= COMPRESS_ABOVE:
+        return [entry]
+    raw = json.dumps(entry, ensure_ascii=False).encode()
+    data = base64.b64encode(zlib.compress(raw, COMPRESSION_LEVEL)).decode()
+    header = {
+        "action": entry["action"],
+        "dispatch_id": entry.get("dispatch_id"),
+        "encoding": ENCODING,
+    }
+    # the workflow echoes it into the commit, even for a part (see tracing.py)
+    if entry.get("trace_id"):
+        header["trace_id"] = entry["trace_id"]
+    if json_size({**header, "data": data}) <= max_bytes:
+        return [{**header, "data": data}]
+
+    # base64 never needs escaping, so each part's size is exact
+    template = {**header, "action": CHUNK_ACTION, "part": MAX_PARTS, "parts": MAX_PARTS}
+    room = max_bytes - json_size({**template, "data": ""})
+    parts = math.ceil(len(data) / room) if room > 0 else math.inf
+    if parts > MAX_PARTS:
+        raise PayloadTooLarge(
+            f"{entry['action']} entry is {len(raw)} bytes, {len(data)} compressed: "
+            f"more than {MAX_PARTS} dispatches of {max_bytes} bytes"
+        )
+    return [
+        {
+            **header,
+            "action": CHUNK_ACTION,
+            "part": n,
+            "parts": parts,
+            "data": data[n * room : (n + 1) * room],
+        }
+        for n in range(parts)
+    ]
+
+
+def decompress(data: str) -> dict:
+    return json.loads(zlib.decompress(base64.b64decode(data)))
+
+
+def decode_entry(entry: dict) -> dict:
+    """The original entry of a compressed one, anything else unchanged"""
+    if entry.get("encoding") == ENCODING and entry["action"] != CHUNK_ACTION:
+        return decompress(entry["data"])
+    return entry
+
+
+def join_parts(parts: list) -> dict:
+    """The original entry from all of its add_chunk pieces"""
+    parts = sorted(parts, key=lambda part: part["part"])
+    if [part["part"] for part in parts] != list(range(parts[0]["parts"])):
+        raise ValueError(f"incomplete chunks for {parts[0]['dispatch_id']}")
+    return decompress("".join(part["data"] for part in parts))
@@ -0,0 +1,135 @@
+import json
+import logging
+import secrets
+import sqlite3
+import time
+from pathlib import Path
+
+from urls import canonicalize
+
+# links nobody approved or rejected within this time are forgotten
+DEFAULT_TTL = 30 * 24 * 3600  # seconds
+EVICTION_INTERVAL = 3600  # seconds
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending_links (
+    id TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    info TEXT NOT NULL,
+    created REAL NOT NULL
+)
+"""
+
+
+class PendingLinks:
+    """
+    Links waiting for the admin's approval, keyed by a short random id
+
+    The id is what goes in the Approve/Reject buttons' callback_data (8 url-safe
+    characters, well under Telegram's 64 bytes), so removing one link never
+    changes what the other buttons point to. Lookups and removals hit an
+    in-memory dict; every change is written through to SQLite so pending
+    buttons keep working after a restart. Entries older than `ttl` seconds
+    count as gone: a lookup that finds one deletes it, and the rest are evicted
+    every EVICTION_INTERVAL. Links are stored as shared; `find()` compares
+    canonical urls. `clock` returns the current time in seconds.
+    """
+
+    def __init__(self, path: Path, ttl: float = DEFAULT_TTL, clock=time.time):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.clock = clock
+        self.db = sqlite3.connect(self.path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(SCHEMA)
+        self.db.commit()
+        self.links = {
+            link_id: {"url": url, "created": created, **json.loads(info)}
+            for link_id, url, info, created in self.db.execute(
+                "SELECT id, url, info, created FROM pending_links"
+            )
+        }
+        # canonical url -> id
+        self.by_url = {
+            canonicalize(link["url"]): link_id for link_id, link in self.links.items()
+        }
+        self._last_eviction = 0
+        self.evict_expired()
+
+    def __len__(self):
+        return len(self.links)
+
+    def __contains__(self, link_id: str):
+        return self.get(link_id) is not None
+
+    def find(self, url: str):
+        """Id of the pending link with this url (or another form of it), if any"""
+        link_id = self.by_url.get(canonicalize(url))
+        return link_id if self.get(link_id) is not None else None
+
+    def _new_id(self) -> str:
+        while True:
+            link_id = secrets.token_urlsafe(6)
+            if link_id not in self.links:
+                return link_id
+
+    def add(self, url: str, **info) -> str:
+        """Store a link (plus any extra json-able info), returns its id"""
+        self.evict_expired()
+        link_id = self._new_id()
+        created = self.clock()
+        with self.db:
+            self.db.execute(
+                "INSERT INTO pending_links (id, url, info, created) VALUES (?, ?, ?, ?)",
+                (link_id, url, json.dumps(info), created),
+            )
+        self.links[link_id] = {"url": url, "created": created, **info}
+        self.by_url[canonicalize(url)] = link_id
+        return link_id
+
+    def get(self, link_id: str):
+        """Return the stored link, or None if unknown/expired"""
+        link = self.links.get(link_id)
+        if link is not None and link["created"] < self.clock() - self.ttl:
+            # expired since the last eviction
+            self._delete(link_id)
+            return None
+        return link
+
+    def pop(self, link_id: str):
+        """Remove and return the stored link, or None if unknown/expired"""
+        link = self.get(link_id)
+        if link is not None:
+            self._delete(link_id)
+        return link
+
+    def _delete(self, link_id: str):
+        link = self.links.pop(link_id)
+        key = canonicalize(link["url"])
+        # the url may have been shared again since, under a new id
+        if self.by_url.get(key) == link_id:
+            del self.by_url[key]
+        with self.db:
+            self.db.execute("DELETE FROM pending_links WHERE id = ?", (link_id,))
+
+    def evict_expired(self, force: bool = False) -> int:
+        """Drop links older than the TTL, at most once per EVICTION_INTERVAL"""
+        now = self.clock()
+        if not force and now - self._last_eviction < EVICTION_INTERVAL:
+            return 0
+        self._last_eviction = now
+        cutoff = now - self.ttl
+        expired = [k for k, link in self.links.items() if link["created"] < cutoff]
+        if expired:
+            for link_id in expired:
+                self.by_url.pop(canonicalize(self.links.pop(link_id)["url"]), None)
+            with self.db:
+                self.db.execute(
+                    "DELETE FROM pending_links WHERE created < ?", (cutoff,)
+                )
+            logging.info(f"Evicted {len(expired)} expired pending links")
+        return len(expired)
+
+    def close(self):
+        self.db.close()
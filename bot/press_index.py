@@ -0,0 +1,63 @@
+import json
+import logging
+import time
+from pathlib import Path
+
+from compact import MONTH_DIR, SHARDS_DIR, read_shard
+from urls import canonicalize
+
+
+def iter_press_urls(press_dir: Path):
+    """Yield (url, where it's stored) for every entry under selected_press/"""
+    # compacted months first, see compact.py
+    for shard in sorted((press_dir / SHARDS_DIR).glob("*.jsonl")):
+        for entry in read_shard(shard):
+            yield entry["data"]["url"], f"{shard}:{entry['id']}"
+    for path in press_dir.glob("*/*.json"):
+        if not MONTH_DIR.match(path.parent.name):
+            continue
+        try:
+            with open(path) as f:
+                url = json.load(f)["url"]
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Skipping unreadable press entry {path}: {e}")
+            continue
+        yield url, str(path)
+
+
+class PressIndex:
+    """
+    Canonical url -> where it was published, for every selected_press entry
+
+    Built once at startup by scanning src/bot_gen/selected_press/ and kept up
+    to date by `add()` on every approval, so spotting an already published
+    link is a dict lookup.
+    """
+
+    def __init__(self, press_dir: Path):
+        self.press_dir = Path(press_dir)
+        self.urls = {}
+        self.scan()
+
+    def __len__(self):
+        return len(self.urls)
+
+    def scan(self):
+        start = time.perf_counter()
+        for url, where in iter_press_urls(self.press_dir):
+            self.urls[canonicalize(url)] = where
+        logging.info(
+            f"Indexed {len(self.urls)} press urls "
+            f"in {(time.perf_counter() - start) * 1e3:.0f} ms"
+        )
+
+    def get(self, url: str):
+        """Where the url was published (path or note), None if it's new"""
+        return self.urls.get(canonicalize(url))
+
+    def add(self, url: str, where: str):
+        self.urls[canonicalize(url)] = where
+
+    def remove(self, url: str):
+        """Forget a deleted entry's url, so sharing it again works"""
+        self.urls.pop(canonicalize(url), None)
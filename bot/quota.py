@@ -0,0 +1,299 @@
+"""
+Pace calls to the Telegram Bot API and the GitHub API to their rate limits
+
+Every call takes a token from each bucket it counts against: Telegram's
+overall one plus one per chat (groups are stricter than private chats),
+GitHub's request budget plus, for anything but GET, its content-creation
+limit. A call without tokens waits in its lane instead of failing; lower
+lanes go first, so replies to users overtake admin notifications.
+
+Buckets also follow what the APIs say: GitHub's X-RateLimit-Remaining/Reset
+caps its bucket until the reset (spread evenly over what's left of the
+window), and a 429 (Telegram's retry_after, GitHub's Retry-After) pauses the
+bucket and the call is tried again.
+"""
+
+import asyncio
+import datetime
+import heapq
+import itertools
+import logging
+import time
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+# lanes, lower goes first
+REPLY = 0  # answers to something a user just did, the default
+NOTIFY = 1  # admin notifications and reports
+
+# bucket -> (calls per second, burst); Telegram asks for at most ~30 messages
+# a second overall, 1 a second per chat and 20 a minute per group, GitHub
+# allows 5000 requests an hour (the headers say how many are left) and about
+# 80 content-creating ones a minute
+LIMITS = {
+    "telegram": (30, 30),
+    "private_chat": (1, 3),
+    "group_chat": (20 / 60, 3),
+    "github": (5000 / 3600, 50),
+    "github_write": (80 / 60, 10),
+}
+# rate limited this many times in a row, the call fails after all
+MAX_RETRIES = 5
+# GitHub answered 403/429 without saying how long to wait
+DEFAULT_GITHUB_PAUSE = 60  # seconds
+# idle per-chat buckets are forgotten once there are this many
+MAX_CHAT_BUCKETS = 1000
+
+
+class TokenBucket:
+    """`rate` tokens a second up to `burst`, a call takes one"""
+
+    def __init__(self, rate: float, burst: float):
+        self.base_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        # from response headers: calls left until `reset` (monotonic)
+        self.remaining = None
+        self.reset = 0.0
+
+    def _rate(self, now: float) -> float:
+        if self.remaining is None or now >= self.reset:
+            return self.rate
+        # what's left of the budget, spread over what's left of the window
+        return min(self.rate, max(self.remaining, 0) / (self.reset - now))
+
+    def _refill(self, now: float):
+        rate = self._rate(now)
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until a call may go out, 0 = right away"""
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.remaining is not None:
+            if now >= self.reset:
+                self.remaining = None
+            elif self.remaining <= 0:
+                return self.reset - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self._rate(now)
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+        if self.remaining is not None:
+            self.remaining -= 1
+
+    def pause(self, seconds: float, now: float):
+        self.paused_until = max(self.paused_until, now + seconds)
+
+    def slow_down(self, now: float):
+        """Halve the rate (down to an eighth), for limits the API doesn't spell out"""
+        self._refill(now)
+        self.rate = max(self.rate / 2, self.base_rate / 8)
+
+    def recover(self):
+        """Back towards the configured rate, a little per successful call"""
+        self.rate = min(self.base_rate, self.rate + self.base_rate / 50)
+
+    def budget(self, remaining: int, reset_in: float, now: float):
+        """The API says `remaining` calls are left for the next `reset_in` seconds"""
+        self.remaining = remaining
+        self.reset = now + max(reset_in, 0)
+
+    def idle(self, now: float) -> bool:
+        return self.delay(now) == 0 and self.tokens >= self.burst
+
+
+class QuotaManager(BaseRateLimiter):
+    """
+    Token buckets per API and per chat, with priority lanes
+
+    Plugged into the Application as its rate limiter (every Bot API call
+    but getUpdates goes through `process_request()`; pass
+    `rate_limit_args=NOTIFY` to send something in the notification lane)
+    and handed to GitHubClient, which calls `acquire()` and
+    `github_response()`.
+
+    Calls that can go right away don't wait for anything; the others are
+    queued and a scheduler task, running only while there are any, lets
+    them out as their buckets refill.
+    """
+
+    def __init__(
+        self, limits: dict = LIMITS, max_retries: int = MAX_RETRIES, metrics=None
+    ):
+        self.limits = {**LIMITS, **limits}
+        self.max_retries = max_retries
+        self.metrics = metrics
+        self.buckets = {
+            key: TokenBucket(*self.limits[key])
+            for key in ("telegram", "github", "github_write")
+        }
+        # (lane, arrival, bucket keys, future)
+        self.waiters = []
+        self.arrivals = itertools.count()
+        self._wakeup = asyncio.Event()
+        self.task = None
+
+    def bucket(self, key: str) -> TokenBucket:
+        if key not in self.buckets:
+            # "chat:<id>", group and channel ids are negative
+            kind = "group_chat" if key.startswith("chat:-") else "private_chat"
+            self.buckets[key] = TokenBucket(*self.limits[kind])
+        return self.buckets[key]
+
+    def waiting(self, lane: int = None) -> int:
+        """Calls queued (in `lane`, or in any)"""
+        return sum(
+            1
+            for waiter in self.waiters
+            if not waiter[3].done() and lane in (None, waiter[0])
+        )
+
+    async def acquire(self, keys: tuple, lane: int = REPLY):
+        """Wait until a call counting against the `keys` buckets may go out"""
+        now = time.monotonic()
+        if not self.waiters and all(self.bucket(key).delay(now) == 0 for key in keys):
+            for key in keys:
+                self.bucket(key).take(now)
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (lane, next(self.arrivals), tuple(keys), future))
+        self._wakeup.set()
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+        await future
+
+    def pause(self, key: str, seconds: float, api: str):
+        """The API asked us to slow down: nothing counting against `key` for a while"""
+        logging.warning(f"{api} rate limit hit, pausing {key} for {seconds:.0f}s")
+        self.bucket(key).pause(seconds, time.monotonic())
+        if self.metrics is not None:
+            self.metrics.rate_limited.inc(api=api)
+        self._wakeup.set()
+
+    def _release(self, now: float):
+        """Let out what may go, lowest lane first, returns the next delay"""
+        next_delay, waiting = None, []
+        while self.waiters:
+            lane, arrival, keys, future = heapq.heappop(self.waiters)
+            if future.done():  # the caller gave up
+                continue
+            delay = max(self.bucket(key).delay(now) for key in keys)
+            if delay == 0:
+                for key in keys:
+                    self.bucket(key).take(now)
+                future.set_result(None)
+                continue
+            waiting.append((lane, arrival, keys, future))
+            next_delay = delay if next_delay is None else min(next_delay, delay)
+        self.waiters = waiting
+        heapq.heapify(self.waiters)
+        return next_delay
+
+    def _forget_idle(self, now: float):
+        if len(self.buckets) <= MAX_CHAT_BUCKETS:
+            return
+        busy = {key for waiter in self.waiters for key in waiter[2]}
+        for key in [k for k in self.buckets if k.startswith("chat:")]:
+            if key not in busy and self.buckets[key].idle(now):
+                del self.buckets[key]
+
+    async def _run(self):
+        try:
+            while self.waiters:
+                self._wakeup.clear()
+                delay = self._release(time.monotonic())
+                if not self.waiters:
+                    break
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+            self._forget_idle(time.monotonic())
+        finally:
+            self.task = None
+
+    # BaseRateLimiter, for the Application's bot
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        """Don't leave callers waiting for a scheduler that's gone"""
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        for waiter in self.waiters:
+            if not waiter[3].done():
+                waiter[3].set_result(None)
+        self.waiters = []
+
+    async def process_request(
+        self, callback, args, kwargs, endpoint, data, rate_limit_args
+    ):
+        lane = REPLY if rate_limit_args is None else rate_limit_args
+        keys = ("telegram",)
+        if data.get("chat_id") is not None:
+            keys += (f"chat:{data['chat_id']}",)
+        for attempt in range(1, self.max_retries + 1):
+            await self.acquire(keys, lane)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                retry_after = e.retry_after
+                if isinstance(retry_after, datetime.timedelta):
+                    retry_after = retry_after.total_seconds()
+                # a flood in one chat, or of the whole bot
+                self.pause(keys[-1], retry_after, "telegram")
+
+    # GitHubClient
+
+    @staticmethod
+    def github_keys(method: str) -> tuple:
+        if method.upper() == "GET":
+            return ("github",)
+        return ("github", "github_write")
+
+    def github_response(self, method: str, status: int, headers) -> bool:
+        """
+        Update the GitHub budget from a response's headers, True if it was
+        rate limited and should be tried again (acquire() waits as needed)
+        """
+        now = time.monotonic()
+        write = self.github_keys(method)[-1] == "github_write"
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset = headers.get("X-RateLimit-Reset")
+        if remaining is not None and reset is not None:
+            self.buckets["github"].budget(int(remaining), int(reset) - time.time(), now)
+        if status not in (403, 429):
+            if write and status < 400:
+                self.buckets["github_write"].recover()
+            return False
+        retry_after = headers.get("Retry-After")
+        if retry_after is not None:
+            # a secondary limit, whose numbers GitHub doesn't publish
+            key = "github_write" if write else "github"
+            self.buckets[key].slow_down(now)
+            self.pause(key, float(retry_after), "github")
+            return True
+        if remaining == "0":
+            # primary limit, the budget waits for the reset
+            if self.metrics is not None:
+                self.metrics.rate_limited.inc(api="github")
+            logging.warning("GitHub rate limit used up, waiting for the reset")
+            return True
+        if status == 429:
+            self.pause("github", DEFAULT_GITHUB_PAUSE, "github")
+            return True
+        return False  # a plain 403, e.g. missing permissions
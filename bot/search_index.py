@@ -0,0 +1,505 @@
+#!/usr/bin/env python3
+"""
+Build the site's full-text search index from src/bot_gen content
+
+Thoughts are searchable by content and author, selected press by title,
+description and url. The index is a directory of static JSON files the site
+fetches on demand (src/components/Search.astro):
+
+    manifest.json       format, doc count and the list of term shards
+    terms/<ab>.json     {term: [doc numbers, delta encoded]} for the terms
+                        starting with "ab"
+    docs/<n>.json       what a result shows, for docs n * DOCS_PER_CHUNK...
+
+Shards start out keyed by the first two letters of their terms. One that
+grows past MAX_SHARD_BYTES is split by one more letter ("ab" -> "abc",
+"abd", ...; terms no longer than the key stay), so common prefixes don't
+make for huge downloads. A term lives in the shard with the longest key
+that is a prefix of it. A query fetches the manifest, one shard per word
+(plus the shards below the last word's prefix, which is matched as a prefix
+while typing) and the doc chunks of its first hits.
+
+Runs are incremental. checkpoint.json records the git blob sha of every
+source file and the docs it produced, and only files that changed since the
+last run are read. The shas come from the git index (`git ls-files -s`), so a
+fresh checkout reads nothing; files that differ from the index, or every file
+outside a git checkout, are hashed. An entry that is unchanged keeps its doc (compact.py
+moving a month into a shard costs nothing), an edited or removed one is
+tombstoned: its slot in the doc chunk becomes null, which the client skips,
+instead of being dug out of every shard. Once more than REBUILD_RATIO of the
+docs are tombstones the index is rebuilt from scratch.
+
+    python search_index.py [--content-dir ../src/bot_gen] [--out ../public/search]
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import shutil
+import subprocess
+import time
+import unicodedata
+from collections import defaultdict
+from pathlib import Path
+
+from compact import COLLECTIONS, MONTH_DIR, SHARDS_DIR, atomic_write
+
+INDEX_VERSION = 1
+PREFIX_LENGTH = 2
+MAX_PREFIX_LENGTH = 5
+MAX_SHARD_BYTES = 64 * 1024
+DOCS_PER_CHUNK = 64
+SNIPPET_LENGTH = 160
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 32
+REBUILD_RATIO = 0.2
+MIN_PREFIX_QUERY = 3
+MANIFEST = "manifest.json"
+CHECKPOINT = "checkpoint.json"
+WORD = re.compile(r"[^\W_]+")
+URL_SCHEME = re.compile(r"^https?://(www\.)?")
+# searchable fields per collection
+FIELDS = {
+    "thoughts": ("content", "author"),
+    "selected_press": ("title", "description", "url"),
+}
+
+
+def normalize(text: str) -> str:
+    """Lowercase without accents, "Perché" and "perche" are the same word"""
+    text = text.lower()
+    if text.isascii():
+        return text
+    return "".join(
+        c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c)
+    )
+
+
+def tokenize(text: str) -> list:
+    return [
+        word
+        for word in WORD.findall(normalize(text))
+        if MIN_TERM_LENGTH <= len(word) <= MAX_TERM_LENGTH
+    ]
+
+
+def term_key(term: str) -> str:
+    """The longest shard key a term can have, anything but a-z0-9 as _"""
+    return "".join(
+        c if "a" <= c <= "z" or "0" <= c <= "9" else "_"
+        for c in term[:MAX_PREFIX_LENGTH]
+    )
+
+
+def find_shard(term: str, shards) -> str:
+    """Key of the shard holding (or that will hold) `term`"""
+    key = term_key(term)
+    for length in range(len(key), PREFIX_LENGTH, -1):
+        if key[:length] in shards:
+            return key[:length]
+    return key[:PREFIX_LENGTH]
+
+
+def entry_terms(collection: str, data: dict) -> set:
+    texts = [str(data.get(field) or "") for field in FIELDS[collection]]
+    if collection == "selected_press":
+        # https/www would be in every press entry, the host is what matters
+        texts[-1] = URL_SCHEME.sub("", texts[-1])
+    return set(tokenize(" ".join(texts)))
+
+
+def snippet(text) -> str:
+    if not text or len(text) <= SNIPPET_LENGTH:
+        return text
+    return text[: SNIPPET_LENGTH - 1].rstrip() + "…"
+
+
+def doc_record(collection: str, entry_id: str, data: dict) -> list:
+    """
+    [fingerprint, kind, datetime, title, text, url] as stored in a doc chunk
+
+    kind is "t" (thought) or "s" (selected press). The fingerprint tells
+    whether an entry is still the same when its file changes.
+    """
+    fingerprint = hashlib.sha1(
+        json.dumps([entry_id, data], sort_keys=True, ensure_ascii=False).encode()
+    ).hexdigest()[:12]
+    if collection == "thoughts":
+        title, text = data.get("author"), snippet(data.get("content"))
+    else:
+        title, text = data.get("title"), snippet(data.get("description"))
+    return [
+        fingerprint,
+        collection[0],
+        data.get("datetime"),
+        title,
+        text,
+        data.get("url"),
+    ]
+
+
+def append_postings(deltas: list, docs: list) -> list:
+    """Delta encoded postings with `docs` (all after its last doc) added"""
+    last = sum(deltas)
+    return deltas + [doc - previous for previous, doc in zip([last] + docs, docs)]
+
+
+def delta_decode(deltas: list) -> list:
+    docs, doc = [], 0
+    for delta in deltas:
+        doc += delta
+        docs.append(doc)
+    return docs
+
+
+def to_ranges(docs: list) -> list:
+    """[3, 4, 5, 9] -> [[3, 3], [9, 1]] (start, count)"""
+    ranges = []
+    for doc in sorted(docs):
+        if ranges and ranges[-1][0] + ranges[-1][1] == doc:
+            ranges[-1][1] += 1
+        else:
+            ranges.append([doc, 1])
+    return ranges
+
+
+def from_ranges(ranges: list) -> list:
+    return [doc for start, count in ranges for doc in range(start, start + count)]
+
+
+def source_files(content_dir: Path) -> dict:
+    """{path relative to content_dir: collection} of every content file"""
+    files = {}
+    for collection in COLLECTIONS:
+        collection_dir = content_dir / collection
+        for path in collection_dir.glob(f"{SHARDS_DIR}/*.jsonl"):
+            files[path.relative_to(content_dir).as_posix()] = collection
+        for path in collection_dir.glob("*/*.json"):
+            if MONTH_DIR.match(path.parent.name):
+                files[path.relative_to(content_dir).as_posix()] = collection
+    return files
+
+
+def parse_entries(raw: bytes, path: str, collection: str) -> list:
+    """[(entry id, data), ...], ids like the site's: thoughts/YYYY-MM/<stem>"""
+    if path.endswith(".jsonl"):
+        entries = (json.loads(line) for line in raw.decode().splitlines())
+        return [(f"{collection}/{e['id']}", e["data"]) for e in entries]
+    month, name = path.split("/")[-2:]
+    return [(f"{collection}/{month}/{name[: -len('.json')]}", json.loads(raw))]
+
+
+def blob_sha(raw: bytes) -> str:
+    """What git names a file with this content"""
+    return hashlib.sha1(b"blob %d\0" % len(raw) + raw).hexdigest()
+
+
+def index_shas(content_dir: Path) -> dict:
+    """{path relative to content_dir: blob sha} of the files git has staged as
+    they are in the work tree, {} outside a git checkout"""
+
+    def ls_files(*args) -> list:
+        result = subprocess.run(
+            ["git", "ls-files", "-z", *args, "--", "."],
+            cwd=content_dir,
+            capture_output=True,
+            check=True,
+        )
+        return [line for line in result.stdout.decode().split("\0") if line]
+
+    try:
+        staged = ls_files("--stage")
+        # modified since staged, or not staged at all
+        dirty = set(ls_files("--modified", "--others", "--exclude-standard"))
+    except (OSError, subprocess.CalledProcessError):
+        return {}
+    shas = {}
+    for line in staged:
+        meta, path = line.split("\t", 1)
+        if path not in dirty:
+            shas[path] = meta.split()[1]
+    return shas
+
+
+def read_json(path: Path, default):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+
+def write_json(path: Path, data):
+    atomic_write(path, json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+
+
+class SearchIndexBuilder:
+    """Brings the index in `out_dir` up to date with `content_dir`"""
+
+    def __init__(self, content_dir: Path, out_dir: Path):
+        self.content_dir = Path(content_dir)
+        self.out_dir = Path(out_dir)
+        self.manifest = read_json(self.out_dir / MANIFEST, None)
+        self.checkpoint = read_json(self.out_dir / CHECKPOINT, {"files": {}})
+        self.wipe = False
+        if not self.manifest or self.manifest["version"] != INDEX_VERSION:
+            self.reset()
+        self.chunks = {}  # chunk number -> doc records, loaded when touched
+
+    def reset(self):
+        """Forget the current index, the next save() writes a new one"""
+        self.manifest = {
+            "version": INDEX_VERSION,
+            "prefix_length": PREFIX_LENGTH,
+            "max_prefix_length": MAX_PREFIX_LENGTH,
+            "docs_per_chunk": DOCS_PER_CHUNK,
+            "docs": 0,
+            "deleted": 0,
+            "shards": [],
+        }
+        self.checkpoint = {"files": {}}
+        self.chunks = {}
+        self.wipe = True
+
+    def chunk(self, number: int) -> list:
+        if number not in self.chunks:
+            path = self.out_dir / "docs" / f"{number}.json"
+            self.chunks[number] = [] if self.wipe else read_json(path, [])
+        return self.chunks[number]
+
+    def get_doc(self, doc: int):
+        records = self.chunk(doc // DOCS_PER_CHUNK)
+        index = doc % DOCS_PER_CHUNK
+        return records[index] if index < len(records) else None
+
+    def set_doc(self, doc: int, record):
+        records = self.chunk(doc // DOCS_PER_CHUNK)
+        index = doc % DOCS_PER_CHUNK
+        if index == len(records):
+            records.append(record)
+        else:
+            records[index] = record
+
+    def changed_files(self) -> tuple:
+        """({path: (collection, raw, blob sha)} to index, [paths gone])"""
+        files = source_files(self.content_dir)
+        known_files = self.checkpoint["files"]
+        shas = index_shas(self.content_dir)
+        changed = {}
+        for path, collection in files.items():
+            known = known_files.get(path, {})
+            raw = None
+            sha = shas.get(path)
+            if sha is None:
+                raw = (self.content_dir / path).read_bytes()
+                sha = blob_sha(raw)
+            if known.get("blob") == sha:
+                continue
+            if raw is None:
+                raw = (self.content_dir / path).read_bytes()
+            changed[path] = (collection, raw, sha)
+        removed = [path for path in known_files if path not in files]
+        return changed, removed
+
+    def update(self, rebuild: bool = False) -> dict:
+        """Index what changed since the last run, returns what was done"""
+        if rebuild:
+            self.reset()
+        stats = {"files": 0, "indexed": 0, "kept": 0, "deleted": 0, "rebuilt": rebuild}
+        changed, removed = self.changed_files()
+        if not changed and not removed:
+            return stats
+        stats["files"] = len(changed) + len(removed)
+
+        # an identical entry in another file (or the same one) keeps its doc
+        reusable = defaultdict(list)
+        for path in [*changed, *removed]:
+            previous = self.checkpoint["files"].pop(path, None)
+            for doc in from_ranges(previous["docs"] if previous else []):
+                record = self.get_doc(doc)
+                if record is not None:
+                    reusable[record[0]].append(doc)
+
+        new = [
+            (entry_id, path, collection, data)
+            for path, (collection, raw, _) in changed.items()
+            for entry_id, data in parse_entries(raw, path, collection)
+        ]
+        # by month first, so a month's docs stay in a few ranges per file
+        new.sort(key=lambda n: (str(n[3].get("datetime", ""))[:7], n[2], n[0]))
+        postings = defaultdict(list)
+        file_docs = defaultdict(list)
+        for entry_id, path, collection, data in new:
+            record = doc_record(collection, entry_id, data)
+            if reusable.get(record[0]):
+                doc = reusable[record[0]].pop()
+                stats["kept"] += 1
+            else:
+                doc = self.manifest["docs"]
+                self.manifest["docs"] += 1
+                self.set_doc(doc, record)
+                for term in entry_terms(collection, data):
+                    postings[term].append(doc)
+                stats["indexed"] += 1
+            file_docs[path].append(doc)
+
+        for docs in reusable.values():
+            for doc in docs:
+                self.set_doc(doc, None)
+                stats["deleted"] += 1
+        self.manifest["deleted"] += stats["deleted"]
+        if (
+            not rebuild
+            and self.manifest["deleted"] > REBUILD_RATIO * self.manifest["docs"]
+        ):
+            return self.update(rebuild=True)
+
+        for path, (_, _, sha) in changed.items():
+            self.checkpoint["files"][path] = {
+                "blob": sha,
+                "docs": to_ranges(file_docs[path]),
+            }
+        self.save(postings)
+        return stats
+
+    def save(self, postings: dict):
+        if self.wipe:
+            shutil.rmtree(self.out_dir / "terms", ignore_errors=True)
+            shutil.rmtree(self.out_dir / "docs", ignore_errors=True)
+        shards = set(self.manifest["shards"])
+        by_shard = defaultdict(dict)
+        for term, docs in postings.items():
+            by_shard[find_shard(term, shards)][term] = docs
+        for key, terms in by_shard.items():
+            shard = self.read_shard(key, shards)
+            for term, docs in terms.items():
+                # new docs are numbered after every existing one
+                shard[term] = append_postings(shard.get(term, []), docs)
+            self.write_shard(key, shard, shards)
+        for number, records in self.chunks.items():
+            write_json(self.out_dir / "docs" / f"{number}.json", records)
+        # the manifest after the files it points to, it's what the site reads first
+        self.manifest["shards"] = sorted(shards)
+        write_json(self.out_dir / MANIFEST, self.manifest)
+        atomic_write(
+            self.out_dir / CHECKPOINT,
+            # one line per file, so a commit's diff shows which files changed
+            '{"files": {\n'
+            + ",\n".join(
+                f"{json.dumps(path)}: {json.dumps(record)}"
+                for path, record in sorted(self.checkpoint["files"].items())
+            )
+            + "\n}}\n",
+        )
+        self.wipe = False
+
+    def read_shard(self, key: str, shards: set) -> dict:
+        if key not in shards:
+            return {}
+        return read_json(self.out_dir / "terms" / f"{key}.json", {})
+
+    def write_shard(self, key: str, shard: dict, shards: set):
+        """Write a shard, split by one more letter if it got too big"""
+        text = json.dumps(dict(sorted(shard.items())), separators=(",", ":"))
+        if len(text) > MAX_SHARD_BYTES and len(key) < MAX_PREFIX_LENGTH:
+            children = defaultdict(dict)
+            for term in [term for term in shard if len(term) > len(key)]:
+                children[term_key(term)[: len(key) + 1]][term] = shard.pop(term)
+            for child, terms in children.items():
+                merged = self.read_shard(child, shards)
+                merged.update(terms)
+                self.write_shard(child, merged, shards)
+            if children:
+                text = json.dumps(dict(sorted(shard.items())), separators=(",", ":"))
+        atomic_write(self.out_dir / "terms" / f"{key}.json", text)
+        shards.add(key)
+
+
+class SearchIndexReader:
+    """
+    Query an index directory the way Search.astro does
+
+    Every word has to match, the last one as a prefix (if it has at least
+    MIN_PREFIX_QUERY letters, shorter ones would pull in whole groups of
+    shards). Hits come newest
+    (highest doc number) first. Files are read once and counted in
+    `bytes_loaded`, like what a browser downloads for a query.
+    """
+
+    def __init__(self, index_dir: Path):
+        self.index_dir = Path(index_dir)
+        self.files = {}
+        self.bytes_loaded = 0
+        self.manifest = self.load(MANIFEST)
+        self.shards = set(self.manifest["shards"])
+
+    def load(self, name: str):
+        if name not in self.files:
+            raw = (self.index_dir / name).read_bytes()
+            self.bytes_loaded += len(raw)
+            self.files[name] = json.loads(raw)
+        return self.files[name]
+
+    def postings(self, term: str, prefix: bool) -> set:
+        shards = self.shards
+        if not prefix:
+            key = find_shard(term, shards)
+            if key not in shards:
+                return set()
+            return set(delta_decode(self.load(f"terms/{key}.json").get(term, [])))
+        # the shards above the prefix and every one split off below it
+        key = term_key(term)
+        docs = set()
+        for shard in shards:
+            if not (key.startswith(shard) or shard.startswith(key)):
+                continue
+            for candidate, deltas in self.load(f"terms/{shard}.json").items():
+                if candidate.startswith(term):
+                    docs.update(delta_decode(deltas))
+        return docs
+
+    def search(self, query: str, limit: int = 20) -> list:
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        docs = None
+        for n, term in enumerate(terms):
+            last = n == len(terms) - 1
+            matches = self.postings(term, last and len(term) >= MIN_PREFIX_QUERY)
+            docs = matches if docs is None else docs & matches
+            if not docs:
+                return []
+
+        results = []
+        per_chunk = self.manifest["docs_per_chunk"]
+        for doc in sorted(docs, reverse=True):
+            record = self.load(f"docs/{doc // per_chunk}.json")[doc % per_chunk]
+            if record is not None:
+                results.append(record)
+                if len(results) == limit:
+                    break
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--content-dir", type=Path, default=Path("../src/bot_gen"))
+    parser.add_argument("--out", type=Path, default=Path("../public/search"))
+    parser.add_argument("--rebuild", action="store_true", help="start from scratch")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    builder = SearchIndexBuilder(args.content_dir, args.out)
+    stats = builder.update(rebuild=args.rebuild)
+    print(
+        f"{stats['files']} files changed: {stats['indexed']} docs indexed, "
+        f"{stats['kept']} kept, {stats['deleted']} deleted"
+        f"{' (rebuilt)' if stats['rebuilt'] else ''}, "
+        f"{builder.manifest['docs'] - builder.manifest['deleted']} searchable "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import asyncio
+import json
+import pickle
+import sqlite3
+from pathlib import Path
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_data (
+    user_id INTEGER PRIMARY KEY,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bot_data (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS conversations (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    state BLOB NOT NULL,
+    PRIMARY KEY (name, key)
+)
+"""
+
+
+class StatePersistence(BasePersistence):
+    """
+    PTB persistence in SQLite: user_data, bot_data and conversation states
+
+    One row per user, per bot_data key and per conversation, each value
+    pickled on its own. The Application hands over whatever it thinks may
+    have changed every `update_interval` seconds; rows whose pickle is the
+    same as what was last written are skipped, the rest is written in a
+    single transaction. So a restart keeps drafts, conversation states and
+    pending admin input, and a flush costs a few row writes instead of
+    rewriting one big pickle file.
+
+    chat_data and arbitrary callback_data aren't used by the bot and aren't
+    stored.
+    """
+
+    def __init__(self, path: Path, update_interval: float = 60):
+        super().__init__(
+            store_data=PersistenceInput(chat_data=False, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.path = Path(path)
+        self.db = sqlite3.connect(self.path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+        self.written = {}  # (table, key) -> last written pickle
+        self.rows_written = 0
+        self._commit_scheduled = False
+
+    def _write(self, table: str, key, sql: str, params: tuple, blob: bytes) -> bool:
+        """Stage an upsert unless the row already holds this value"""
+        if self.written.get((table, key)) == blob:
+            return False
+        self.db.execute(sql, params)
+        self.written[(table, key)] = blob
+        self.rows_written += 1
+        self._schedule_commit()
+        return True
+
+    def _delete(self, table: str, key, sql: str, params: tuple):
+        if self.written.pop((table, key), None) is None:
+            return
+        self.db.execute(sql, params)
+        self._schedule_commit()
+
+    def _schedule_commit(self):
+        # the Application runs all update_* calls of one round together,
+        # committing on the next loop iteration makes that one transaction
+        if not self._commit_scheduled:
+            self._commit_scheduled = True
+            asyncio.get_running_loop().call_soon(self._commit)
+
+    def _commit(self):
+        if self._commit_scheduled:
+            self._commit_scheduled = False
+            self.db.commit()
+
+    async def get_user_data(self) -> dict:
+        data = {}
+        for user_id, blob in self.db.execute("SELECT user_id, data FROM user_data"):
+            self.written[("user_data", user_id)] = blob
+            data[user_id] = pickle.loads(blob)
+        return data
+
+    async def get_bot_data(self) -> dict:
+        data = {}
+        for key, blob in self.db.execute("SELECT key, value FROM bot_data"):
+            self.written[("bot_data", key)] = blob
+            data[key] = pickle.loads(blob)
+        return data
+
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        conversations = {}
+        for key, blob in self.db.execute(
+            "SELECT key, state FROM conversations WHERE name = ?", (name,)
+        ):
+            self.written[("conversations", (name, key))] = blob
+            conversations[tuple(json.loads(key))] = pickle.loads(blob)
+        return conversations
+
+    async def update_user_data(self, user_id: int, data: dict):
+        blob = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+        self._write(
+            "user_data",
+            user_id,
+            "INSERT OR REPLACE INTO user_data (user_id, data) VALUES (?, ?)",
+            (user_id, blob),
+            blob,
+        )
+
+    async def update_bot_data(self, data: dict):
+        # handed over in full every round, so diff it per key
+        for key, value in data.items():
+            blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            self._write(
+                "bot_data",
+                key,
+                "INSERT OR REPLACE INTO bot_data (key, value) VALUES (?, ?)",
+                (key, blob),
+                blob,
+            )
+        removed = [
+            key
+            for table, key in self.written
+            if table == "bot_data" and key not in data
+        ]
+        for key in removed:
+            self._delete("bot_data", key, "DELETE FROM bot_data WHERE key = ?", (key,))
+
+    async def update_conversation(self, name: str, key: tuple, new_state):
+        db_key = json.dumps(key)
+        if new_state is None:
+            self._delete(
+                "conversations",
+                (name, db_key),
+                "DELETE FROM conversations WHERE name = ? AND key = ?",
+                (name, db_key),
+            )
+            return
+        blob = pickle.dumps(new_state, pickle.HIGHEST_PROTOCOL)
+        self._write(
+            "conversations",
+            (name, db_key),
+            "INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)",
+            (name, db_key, blob),
+            blob,
+        )
+
+    async def drop_user_data(self, user_id: int):
+        self._delete(
+            "user_data", user_id, "DELETE FROM user_data WHERE user_id = ?", (user_id,)
+        )
+
+    async def update_chat_data(self, chat_id: int, data: dict):
+        pass
+
+    async def drop_chat_data(self, chat_id: int):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def refresh_user_data(self, user_id: int, user_data: dict):
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict):
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict):
+        pass
+
+    async def flush(self):
+        """Called once on shutdown, after the last update round"""
+        self._commit_scheduled = False
+        self.db.commit()
+        self.db.close()
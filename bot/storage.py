@@ -0,0 +1,397 @@
+import abc
+import asyncio
+import base64
+import json
+import logging
+import re
+import uuid
+from pathlib import Path
+
+from bot_gen_writer import (
+    DELETE_ACTION,
+    EDIT_ACTION,
+    free_name,
+    git_blob_sha,
+    operation_changes,
+    operation_paths,
+    render_entry,
+)
+from compact import SHARDS_DIR, parse_shard
+from github_client import MAX_PAYLOAD_BYTES, GitHubClient
+from payload_codec import PayloadTooLarge, encode_entry, json_size
+from tracing import trace_trailers
+
+BATCH_EVENT = "add_batch"
+# request body of an add_batch dispatch before any entry
+BATCH_OVERHEAD = json_size(
+    {"event_type": BATCH_EVENT, "client_payload": {"entries": []}}
+)
+CONTENT_ROOT = "src/bot_gen"
+# same identity the old local bot used, limit_bot.yml checks its commits
+COMMIT_AUTHOR = {"name": "thoughts_bot", "email": "thoughts_bot@marzolo.com"}
+MAX_REF_RETRIES = 5
+
+
+class StorageError(Exception):
+    pass
+
+
+class StorageBackend(abc.ABC):
+    """
+    Where approved entries end up
+
+    `save(entries)` gets a list of {"action": "add_thought"/"add_press", ...}
+    dicts and returns True once they are safely on their way to the repo.
+    An entry's optional "media" lists files (relative to the content root,
+    staged locally by the bot) that have to be committed along with it.
+    """
+
+    # largest batch (serialized) a single save() should get
+    max_batch_bytes = MAX_PAYLOAD_BYTES
+
+    @abc.abstractmethod
+    async def save(self, entries: list) -> bool:
+        pass
+
+    def check(self, entry: dict):
+        """Raise PayloadTooLarge if `entry` could never be saved"""
+
+
+class DispatchBackend(StorageBackend):
+    """
+    Send entries as add_batch repository_dispatches, bot_gen.yml commits them
+
+    Entries are encoded to fit the payload limit (compressed, or split into
+    parts sent in separate dispatches, see payload_codec.py) and packed into
+    as few dispatches as possible. Media files don't fit in a dispatch
+    payload at all, so they are committed first through `media` (a
+    GitDataBackend), the entry follows with the dispatch.
+    """
+
+    def __init__(self, client: GitHubClient, media: "GitDataBackend" = None):
+        self.client = client
+        self.media = media
+
+    def encode(self, entry: dict) -> list:
+        return encode_entry(entry, self.max_batch_bytes - BATCH_OVERHEAD)
+
+    def check(self, entry: dict):
+        # the outbox adds a dispatch_id later on, count it already
+        self.encode({**entry, "dispatch_id": uuid.uuid4().hex})
+
+    def payloads(self, entries: list) -> list:
+        """The encoded entries, greedily packed into add_batch entry lists"""
+        payloads, current, size = [], [], BATCH_OVERHEAD
+        for entry in entries:
+            for piece in self.encode(entry):
+                # plus the ", " separator
+                piece_size = json_size(piece) + 2
+                if current and size + piece_size > self.max_batch_bytes:
+                    payloads.append(current)
+                    current, size = [], BATCH_OVERHEAD
+                current.append(piece)
+                size += piece_size
+        if current:
+            payloads.append(current)
+        return payloads
+
+    async def save(self, entries: list) -> bool:
+        try:
+            payloads = self.payloads(entries)
+        except PayloadTooLarge as e:
+            logging.error(f"Can't dispatch entries: {e}")
+            return False
+        if any(entry.get("media") for entry in entries):
+            if self.media is None or not await self.media.save_media(entries):
+                return False
+        # after a failure everything is sent again, the workflow skips repeats
+        for payload in payloads:
+            if not await self.client.dispatch(BATCH_EVENT, {"entries": payload}):
+                return False
+        return True
+
+
+class GitDataBackend(StorageBackend):
+    """
+    Commit entries straight to a branch through the Git Data API
+
+    One commit per batch: the files go into a new tree on top of the branch
+    head (blobs are created inline by the tree call), then the branch is
+    fast-forwarded. If someone else pushed in between, the ref update is
+    rejected and the whole thing is retried on the new head. No Actions
+    runner involved, so entries are live as soon as the site rebuilds.
+
+    Files are rendered exactly like bot_gen_writer.py does; an entry already
+    in its month (a repeated outbox delivery: same blob or name in the month
+    directory, or its dispatch_id in the month's shard) is skipped. Edits and
+    deletes read the files they touch at the head (or as this commit writes
+    them) and change them like the workflow would. Media files are read from
+    `media_root` and uploaded as blobs once, before the first attempt.
+    """
+
+    max_batch_bytes = 1024 * 1024
+
+    def __init__(
+        self, client: GitHubClient, branch: str = "main", media_root: Path = None
+    ):
+        self.client = client
+        self.branch = branch
+        self.media_root = Path(media_root) if media_root else None
+        self.repo_path = f"/repos/{client.repo}"
+
+    async def _api(self, method: str, path: str, expected=(200, 201), **kwargs):
+        status, data = await self.client.request(
+            method, f"{self.repo_path}{path}", **kwargs
+        )
+        if status not in expected:
+            raise StorageError(f"{method} {path} -> {status}: {data}")
+        return status, data
+
+    async def _list_dir(self, path: str, ref: str) -> dict:
+        """{file name: blob sha} of a directory at ref, empty if it doesn't exist"""
+        status, data = await self._api(
+            "GET", f"/contents/{path}", expected=(200, 404), params={"ref": ref}
+        )
+        if status == 404:
+            return {}
+        return {item["name"]: item["sha"] for item in data if item["type"] == "file"}
+
+    async def _read_file(self, path: str, ref: str):
+        """Text of a file at ref, None if it doesn't exist"""
+        status, data = await self._api(
+            "GET", f"/contents/{path}", expected=(200, 404), params={"ref": ref}
+        )
+        if status == 404:
+            return None
+        if data.get("encoding") != "base64":
+            # past the contents API's 1 MB, fetch the blob itself
+            _, data = await self._api("GET", f"/git/blobs/{data['sha']}")
+        return base64.b64decode(data["content"]).decode()
+
+    async def _read_shard(self, folder: str, ref: str) -> dict:
+        """{file name: entry data} of the month's shard, empty if not compacted"""
+        collection, month = folder.split("/")
+        text = await self._read_file(
+            f"{CONTENT_ROOT}/{collection}/{SHARDS_DIR}/{month}.jsonl", ref
+        )
+        return {
+            f"{entry['id'].split('/', 1)[1]}.json": entry["data"]
+            for entry in parse_shard(text or "")
+        }
+
+    @staticmethod
+    def _already_committed(stem: str, text: str, listing: dict, shard: dict) -> bool:
+        """Whether a previous delivery of this entry is in its month already"""
+        data = json.loads(text)
+        # compacted (see compact.py), the same content is the same entry
+        if git_blob_sha(text) in listing.values() or data in shard.values():
+            return True
+        dispatch_id = data.get("dispatch_id")
+        if dispatch_id is None:
+            return False
+        # edited since, so its content changed but not its id or name
+        if any(other.get("dispatch_id") == dispatch_id for other in shard.values()):
+            return True
+        return any(
+            name == f"{stem}.json"
+            or re.fullmatch(rf"{re.escape(stem)}-\d+\.json", name)
+            for name in listing
+        )
+
+    async def _operation_changes(
+        self, operations: list, head: str, texts: dict
+    ) -> dict:
+        """
+        {path: new text, None to delete} for edit_entry/delete_entry
+        operations, applied in order on top of `texts` (files this commit
+        writes already, by path relative to the content root) and the head
+        """
+        texts = dict(texts)
+
+        async def read(paths):
+            paths = sorted(set(paths) - texts.keys())
+            contents = await asyncio.gather(
+                *(self._read_file(f"{CONTENT_ROOT}/{path}", head) for path in paths)
+            )
+            texts.update(zip(paths, contents))
+
+        # the loose files, and shard + manifest only for compacted entries
+        targets = [operation_paths(op["target"]) for op in operations]
+        await read(loose for loose, _, _ in targets)
+        await read(
+            path
+            for loose, shard, manifest in targets
+            if texts[loose] is None
+            for path in (shard, manifest)
+        )
+        changed = {}
+        for op in operations:
+            changes = operation_changes(op, texts)
+            if not changes:
+                logging.info(f"{op['action']} of {op['target']}: gone or changed")
+            texts.update(changes)
+            changed.update(changes)
+        return changed
+
+    async def _upload_media(self, entries: list) -> dict:
+        """{media path: tree item} for every media file of the entries"""
+        paths = sorted({path for entry in entries for path in entry.get("media", ())})
+
+        async def upload(path: str):
+            content = base64.b64encode((self.media_root / path).read_bytes())
+            _, blob = await self._api(
+                "POST",
+                "/git/blobs",
+                json={"content": content.decode(), "encoding": "base64"},
+            )
+            return path, {
+                "path": f"{CONTENT_ROOT}/{path}",
+                "mode": "100644",
+                "type": "blob",
+                "sha": blob["sha"],
+            }
+
+        return dict(await asyncio.gather(*(upload(path) for path in paths)))
+
+    async def _entries_tree(self, entries: list, media: dict, head: str) -> list:
+        """Tree items for the entries (and their media) not committed yet"""
+        operations = [
+            entry
+            for entry in entries
+            if entry["action"] in (EDIT_ACTION, DELETE_ACTION)
+        ]
+        entries = [entry for entry in entries if entry not in operations]
+        rendered = []
+        for entry in entries:
+            entry = dict(entry)
+            rendered.append(
+                (render_entry(entry.pop("action"), entry), entry.get("media", ()))
+            )
+        folders = sorted({folder for (folder, _, _), _ in rendered})
+        listings, shards = await asyncio.gather(
+            asyncio.gather(
+                *(self._list_dir(f"{CONTENT_ROOT}/{f}", head) for f in folders)
+            ),
+            asyncio.gather(*(self._read_shard(folder, head) for folder in folders)),
+        )
+        listings = dict(zip(folders, listings))
+        shards = dict(zip(folders, shards))
+
+        # path relative to the content root -> tree item
+        tree = {}
+        for (folder, stem, text), entry_media in rendered:
+            listing, shard = listings[folder], shards[folder]
+            if self._already_committed(stem, text, listing, shard):
+                logging.info(f"{folder}/{stem} already committed, skipping")
+                continue
+            # don't clobber an entry that landed in the same second, like
+            # write_entry(), compacted ones included
+            name = free_name(stem, listing.keys() | shard.keys())
+            listing[name] = git_blob_sha(text)
+            tree[f"{folder}/{name}"] = {
+                "path": f"{CONTENT_ROOT}/{folder}/{name}",
+                "mode": "100644",
+                "type": "blob",
+                "content": text,
+            }
+            tree.update((path, media[path]) for path in entry_media)
+        if operations:
+            # against this tree, so an entry added in the same batch is found
+            written = {
+                path: item["content"]
+                for path, item in tree.items()
+                if "content" in item
+            }
+            changes = await self._operation_changes(operations, head, written)
+            for path, text in changes.items():
+                item = {
+                    "path": f"{CONTENT_ROOT}/{path}",
+                    "mode": "100644",
+                    "type": "blob",
+                }
+                if text is not None:
+                    tree[path] = item | {"content": text}
+                elif path in tree:
+                    # added and deleted again, the head never had it
+                    del tree[path]
+                else:
+                    tree[path] = item | {"sha": None}
+        return list(tree.values())
+
+    async def _commit(self, entries: list, media: dict, media_only: bool = False):
+        _, ref = await self._api("GET", f"/git/ref/heads/{self.branch}")
+        head = ref["object"]["sha"]
+        _, commit = await self._api("GET", f"/git/commits/{head}")
+
+        if media_only:
+            tree = list(media.values())
+        else:
+            tree = await self._entries_tree(entries, media, head)
+        if not tree:
+            return True
+
+        _, new_tree = await self._api(
+            "POST",
+            "/git/trees",
+            json={"base_tree": commit["tree"]["sha"], "tree": tree},
+        )
+        if new_tree["sha"] == commit["tree"]["sha"]:
+            # e.g. media a previous delivery already committed
+            return True
+        operations = [
+            entry
+            for entry in entries
+            if entry["action"] in (EDIT_ACTION, DELETE_ACTION)
+        ]
+        added = [item["path"] for item in tree if item["path"].endswith(".json")]
+        if media_only:
+            message = f"Bot: Add {len(tree)} media files"
+        elif len(operations) == 1 and len(entries) == 1:
+            verb = "Edit" if operations[0]["action"] == EDIT_ACTION else "Delete"
+            message = f"Bot: {verb} entry {operations[0]['target']}"
+        elif operations:
+            message = f"Bot: Add, edit or delete {len(entries)} entries"
+        elif len(added) == 1:
+            message = f"Bot: Add new entry {added[0]}"
+        else:
+            message = f"Bot: Add {len(added)} new entries"
+        # like bot_gen.yml, so tracing.py finds the commit (not on media
+        # committed ahead of a dispatch, the workflow's commit publishes)
+        if not media_only and (trailers := trace_trailers(entries)):
+            message = f"{message}\n\n{trailers}"
+        _, new_commit = await self._api(
+            "POST",
+            "/git/commits",
+            json={
+                "message": message,
+                "tree": new_tree["sha"],
+                "parents": [head],
+                "author": COMMIT_AUTHOR,
+            },
+        )
+        # 422 = not a fast-forward anymore, someone pushed meanwhile
+        status, _ = await self._api(
+            "PATCH",
+            f"/git/refs/heads/{self.branch}",
+            expected=(200, 422),
+            json={"sha": new_commit["sha"], "force": False},
+        )
+        return status == 200
+
+    async def _save(self, entries: list, media_only: bool) -> bool:
+        try:
+            media = await self._upload_media(entries)
+            for attempt in range(1, MAX_REF_RETRIES + 1):
+                if await self._commit(entries, media, media_only):
+                    return True
+                logging.info(f"{self.branch} moved, retrying commit ({attempt})")
+        except Exception as e:
+            logging.error(f"Error committing entries via Git Data API: {e}")
+        return False
+
+    async def save(self, entries: list) -> bool:
+        return await self._save(entries, media_only=False)
+
+    async def save_media(self, entries: list) -> bool:
+        """Commit only the entries' media files (for DispatchBackend)"""
+        return await self._save(entries, media_only=True)
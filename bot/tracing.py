@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+End-to-end traces: from a Telegram update to the commit that published it
+
+Every update gets a trace ID when its handler starts (see `track_handler`
+in metrics.py), kept in a context variable so whatever the handler queues in
+the outbox carries it along as "trace_id" in the dispatch payload. The bot
+records a span per stage it sees:
+
+  telegram   the message's date -> the handler starting (whole seconds,
+             Telegram's resolution; not for button presses)
+  handler    the handler (and handlers it calls, as child spans)
+  queue      queued in the outbox -> the delivery that got through
+  dispatch   that delivery: the batch window and the GitHub request(s);
+             failed attempts are recorded as dispatch_failed
+
+Spans are buffered and appended to a local file as OTLP/JSON, one
+ExportTraceServiceRequest per line, which an OpenTelemetry collector's
+otlpjsonfile receiver can ingest as is.
+
+What happens on GitHub is read back from the commits: bot_gen.yml (and the
+Git Data backend) add a "Trace-Id: <id>" trailer per trace in the commit
+message, the workflow also a "Run-Started:" one, so
+
+  actions_queue   dispatch accepted -> the workflow run starting
+  workflow        run start -> commit (checkout, writer, search index, push)
+
+Run from a checkout of the site (pulled) to print a breakdown per trace and
+percentiles per stage:
+
+    python tracing.py [--log traces.jsonl] [--repo ..] [--trace ID] [--last 20]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import contextvars
+import datetime
+import json
+import logging
+import os
+import secrets
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+SERVICE_NAME = "thoughts_bot"
+TRACE_TRAILER = "Trace-Id"
+RUN_STARTED_TRAILER = "Run-Started"
+# stages in the order they happen, for the breakdown
+STAGES = ("telegram", "handler", "queue", "dispatch", "actions_queue", "workflow")
+FLUSH_INTERVAL = 5  # seconds
+# the log is rotated to <name>.1 past this size
+MAX_LOG_BYTES = 10 * 1024 * 1024
+
+# (trace_id, span_id) of the handler running in this context
+current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def new_trace_id() -> str:
+    return secrets.token_hex(16)
+
+
+def new_span_id() -> str:
+    return secrets.token_hex(8)
+
+
+def current_trace_id():
+    """The trace of the update being handled, None outside of handlers"""
+    span = current_span.get()
+    return span[0] if span else None
+
+
+def trace_trailers(entries: list) -> str:
+    """Commit message trailers for the traces of `entries` (payload dicts)"""
+    trace_ids = dict.fromkeys(e["trace_id"] for e in entries if e.get("trace_id"))
+    return "\n".join(f"{TRACE_TRAILER}: {trace_id}" for trace_id in trace_ids)
+
+
+def attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class Tracer:
+    """
+    Collects spans and appends them to `path` in OTLP/JSON
+
+    `add()` only buffers, a background task writes every FLUSH_INTERVAL
+    seconds and `close()` writes the rest. A `path` of None turns tracing
+    off (IDs are still handed out, so payloads look the same).
+    """
+
+    def __init__(self, path, flush_interval: float = FLUSH_INTERVAL):
+        self.path = Path(path) if path else None
+        self.flush_interval = flush_interval
+        self.spans = []
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self.task = None
+
+    def add(
+        self,
+        name: str,
+        trace_id: str,
+        start: float,
+        end: float,
+        parent: str = None,
+        error: str = None,
+        span_id: str = None,
+        **attributes,
+    ) -> str:
+        """Record a span (times from time.time()), returns its span ID"""
+        span_id = span_id or new_span_id()
+        if self.path is None:
+            return span_id
+        span = {
+            "traceId": trace_id,
+            "spanId": span_id,
+            "name": name,
+            "kind": 1,
+            "startTimeUnixNano": str(int(start * 1e9)),
+            "endTimeUnixNano": str(int(end * 1e9)),
+            "attributes": [attribute(k, v) for k, v in attributes.items()],
+            "status": {"code": 2, "message": error} if error else {"code": 1},
+        }
+        if parent:
+            span["parentSpanId"] = parent
+        self.spans.append(span)
+        return span_id
+
+    @contextlib.contextmanager
+    def handler(self, name: str, update):
+        """
+        Span around a handler; the outermost one starts the update's trace
+        (and records how long Telegram took to deliver the message)
+        """
+        parent = current_span.get()
+        start = time.time()
+        if parent is None:
+            trace_id = new_trace_id()
+            message = getattr(update, "message", None) or getattr(
+                update, "edited_message", None
+            )
+            date = getattr(message, "date", None)
+            if isinstance(date, datetime.datetime):
+                self.add(
+                    "telegram",
+                    trace_id,
+                    min(date.timestamp(), start),
+                    start,
+                    update_id=update.update_id,
+                )
+        else:
+            trace_id = parent[0]
+        span_id = new_span_id()
+        token = current_span.set((trace_id, span_id))
+        error = None
+        try:
+            yield trace_id
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            current_span.reset(token)
+            self.add(
+                "handler",
+                trace_id,
+                start,
+                time.time(),
+                parent=parent[1] if parent else None,
+                error=error,
+                span_id=span_id,
+                handler=name,
+                update_id=getattr(update, "update_id", 0),
+            )
+
+    def flush(self):
+        if not self.spans or self.path is None:
+            return
+        spans, self.spans = self.spans, []
+        line = json.dumps(
+            {
+                "resourceSpans": [
+                    {
+                        "resource": {
+                            "attributes": [attribute("service.name", SERVICE_NAME)]
+                        },
+                        "scopeSpans": [{"scope": {"name": "bot"}, "spans": spans}],
+                    }
+                ]
+            }
+        )
+        try:
+            if self.path.exists() and self.path.stat().st_size > MAX_LOG_BYTES:
+                os.replace(self.path, f"{self.path}.1")
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            logging.error(f"Could not write {len(spans)} spans to {self.path}: {e}")
+
+    async def _run(self):
+        while not self._closing:
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.flush()
+
+    async def start(self):
+        if self.task is None and self.path is not None:
+            self.task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self.task is not None:
+            self._closing = True
+            self._wakeup.set()
+            await self.task
+            self.task = None
+        self.flush()
+
+
+def read_spans(path: Path) -> dict:
+    """{trace_id: [span, ...]} from a trace log and its rotated predecessor"""
+    traces = defaultdict(list)
+    for log in (Path(f"{path}.1"), Path(path)):
+        if not log.exists():
+            continue
+        with open(log) as f:
+            for line in f:
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    continue  # cut short by a crash
+                for resource in request["resourceSpans"]:
+                    for scope in resource["scopeSpans"]:
+                        for span in scope["spans"]:
+                            traces[span["traceId"]].append(span)
+    return traces
+
+
+def parse_time(value: str) -> float:
+    return datetime.datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def commit_spans(repo: Path, since: float) -> dict:
+    """
+    {trace_id: [span, ...]} for the GitHub side, from the commits since
+    `since` carrying Trace-Id trailers (and the dispatch time, filled in later)
+    """
+    output = subprocess.run(
+        [
+            "git",
+            "-C",
+            str(repo),
+            "log",
+            "--all",
+            f"--since=@{int(since)}",
+            "--format=%H%x1f%cI%x1f%B%x1e",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    traces = defaultdict(list)
+    for record in output.split("\x1e"):
+        if not record.strip():
+            continue
+        sha, committed, body = record.strip().split("\x1f", 2)
+        trailers = defaultdict(list)
+        for line in body.splitlines():
+            key, _, value = line.partition(": ")
+            trailers[key].append(value.strip())
+        for trace_id in trailers[TRACE_TRAILER]:
+            run = trailers[RUN_STARTED_TRAILER]
+            traces[trace_id].append(
+                {
+                    "commit": sha[:12],
+                    "committed": parse_time(committed),
+                    "run_started": parse_time(run[0]) if run else None,
+                }
+            )
+    return traces
+
+
+def span_times(span: dict) -> tuple:
+    return int(span["startTimeUnixNano"]) / 1e9, int(span["endTimeUnixNano"]) / 1e9
+
+
+def stages(spans: list, commits: list) -> dict:
+    """{stage: seconds} of a trace, plus "total" from first start to last end"""
+    durations = defaultdict(float)
+    bounds = []
+    dispatched = None
+    for span in spans:
+        start, end = span_times(span)
+        bounds += [start, end]
+        if span["name"] == "handler" and span.get("parentSpanId"):
+            continue  # inside its parent's time
+        if span["name"] in STAGES:
+            durations[span["name"]] += end - start
+        if span["name"] == "dispatch":
+            dispatched = max(dispatched or end, end)
+    # the first commit with this trace (repeated deliveries commit nothing)
+    for commit in sorted(commits, key=lambda c: c["committed"])[:1]:
+        bounds.append(commit["committed"])
+        if dispatched is not None and commit["run_started"] is not None:
+            durations["actions_queue"] = max(0, commit["run_started"] - dispatched)
+            durations["workflow"] = max(0, commit["committed"] - commit["run_started"])
+    if bounds:
+        durations["total"] = max(bounds) - min(bounds)
+    return durations
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(p / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def span_attribute(span: dict, key: str):
+    for item in span.get("attributes", []):
+        if item["key"] == key:
+            return next(iter(item["value"].values()))
+    return None
+
+
+def report(traces: dict, commits: dict, last: int, out=sys.stdout):
+    """Breakdown of the `last` most recent traces, then percentiles per stage"""
+    started = {
+        trace_id: min(span_times(span)[0] for span in spans)
+        for trace_id, spans in traces.items()
+    }
+    ordered = sorted(traces, key=started.get)
+    by_stage = defaultdict(list)
+    rows = []
+    for trace_id in ordered:
+        durations = stages(traces[trace_id], commits.get(trace_id, []))
+        for stage, seconds in durations.items():
+            by_stage[stage].append(seconds)
+        rows.append((trace_id, durations))
+
+    columns = STAGES + ("total",)
+    print(
+        f"{'trace':<16} {'handler':<22}" + "".join(f"{stage:>14}" for stage in columns),
+        file=out,
+    )
+    for trace_id, durations in rows[-last:] if last else rows:
+        handlers = [
+            span_attribute(span, "handler")
+            for span in traces[trace_id]
+            if span["name"] == "handler" and not span.get("parentSpanId")
+        ]
+        cells = "".join(
+            f"{durations[stage]:>13.2f}s" if stage in durations else f"{'-':>14}"
+            for stage in columns
+        )
+        commit = commits.get(trace_id)
+        print(
+            f"{trace_id[:16]:<16} {(handlers or ['-'])[0][:22]:<22}{cells}"
+            + (f"  {commit[0]['commit']}" if commit else ""),
+            file=out,
+        )
+
+    print(
+        f"\n{'stage':<14} {'traces':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}",
+        file=out,
+    )
+    for stage in columns:
+        values = by_stage.get(stage)
+        if not values:
+            continue
+        print(
+            f"{stage:<14} {len(values):>7}"
+            + "".join(f"{percentile(values, p):>8.2f}s" for p in (50, 95, 99, 100)),
+            file=out,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--log", default="traces.jsonl", help="the bot's trace log")
+    parser.add_argument(
+        "--repo", help="a pulled checkout of the site, for the GitHub stages"
+    )
+    parser.add_argument("--trace", help="only this trace (or trace ID prefix)")
+    parser.add_argument("--last", type=int, default=20, help="traces listed, 0 = all")
+    args = parser.parse_args()
+
+    traces = read_spans(Path(args.log))
+    if args.trace:
+        traces = {k: v for k, v in traces.items() if k.startswith(args.trace)}
+    if not traces:
+        sys.exit(f"No traces in {args.log}")
+    commits = {}
+    if args.repo:
+        since = min(span_times(span)[0] for spans in traces.values() for span in spans)
+        commits = commit_spans(Path(args.repo), since - 3600)
+    report(traces, commits, args.last)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import asyncio
+import logging
+from collections import deque
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+def lane_key(update: object):
+    """Updates with the same key are processed in order, None means any order"""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return update.effective_user.id
+    return None
+
+
+class ChatLaneProcessor(BaseUpdateProcessor):
+    """
+    Process updates concurrently, but one at a time per chat
+
+    A slow GitHub call or admin notification in one chat no longer holds up
+    every other chat. Within a chat (and so within every ConversationHandler
+    conversation, which are keyed by chat and user) updates still run in the
+    order they arrived: an update for a chat that is busy is parked in that
+    chat's lane and run by the task already working on it, right after.
+
+    Parking releases the concurrency slot immediately, so a flood in one chat
+    takes up a single slot instead of starving the others.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self.lanes = {}  # key -> deque of parked coroutines, present while busy
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    def __len__(self):
+        """Updates parked behind a busy chat"""
+        return sum(len(lane) for lane in self.lanes.values())
+
+    async def do_process_update(self, update: object, coroutine):
+        key = lane_key(update)
+        if key is None:
+            await coroutine
+            return
+        if key in self.lanes:
+            self.lanes[key].append(coroutine)
+            return
+
+        lane = self.lanes[key] = deque([coroutine])
+        self.idle.clear()
+        try:
+            while lane:
+                try:
+                    await lane.popleft()
+                except Exception as e:
+                    # Application.process_update reports handler errors itself
+                    logging.error(f"Update processing failed in chat {key}: {e}")
+        finally:
+            # only non-empty if we got cancelled
+            for parked in self.lanes.pop(key):
+                parked.close()
+            if not self.lanes:
+                self.idle.set()
+
+    async def join(self):
+        """Wait until every chat's parked updates have been processed"""
+        await self.idle.wait()
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
@@ -0,0 +1,48 @@
+from telegram import Message, MessageEntity
+from telegram.ext.filters import MessageFilter
+
+URL_ENTITIES = [MessageEntity.URL, MessageEntity.TEXT_LINK]
+SCHEMES = ("http://", "https://")
+
+
+def entity_urls(text: str, entities) -> list:
+    """Urls of the url/text_link entities, offsets are in UTF-16 code units"""
+    urls, encoded = [], None
+    for entity in entities:
+        if entity.type == MessageEntity.TEXT_LINK:
+            urls.append(entity.url)
+        elif entity.type == MessageEntity.URL:
+            if encoded is None:
+                encoded = text.encode("utf-16-le")
+            start = entity.offset * 2
+            urls.append(encoded[start : start + entity.length * 2].decode("utf-16-le"))
+    # bare domains ("example.com") get an entity too, only take real links
+    return [url for url in urls if url.lower().startswith(SCHEMES)]
+
+
+def extract_urls(message: Message) -> list:
+    """
+    Links in a message's text or caption, in order
+
+    Telegram already marks urls up as entities (`url` for a visible link,
+    `text_link` for a link behind other text), with offsets that handle
+    emoji and trailing punctuation properly, and forwarded messages keep
+    them, so the text itself is never scanned: a link Telegram didn't mark
+    up isn't one (HAS_URL doesn't let such messages through either).
+    """
+    if message.entities:
+        return entity_urls(message.text, message.entities)
+    return entity_urls(message.caption, message.caption_entities)
+
+
+class _HasUrl(MessageFilter):
+    __slots__ = ()
+
+    def filter(self, message: Message) -> bool:
+        entities = message.entities or message.caption_entities
+        return any(entity.type in URL_ENTITIES for entity in entities)
+
+
+# Messages (or captions) with a link entity. Only looks at the entity types,
+# so chatter without links never gets its text scanned.
+HAS_URL = _HasUrl(name="HAS_URL")
@@ -0,0 +1,128 @@
+import logging
+import os
+from pathlib import Path
+from urllib.parse import urlsplit
+
+# marks a trie node where rules end, value is the set of blocked path prefixes
+# ("" blocks the whole host)
+RULES = "$"
+
+
+def parse_rule(rule: str):
+    """'youtube.com/shorts/' -> (['com', 'youtube'], '/shorts/')"""
+    rule = rule.strip().lower()
+    if "://" in rule:
+        rule = rule.split("://", 1)[1]
+    host, _, path = rule.partition("/")
+    labels = [label for label in host.strip(".").split(".") if label]
+    return labels[::-1], f"/{path}" if path else ""
+
+
+def path_prefixes(path: str):
+    """Segment-aligned prefixes of a url path: '/a/b' -> '/', '/a', '/a/', '/a/b'"""
+    yield ""
+    for i, char in enumerate(path):
+        if char == "/":
+            if i:
+                yield path[:i]
+            yield path[: i + 1]
+    yield path
+
+
+class UrlRules:
+    """
+    Host-suffix + path-prefix matcher
+
+    A rule like `tiktok.com` blocks tiktok.com and all its subdomains (but
+    not notiktok.com or tiktok.com.example); `instagram.com/reels/` only
+    blocks paths under /reels/. Hosts are stored in a trie of reversed labels,
+    so matching a url costs one walk over its labels plus a set lookup per
+    path segment, whatever the number of rules.
+    """
+
+    def __init__(self, rules=()):
+        self.trie = {}
+        self.count = 0
+        for rule in rules:
+            self.add(rule)
+
+    def add(self, rule: str):
+        labels, path = parse_rule(rule)
+        if not labels:
+            raise ValueError(f"Invalid url rule: {rule!r}")
+        node = self.trie
+        for label in labels:
+            node = node.setdefault(label, {})
+        node.setdefault(RULES, set()).add(path)
+        self.count += 1
+
+    def matches(self, url: str) -> bool:
+        try:
+            parts = urlsplit(url)
+        except ValueError:
+            return False
+        host = (parts.hostname or "").rstrip(".")
+        if not host:
+            return False
+
+        node = self.trie
+        prefixes = None
+        for label in reversed(host.split(".")):
+            node = node.get(label)
+            if node is None:
+                return False
+            blocked = node.get(RULES)
+            if blocked:
+                if "" in blocked:
+                    return True
+                if prefixes is None:
+                    prefixes = set(path_prefixes(parts.path.lower() or "/"))
+                if not blocked.isdisjoint(prefixes):
+                    return True
+        return False
+
+
+def read_rules(path: Path) -> list:
+    """One rule per line, blank lines and # comments are ignored"""
+    with open(path) as f:
+        lines = (line.split("#", 1)[0].strip() for line in f)
+        return [line for line in lines if line]
+
+
+class UrlBlacklist:
+    """
+    UrlRules loaded from a file, reloaded whenever the file changes on disk
+
+    If the file doesn't exist, `default_rules` are used instead.
+    """
+
+    def __init__(self, path: Path, default_rules=()):
+        self.path = Path(path)
+        self.default_rules = list(default_rules)
+        self.rules = UrlRules(self.default_rules)
+        self._stamp = None
+        self.reloads = 0
+        self._reload_if_changed()
+
+    def _reload_if_changed(self):
+        try:
+            st = os.stat(self.path)
+            stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            stamp = None
+        if stamp == self._stamp:
+            return
+        self._stamp = stamp
+        try:
+            rules = read_rules(self.path) if stamp else self.default_rules
+            self.rules = UrlRules(rules)
+        except (OSError, ValueError) as e:
+            # keep the rules we had, a half-edited file shouldn't let everything in
+            logging.error(f"Failed to load url blacklist {self.path}: {e}")
+            return
+        self.reloads += 1
+        logging.info(f"Loaded {self.rules.count} url blacklist rules")
+
+    def is_blocked(self, url: str) -> bool:
+        self._reload_if_changed()
+        return self.rules.matches(url)
@@ -0,0 +1,112 @@
+import logging
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+
+# query parameters that only track where a click came from
+TRACKING_PARAMS = {
+    "fbclid",
+    "gclid",
+    "dclid",
+    "msclkid",
+    "igshid",
+    "igsh",
+    "mc_cid",
+    "mc_eid",
+    "ref_src",
+    "ref_url",
+    "si",
+    "_hsenc",
+    "_hsmi",
+    "mkt_tok",
+    "yclid",
+}
+TRACKING_PREFIXES = ("utm_",)
+
+# hosts that only redirect somewhere else
+SHORTENERS = {
+    "bit.ly",
+    "buff.ly",
+    "t.co",
+    "tinyurl.com",
+    "goo.gl",
+    "ow.ly",
+    "is.gd",
+    "lnkd.in",
+    "amzn.to",
+    "amzn.eu",
+    "shorturl.at",
+    "rb.gy",
+    "t.ly",
+    "cutt.ly",
+    "tiny.cc",
+    "dlvr.it",
+    "fb.me",
+    "spoti.fi",
+}
+MAX_REDIRECTS = 5
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def is_tracking_param(name: str) -> bool:
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def canonicalize(url: str) -> str:
+    """
+    Normalize a url so the same article shared twice gives the same string
+
+    Lowercases scheme and host, drops default ports, fragments, tracking
+    parameters and trailing slashes, and sorts the remaining query.
+    youtu.be links are rewritten to their youtube.com form.
+    """
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").rstrip(".")
+    path = parts.path
+    query = parse_qsl(parts.query, keep_blank_values=True)
+
+    if host == "youtu.be" and path.strip("/"):
+        host, query = "www.youtube.com", [("v", path.strip("/"))] + query
+        path = "/watch"
+
+    netloc = host if port in (None, DEFAULT_PORTS.get(scheme)) else f"{host}:{port}"
+    path = path.rstrip("/") or "/"
+    query = sorted((k, v) for k, v in query if not is_tracking_param(k))
+    return urlunsplit((scheme, netloc, path, urlencode(query), ""))
+
+
+def is_shortened(url: str) -> bool:
+    try:
+        host = (urlsplit(url).hostname or "").removeprefix("www.")
+    except ValueError:
+        return False
+    return host in SHORTENERS
+
+
+async def resolve_short_url(session, url: str) -> str:
+    """
+    Follow redirects of known url shorteners (HEAD only, no body download)
+
+    Returns the url unchanged if it isn't a shortener or can't be resolved.
+    """
+    if not is_shortened(url):
+        return url
+    target = url
+    try:
+        for _ in range(MAX_REDIRECTS):
+            async with session.head(target, allow_redirects=False) as response:
+                location = response.headers.get("Location")
+                if response.status not in (301, 302, 303, 307, 308) or not location:
+                    break
+                target = urljoin(target, location)
+            if not is_shortened(target):
+                break
+    except Exception as e:
+        logging.info(f"Could not resolve short url {url}: {e!r}")
+        return url
+    return target
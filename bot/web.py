@@ -0,0 +1,86 @@
+import hmac
+import json
+import logging
+import ssl
+
+from aiohttp import web
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebServer:
+    """
+    Small embedded HTTP(S) server
+
+    Always serves /healthz (the process is up) and /readyz (every registered
+    readiness check passes), plus /metrics once `add_metrics()` is called. In
+    webhook mode it also receives Telegram updates, see `add_webhook()`.
+    """
+
+    def __init__(self, host: str, port: int, certfile=None, keyfile=None):
+        self.host = host
+        self.port = port
+        self.ssl_context = None
+        if certfile:
+            self.ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            self.ssl_context.load_cert_chain(certfile, keyfile)
+        self.app = web.Application()
+        self.app.router.add_get("/healthz", self.health)
+        self.app.router.add_get("/readyz", self.ready)
+        self.readiness_checks = {}
+        self.runner = None
+
+    def add_readiness_check(self, name: str, check):
+        """`check()` returns True when that part of the bot is ready"""
+        self.readiness_checks[name] = check
+
+    def add_metrics(self, render):
+        """Serve `render()` (Prometheus text format) on GET /metrics"""
+
+        async def metrics(request: web.Request) -> web.Response:
+            return web.Response(
+                body=render().encode(),
+                headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+            )
+
+        self.app.router.add_get("/metrics", metrics)
+
+    def add_webhook(self, path: str, secret: str, on_update):
+        """Accept Telegram updates on POST `path`, awaiting `on_update(data)`"""
+
+        async def webhook(request: web.Request) -> web.Response:
+            token = request.headers.get(SECRET_HEADER, "")
+            if not hmac.compare_digest(token, secret):
+                logging.warning(f"Webhook call with bad secret from {request.remote}")
+                return web.Response(status=403)
+            try:
+                data = await request.json()
+            except json.JSONDecodeError:
+                return web.Response(status=400)
+            await on_update(data)
+            return web.Response()
+
+        self.app.router.add_post(path, webhook)
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.Response(text="ok")
+
+    async def ready(self, request: web.Request) -> web.Response:
+        checks = {name: bool(check()) for name, check in self.readiness_checks.items()}
+        return web.json_response(checks, status=200 if all(checks.values()) else 503)
+
+    async def start(self):
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(
+            self.runner, self.host, self.port, ssl_context=self.ssl_context
+        )
+        await site.start()
+        # port 0 picks a free one
+        self.port = self.runner.addresses[0][1]
+        logging.info(f"Web server listening on {self.host}:{self.port}")
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
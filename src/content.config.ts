@@ -2,27 +2,39 @@
 import { defineCollection, z } from 'astro:content';
 
 // 2. Import loader(s)
-import { glob } from 'astro/loaders';
+// bot_gen content is sharded by month, see bot/compact.py
+import { botGenLoader } from './loaders/botGen';
 
 // 3. Define your collection(s)
 const thoughts = defineCollection({
-    loader: glob({ pattern: "**/*.json", base: "./src/bot_gen/thoughts" }),
+    loader: botGenLoader("./src/bot_gen/thoughts/"),
     schema: z.object({
         author: z.string(),
         css_class: z.string(),
         datetime: z.string().datetime(),
         content: z.string(),
+        // photo variants committed next to the entry (bot/images.py),
+        // paths relative to src/bot_gen/
+        image: z.object({
+            webp: z.string(),
+            avif: z.string(),
+            thumb: z.string(),
+            width: z.number(),
+            height: z.number(),
+        }).optional(),
     })
 });
 
 const press = defineCollection({
-    loader: glob({ pattern: "**/*.json", base: "./src/bot_gen/selected_press" }),
+    loader: botGenLoader("./src/bot_gen/selected_press/"),
     schema: z.object({
         title: z.string(),
         url: z.string(),
         datetime: z.string().datetime(),
         // description is optional
         description: z.string().nullable(),
+        // og:image, fetched by the bot when available
+        image: z.string().nullable().optional(),
     })
 });
 
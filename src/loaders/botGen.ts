@@ -0,0 +1,81 @@
+import { readdir, readFile } from "node:fs/promises";
+import { join, relative } from "node:path";
+import { fileURLToPath } from "node:url";
+import type { Loader, LoaderContext } from "astro/loaders";
+
+const MONTH_DIR = /^\d{4}-\d{2}$/;
+const SHARDS_DIR = "_shards";
+
+type RawEntry = { data: Record<string, unknown>; filePath: string };
+
+// Compacted months: one `{"id", "data"}` JSON object per line in
+// _shards/YYYY-MM.jsonl (written by bot/compact.py)
+async function readShards(dir: string, entries: Map<string, RawEntry>) {
+  let names: string[];
+  try {
+    names = await readdir(join(dir, SHARDS_DIR));
+  } catch {
+    return;
+  }
+  for (const name of names.filter((n) => n.endsWith(".jsonl"))) {
+    const filePath = join(dir, SHARDS_DIR, name);
+    const lines = (await readFile(filePath, "utf-8")).split("\n");
+    for (const line of lines.filter((l) => l.trim())) {
+      const { id, data } = JSON.parse(line);
+      entries.set(id, { data, filePath });
+    }
+  }
+}
+
+// Current (and late) months: one file per entry in YYYY-MM/
+async function readLooseFiles(dir: string, entries: Map<string, RawEntry>) {
+  const months = (await readdir(dir, { withFileTypes: true })).filter(
+    (d) => d.isDirectory() && MONTH_DIR.test(d.name),
+  );
+  for (const month of months) {
+    const names = await readdir(join(dir, month.name));
+    for (const name of names.filter((n) => n.endsWith(".json"))) {
+      const filePath = join(dir, month.name, name);
+      const data = JSON.parse(await readFile(filePath, "utf-8"));
+      entries.set(`${month.name}/${name.slice(0, -".json".length)}`, { data, filePath });
+    }
+  }
+}
+
+async function sync(dir: string, context: LoaderContext) {
+  const { store, parseData, generateDigest, logger, config } = context;
+  const entries = new Map<string, RawEntry>();
+  await readShards(dir, entries);
+  await readLooseFiles(dir, entries);
+
+  const root = fileURLToPath(config.root);
+  store.clear();
+  for (const [id, { data, filePath }] of entries) {
+    const relPath = relative(root, filePath);
+    const parsed = await parseData({ id, data, filePath: relPath });
+    store.set({ id, data: parsed, digest: generateDigest(data), filePath: relPath });
+  }
+  logger.info(`Loaded ${entries.size} entries from ${relative(root, dir)}`);
+}
+
+/**
+ * Loads a bot_gen collection (see bot/compact.py): compacted months from
+ * `_shards/*.jsonl` plus loose `YYYY-MM/*.json` files, so a build parses a
+ * handful of shards instead of one file per entry.
+ */
+export function botGenLoader(base: string): Loader {
+  return {
+    name: "bot-gen-loader",
+    load: async (context) => {
+      const dir = fileURLToPath(new URL(base, context.config.root));
+      await sync(dir, context);
+
+      context.watcher?.add(dir);
+      context.watcher?.on("all", async (_event, changed) => {
+        if (changed.startsWith(dir)) {
+          await sync(dir, context);
+        }
+      });
+    },
+  };
+}